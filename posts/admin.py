@@ -1,37 +1,174 @@
 from django.contrib import admin
+from django.contrib.admin import helpers
+from django.contrib.admin.views.main import (
+    ERROR_FLAG, IGNORED_PARAMS, PAGE_VAR, SEARCH_VAR)
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils.html import format_html
 
-from .models import Comment, Follow, Group, Post
+from . import moderation
+from .models import Comment, Follow, Group, ModerationJob, Post
+from .paginators import EstimatedCountPaginator
+from .search import filter_posts
 
 
-class PostAdmin(admin.ModelAdmin):
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    Список для таблиц на миллионы строк: связанные объекты выбираются
+    JOIN (list_select_related), число строк без фильтров — из статистики
+    базы, второй полный COUNT(*) для «показать все» не делается, а
+    внешние ключи выбираются поиском, а не выпадающим списком всех строк.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    empty_value_display = "-пусто-"
+
+
+class ModeratedAdmin(ScalableAdmin):
+    """
+    Массовые действия модерации. Вместо стандартного удаления, которое
+    загружает и удаляет объекты по одному, ставится ModerationJob: он
+    выполняется пачками в фоне, прогресс виден в списке задач.
+    """
+    moderation_delete = None
+    actions = ("delete_in_background", "purge_authors")
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    def selection(self, request, queryset):
+        """
+        Что обработать задаче. Отмеченные на странице строки передаются
+        списком id; «выбрать все» — фильтрами и поиском списка, чтобы не
+        читать id всех подходящих строк в запросе админки.
+        """
+        if request.POST.get("select_across") != "1":
+            return {"ids": list(queryset.values_list("pk", flat=True))}
+        skip = (*IGNORED_PARAMS, PAGE_VAR, ERROR_FLAG)
+        return {
+            "filter": {key: value for key, value in request.GET.items()
+                       if key not in skip},
+            "search": request.GET.get(SEARCH_VAR, ""),
+        }
+
+    def queue_job(self, request, action, **params):
+        job = moderation.create_job(action, request.user, **params)
+        moderation.submit(job)
+        self.message_user(request, format_html(
+            'Задача <a href="{}">{}</a> поставлена в очередь.',
+            reverse("admin:posts_moderationjob_change", args=[job.pk]), job))
+        return job
+
+    def delete_in_background(self, request, queryset):
+        self.queue_job(request, self.moderation_delete,
+                       **self.selection(request, queryset))
+    delete_in_background.short_description = "Удалить выбранные в фоне"
+
+    def purge_authors(self, request, queryset):
+        for user_id in queryset.order_by().values_list(
+                "author_id", flat=True).distinct():
+            self.queue_job(request, ModerationJob.PURGE_USER,
+                           user_id=user_id)
+    purge_authors.short_description = "Удалить все записи их авторов"
+
+
+class PostAdmin(ModeratedAdmin):
     list_display = ("pk", "text", "pub_date", "author", "group")
+    list_select_related = ("author", "group")
     search_fields = ("text",)
-    list_filter = ("pub_date",)
-    empty_value_display = "-пусто-"
+    date_hierarchy = "pub_date"
+    autocomplete_fields = ("author", "group")
+    moderation_delete = ModerationJob.DELETE_POSTS
+    actions = ModeratedAdmin.actions + ("move_to_group",)
+
+    def move_to_group(self, request, queryset):
+        """Перенос в группу: сначала страница выбора группы."""
+        if "apply" in request.POST:
+            group_id = request.POST.get("group") or None
+            self.queue_job(request, ModerationJob.MOVE_POSTS,
+                           group_id=int(group_id) if group_id else None,
+                           **self.selection(request, queryset))
+            return None
+        return TemplateResponse(request, "admin/posts/move_to_group.html", {
+            **self.admin_site.each_context(request),
+            "title": "Перенос постов в группу",
+            "opts": self.model._meta,
+            "count": queryset.count(),
+            "selected": request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            "groups": Group.objects.order_by("title"),
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+            "select_across": request.POST.get("select_across", "0"),
+        })
+    move_to_group.short_description = "Перенести выбранные в группу"
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по тексту идет через полнотекстовый индекс, без LIKE."""
+        if not search_term:
+            return queryset, False
+        return filter_posts(queryset, search_term), False
 
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("pk", "title", "description", "slug")
-    search_files = ("description",)
+    search_fields = ("title", "slug")
     list_filter = ("title",)
     empty_value_display = "-пусто-"
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ModeratedAdmin):
     list_display = ("pk", "post", "text", "created", "author")
+    list_select_related = ("post", "author")
     search_fields = ("text",)
-    list_filter = ("post",)
-    empty_value_display = "-пусто-"
+    date_hierarchy = "created"
+    raw_id_fields = ("post",)
+    autocomplete_fields = ("author",)
+    moderation_delete = ModerationJob.DELETE_COMMENTS
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScalableAdmin):
     list_display = ("pk", "user", "author")
-    search_fields = ("user",)
-    list_filter = ("author",)
-    empty_value_display = "-пусто-"
+    list_select_related = ("user", "author")
+    # точное совпадение идет по уникальному индексу username
+    search_fields = ("=user__username", "=author__username")
+    autocomplete_fields = ("user", "author")
+
+
+class ModerationJobAdmin(admin.ModelAdmin):
+    """Задачи модерации только для просмотра: состояние и прогресс."""
+    list_display = ("pk", "action", "status", "progress", "created_by",
+                    "created", "finished")
+    list_select_related = ("created_by",)
+    list_filter = ("status", "action")
+    readonly_fields = ("action", "params", "status", "total", "done",
+                       "error", "created_by", "created", "finished")
+    actions = ("resume",)
+
+    def resume(self, request, queryset):
+        """
+        Упавшие задачи и задачи, прерванные перезапуском сервера, снова
+        ставятся в очередь; выполняющиеся сейчас пропускаются.
+        """
+        resumed = moderation.resume_jobs(queryset)
+        self.message_user(request, f"Поставлено в очередь задач: {resumed}")
+    resume.short_description = "Запустить невыполненные снова"
+
+    def progress(self, job):
+        if not job.total:
+            return "-"
+        return f"{job.done} / {job.total} ({job.done * 100 // job.total}%)"
+    progress.short_description = "Прогресс"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Post, PostAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(ModerationJob, ModerationJobAdmin)
@@ -0,0 +1,202 @@
+"""
+JSON API только для чтения: /api/v1/.
+
+Списки постов и комментариев листаются курсорами ?after=/?before=,
+как HTML-ленты, размер страницы — ?limit= (до MAX_LIMIT). Параметр
+?fields=id,text,... оставляет в ответе только перечисленные поля.
+Каждая страница — один запрос: авторы и группы выбираются JOIN,
+число комментариев — аннотацией, поэтому сериализация в базу не ходит.
+"""
+from functools import wraps
+
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+
+from yatube.settings import PAG_CONST
+
+from .models import Comment, Group, Post, User
+from .paginators import CursorPaginator
+from .timeline import Timeline, TimelinePaginator
+
+MAX_LIMIT = 100
+
+
+class ApiError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def api_view(view):
+    """GET-only view, ошибки которого отдаются JSON, а не HTML."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            if request.method not in ("GET", "HEAD"):
+                raise ApiError(405, "Метод не поддерживается.")
+            return view(request, *args, **kwargs)
+        except Http404:
+            error = ApiError(404, "Не найдено.")
+        except ApiError as api_error:
+            error = api_error
+        return JsonResponse({"detail": error.detail}, status=error.status,
+                            json_dumps_params={"ensure_ascii": False})
+    return wrapper
+
+
+def _image_url(image):
+    return image.url if image else None
+
+
+POST_FIELDS = {
+    "id": lambda post: post.pk,
+    "text": lambda post: post.text,
+    "pub_date": lambda post: post.pub_date.isoformat(),
+    "author": lambda post: post.author.username,
+    "group": lambda post: post.group.slug if post.group_id else None,
+    "image": lambda post: _image_url(post.image),
+    "thumbnail": lambda post: _image_url(post.thumbnail),
+    "comment_count": lambda post: post.comment_count,
+    "url": lambda post: reverse("posts:post", kwargs={
+        "username": post.author.username, "post_id": post.pk}),
+}
+
+COMMENT_FIELDS = {
+    "id": lambda comment: comment.pk,
+    "post": lambda comment: comment.post_id,
+    "author": lambda comment: comment.author.username,
+    "text": lambda comment: comment.text,
+    "created": lambda comment: comment.created.isoformat(),
+}
+
+GROUP_FIELDS = {
+    "id": lambda group: group.pk,
+    "slug": lambda group: group.slug,
+    "title": lambda group: group.title,
+    "description": lambda group: group.description,
+}
+
+PROFILE_FIELDS = {
+    "username": lambda user: user.username,
+    "first_name": lambda user: user.first_name,
+    "last_name": lambda user: user.last_name,
+    "posts_count": lambda user: user.stats.posts_count,
+    "followers_count": lambda user: user.stats.followers_count,
+    "following_count": lambda user: user.stats.following_count,
+}
+
+
+def selected_fields(request, fields):
+    """Поля из ?fields=, по умолчанию все. Неизвестное поле — ошибка 400."""
+    names = [name.strip() for name in request.GET.get("fields", "").split(",")
+             if name.strip()]
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise ApiError(400, "Неизвестные поля: " + ", ".join(unknown))
+    return {name: fields[name] for name in names or fields}
+
+
+def serialize(obj, fields):
+    return {name: getter(obj) for name, getter in fields.items()}
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get("limit", PAG_CONST))
+    except ValueError:
+        raise ApiError(400, "limit должен быть числом.")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _link(request, cursor_name, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params.pop("after", None)
+    params.pop("before", None)
+    params[cursor_name] = cursor
+    return f"{request.path}?{params.urlencode()}"
+
+
+def cursor_response(request, queryset, fields, key,
+                    paginator_class=CursorPaginator):
+    """Страница queryset по курсору со ссылками на соседние страницы."""
+    fields = selected_fields(request, fields)
+    paginator = paginator_class(queryset, _limit(request), key=key)
+    page = paginator.get_page(after=request.GET.get("after"),
+                              before=request.GET.get("before"))
+    return JsonResponse({
+        "results": [serialize(obj, fields) for obj in page],
+        "next": _link(request, "after", page.next_cursor),
+        "previous": _link(request, "before", page.previous_cursor),
+    }, json_dumps_params={"ensure_ascii": False})
+
+
+def object_response(request, obj, fields):
+    return JsonResponse(serialize(obj, selected_fields(request, fields)),
+                        json_dumps_params={"ensure_ascii": False})
+
+
+def _object(queryset, **lookup):
+    try:
+        return queryset.get(**lookup)
+    except queryset.model.DoesNotExist:
+        raise Http404
+
+
+@api_view
+def posts(request):
+    """Все посты, от новых к старым; ?group=<slug>, ?author=<username>."""
+    queryset = Post.objects.for_feed()
+    if request.GET.get("group"):
+        queryset = queryset.filter(group__slug=request.GET["group"])
+    if request.GET.get("author"):
+        queryset = queryset.filter(author__username=request.GET["author"])
+    return cursor_response(request, queryset, POST_FIELDS, "pub_date")
+
+
+@api_view
+def post_detail(request, post_id):
+    return object_response(
+        request, _object(Post.objects.for_feed(), pk=post_id), POST_FIELDS)
+
+
+@api_view
+def post_comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        "author")
+    return cursor_response(request, comments, COMMENT_FIELDS, "created")
+
+
+@api_view
+def groups(request):
+    """Все группы: их немного, поэтому без постраничной разбивки."""
+    fields = selected_fields(request, GROUP_FIELDS)
+    return JsonResponse({
+        "results": [serialize(group, fields)
+                    for group in Group.objects.order_by("pk")],
+    }, json_dumps_params={"ensure_ascii": False})
+
+
+@api_view
+def group_detail(request, slug):
+    return object_response(request, _object(Group.objects, slug=slug),
+                           GROUP_FIELDS)
+
+
+@api_view
+def profile(request, username):
+    author = _object(User.objects.select_related("stats"), username=username)
+    return object_response(request, author, PROFILE_FIELDS)
+
+
+@api_view
+def follow(request):
+    """Лента подписок текущего пользователя (вход через сессию)."""
+    if not request.user.is_authenticated:
+        raise ApiError(401, "Нужно войти.")
+    return cursor_response(request, Timeline(request.user), POST_FIELDS,
+                           "pub_date", TimelinePaginator)
@@ -0,0 +1,317 @@
+"""
+Синтетические данные и нагрузка для замеров производительности.
+
+seed() пачками создает пользователей, группы, посты (часть с картинками),
+комментарии и граф подписок со степенным распределением популярности.
+run_load() гоняет views встроенным тестовым клиентом в несколько потоков
+и считает задержки, запросы в секунду и число запросов к базе;
+run_mixed() проверяет, не ждут ли чтения окончания записи.
+"""
+import os
+import random
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import OperationalError, connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import search
+from .caching import bump_feed_generation
+from .models import Comment, Follow, Group, Post, User
+from .thumbnails import card_thumbnail_name, render_thumbnails, \
+    thumbnail_targets
+from .transfer import explicit_dates, rebuild_derived
+
+PREFIX = "bench_"
+# адрес клиента не из INTERNAL_IPS, чтобы не включался debug_toolbar
+CLIENT_ADDR = "192.0.2.1"
+
+WORDS = ("котики погода город река лес музыка книга кино работа отпуск "
+         "утро вечер кофе чай дорога море горы друзья семья новости").split()
+
+
+def _text(rnd, words):
+    return " ".join(rnd.choice(WORDS) for _ in range(words))
+
+
+def _images(count):
+    """Несколько разных картинок; посты делят их между собой."""
+    names = []
+    for i in range(count):
+        buffer = BytesIO()
+        Image.new("RGB", (1200, 800),
+                  (40 * i % 256, 90 * i % 256, 150)).save(buffer, "JPEG")
+        name = f"posts/{PREFIX}{i}.jpg"
+        if not default_storage.exists(name):
+            default_storage.save(name, buffer)
+        render_thumbnails(default_storage.path(name),
+                          thumbnail_targets(name),
+                          settings.THUMBNAIL_QUALITY)
+        names.append(name)
+    return names
+
+
+def seed(users=1000, groups=20, posts=20000, comments=50000,
+         follows_per_user=20, image_ratio=0.3, images=5, zipf=1.2,
+         batch_size=2000, seed_value=0):
+    """Создает набор данных и пересобирает все производные структуры."""
+    rnd = random.Random(seed_value)
+    now = timezone.now()
+
+    User.objects.bulk_create(
+        [User(username=f"{PREFIX}{i}") for i in range(users)])
+    user_ids = list(User.objects.filter(
+        username__startswith=PREFIX).values_list("pk", flat=True))
+
+    Group.objects.bulk_create(
+        [Group(title=f"Группа {i}", slug=f"{PREFIX}{i}",
+               description=_text(rnd, 10)) for i in range(groups)])
+    group_ids = list(Group.objects.filter(
+        slug__startswith=PREFIX).values_list("pk", flat=True))
+
+    # популярность авторов и подписок распределена по Ципфу
+    weights = [1 / (rank + 1) ** zipf for rank in range(len(user_ids))]
+    image_names = _images(images) if images else []
+
+    with explicit_dates(Post, Comment):
+        for start in range(0, posts, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, posts)):
+                image = (rnd.choice(image_names)
+                         if image_names and rnd.random() < image_ratio
+                         else "")
+                batch.append(Post(
+                    text=_text(rnd, rnd.randint(5, 60)),
+                    author_id=rnd.choices(user_ids, weights)[0],
+                    group_id=(rnd.choice(group_ids)
+                              if rnd.random() < 0.7 else None),
+                    image=image,
+                    thumbnail=card_thumbnail_name(image) if image else "",
+                    pub_date=now - timedelta(minutes=posts - i),
+                ))
+            Post.objects.bulk_create(batch)
+
+        post_ids = list(Post.objects.filter(
+            author__username__startswith=PREFIX).values_list("pk", flat=True))
+        for start in range(0, comments, batch_size):
+            Comment.objects.bulk_create([
+                Comment(post_id=rnd.choice(post_ids),
+                        author_id=rnd.choice(user_ids),
+                        text=_text(rnd, rnd.randint(3, 20)),
+                        created=now - timedelta(seconds=comments - i))
+                for i in range(start, min(start + batch_size, comments))
+            ])
+
+    follows = []
+    for user_id in user_ids:
+        authors = set(rnd.choices(user_ids, weights, k=follows_per_user))
+        authors.discard(user_id)
+        follows += [Follow(user_id=user_id, author_id=author_id)
+                    for author_id in authors]
+    Follow.objects.bulk_create(follows, ignore_conflicts=True)
+
+    rebuild_derived()
+    return {"users": users, "groups": groups, "posts": posts,
+            "comments": comments, "follows": len(follows)}
+
+
+def clear():
+    """Удаляет все данные, созданные seed()."""
+    Post.objects.filter(author__username__startswith=PREFIX).delete()
+    User.objects.filter(username__startswith=PREFIX).delete()
+    Group.objects.filter(slug__startswith=PREFIX).delete()
+    search.rebuild_index()
+    bump_feed_generation()
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1,
+                      round(percent / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class Target:
+    """Один вид запросов: как выбрать URL и нужен ли вход."""
+
+    def __init__(self, name, make_request, login=False):
+        self.name = name
+        self.make_request = make_request
+        self.login = login
+
+
+def targets(rnd):
+    users = list(User.objects.filter(username__startswith=PREFIX).order_by(
+        "-stats__followers_count").values_list("pk", "username")[:200])
+    groups = list(Group.objects.filter(
+        slug__startswith=PREFIX).values_list("slug", flat=True))
+    posts = list(Post.objects.filter(
+        author__username__startswith=PREFIX).order_by("?").values_list(
+        "pk", "author__username")[:500])
+
+    def get(url):
+        return lambda client: client.get(url, REMOTE_ADDR=CLIENT_ADDR)
+
+    def post_url(name):
+        pk, username = rnd.choice(posts)
+        return reverse(name, kwargs={"username": username, "post_id": pk})
+
+    return [
+        Target("index", lambda client: get(reverse("posts:index"))(client)),
+        Target("group_posts", lambda client: get(reverse(
+            "posts:group_posts", kwargs={"slug": rnd.choice(groups)}))(
+            client)),
+        Target("profile", lambda client: get(reverse(
+            "posts:profile", kwargs={"username": rnd.choice(users)[1]}))(
+            client)),
+        Target("post_view", lambda client: get(post_url("posts:post"))(
+            client)),
+        Target("follow_index", lambda client: get(
+            reverse("posts:follow_index"))(client), login=True),
+        Target("add_comment", lambda client: client.post(
+            post_url("posts:add_comment"), {"text": _text(rnd, 8)},
+            REMOTE_ADDR=CLIENT_ADDR), login=True),
+    ]
+
+
+def _client(target, login_ids):
+    """Клиент для одного потока; вход выполняется заранее, вне замера."""
+    client = Client()
+    if target.login:
+        client.force_login(User.objects.get(pk=random.choice(login_ids)))
+    return client
+
+
+def _drive(target, client, requests):
+    """Поток нагрузки: свой клиент, свое соединение с базой."""
+    queries = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    latencies, errors = [], 0
+    with connection.execute_wrapper(count):
+        for _ in range(requests):
+            start = time.perf_counter()
+            try:
+                response = target.make_request(client)
+                failed = response.status_code >= 400
+            except OperationalError:
+                # "database is locked": запись не дождалась busy_timeout
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+    connection.close()
+    return latencies, errors, queries
+
+
+def _login_ids():
+    return list(User.objects.filter(
+        username__startswith=PREFIX, follower__isnull=False).distinct(
+    ).values_list("pk", flat=True)[:200])
+
+
+def _summary(results, elapsed):
+    latencies = [value for result in results for value in result[0]]
+    done = len(latencies)
+    return {
+        "requests": done,
+        "errors": sum(result[1] for result in results),
+        "rps": round(done / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "queries_per_request": round(
+            sum(result[2] for result in results) / done, 2),
+    }
+
+
+def run_load(requests=200, concurrency=4, only=None, seed_value=0):
+    """Гоняет каждый view и возвращает отчет по задержкам и запросам."""
+    login_ids = _login_ids()
+    report = {}
+    for target in targets(random.Random(seed_value)):
+        if only and target.name not in only:
+            continue
+        per_thread = max(1, requests // concurrency)
+        clients = [_client(target, login_ids) for _ in range(concurrency)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(
+                lambda client: _drive(target, client, per_thread), clients))
+        report[target.name] = _summary(results,
+                                       time.perf_counter() - started)
+    return report
+
+
+def run_mixed(requests=200, readers=4, writers=2, seed_value=0):
+    """
+    Чтение страниц постов сначала без записи, потом одновременно с
+    добавлением комментариев. Если запись блокирует чтение (журнал
+    отката), задержки чтения во второй фазе растут, а у записи
+    появляются ошибки "database is locked"; с WAL они почти не меняются.
+    """
+    by_name = {target.name: target
+               for target in targets(random.Random(seed_value))}
+    login_ids = _login_ids()
+    per_thread = max(1, requests // readers)
+    report = {}
+    for phase, writer_count in (("reads_only", 0),
+                                ("reads_with_writes", writers)):
+        reader, writer = by_name["post_view"], by_name["add_comment"]
+        read_clients = [_client(reader, login_ids) for _ in range(readers)]
+        write_clients = [_client(writer, login_ids)
+                         for _ in range(writer_count)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=readers + writer_count) as pool:
+            reads = [pool.submit(_drive, reader, client, per_thread)
+                     for client in read_clients]
+            writes = [pool.submit(_drive, writer, client, per_thread)
+                      for client in write_clients]
+        elapsed = time.perf_counter() - started
+        report[phase] = {
+            "reads": _summary([job.result() for job in reads], elapsed),
+            "writes": (_summary([job.result() for job in writes], elapsed)
+                       if writes else None),
+        }
+    return report
+
+
+def git_commit():
+    """Коммит, на котором сделан замер, чтобы сравнивать отчеты."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    database = {
+        "engine": connection.settings_dict["ENGINE"],
+        "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+    }
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            for pragma in ("journal_mode", "synchronous", "busy_timeout"):
+                cursor.execute(f"PRAGMA {pragma}")
+                database[pragma] = cursor.fetchone()[0]
+    return {
+        "commit": git_commit(),
+        "database": database,
+        "pid": os.getpid(),
+    }
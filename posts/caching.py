@@ -0,0 +1,131 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+FEED_GENERATION_KEY = "posts:feed_generation"
+SCOPE_MODIFIED_KEY = "posts:modified:"
+
+
+def get_feed_generation():
+    """Текущее поколение ленты. Меняется при любой записи в ленту."""
+    generation = cache.get(FEED_GENERATION_KEY)
+    if generation is None:
+        # стартуем со времени, чтобы после вытеснения ключа из кэша
+        # не совпасть со старым поколением
+        cache.add(FEED_GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(FEED_GENERATION_KEY)
+    return generation
+
+
+def bump_feed_generation():
+    """Делает устаревшими все закэшированные страницы ленты."""
+    try:
+        cache.incr(FEED_GENERATION_KEY)
+    except ValueError:
+        cache.set(FEED_GENERATION_KEY, time.time_ns(), None)
+
+
+def feed_cache_key(feed, position, *parts):
+    """
+    Ключ страницы ленты feed в кэше: поколение ленты, parts (например,
+    чья это лента подписок) и разобранная позиция из page_position(), а
+    не сырые параметры запроса: у одной страницы одна копия в кэше.
+    Зрителя в ключе нет: кнопки в посте рисуются при каждом запросе.
+    """
+    kind, value = position
+    if kind != "page":
+        value = f"{value[0].isoformat()}|{value[1]}"
+    return ":".join(str(part) for part in (
+        "posts:feed_page", feed, get_feed_generation(), *parts, kind, value))
+
+
+def forget_author_cards(*user_ids):
+    """Боковая карточка автора в профиле и на странице поста устарела."""
+    cache.delete_many([make_template_fragment_key("author_card", [user_id])
+                       for user_id in user_ids])
+
+
+def post_scopes(post_id, author_id, group_id=None):
+    """Страницы, на которых виден пост: лента, профиль, группа и он сам."""
+    scopes = ["index", f"profile:{author_id}", f"post:{post_id}"]
+    if group_id:
+        scopes.append(f"group:{group_id}")
+    return scopes
+
+
+def scope_cache():
+    """Кэш меток изменения страниц: общий, если он настроен."""
+    return caches[settings.SCOPE_CACHE_ALIAS]
+
+
+def touch_scopes(*scopes):
+    """Запоминает время изменения страниц scopes."""
+    now = time.time_ns()
+    scope_cache().set_many(
+        {SCOPE_MODIFIED_KEY + scope: now for scope in scopes},
+        settings.SCOPE_CACHE_TIMEOUT)
+
+
+def scopes_modified(scopes):
+    """
+    Время последнего изменения страниц scopes в наносекундах. Если ключ
+    истек или вытеснен из кэша, страница считается измененной только что.
+    """
+    keys = [SCOPE_MODIFIED_KEY + scope for scope in scopes]
+    cache = scope_cache()
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            cache.add(key, now, settings.SCOPE_CACHE_TIMEOUT)
+        found.update(cache.get_many(missing))
+    return [found[key] for key in keys]
+
+
+def conditional_page(validators):
+    """
+    Условный GET: validators(request, **kwargs) дешево, без запроса самой
+    страницы, возвращает (scopes, дата последней записи на странице) или
+    None. ETag собирается из времени изменения scopes, этой даты, зрителя
+    и адреса, Last-Modified — позднейшее из времен. Если копия клиента
+    актуальна, view не вызывается и клиент получает 304; иначе view
+    видит версию содержимого в request.page_version.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            found = (validators(request, *args, **kwargs)
+                     if request.method in ("GET", "HEAD") else None)
+            if found is None:
+                return view(request, *args, **kwargs)
+            scopes, last_date = found
+            modified = scopes_modified(scopes)
+            timestamps = [value / 1e9 for value in modified]
+            if last_date is not None:
+                timestamps.append(last_date.timestamp())
+            last_modified = int(max(timestamps))
+            # версия содержимого страницы, общая для всех зрителей
+            request.page_version = ":".join(
+                str(part) for part in (*modified, last_date))
+            etag = quote_etag(hashlib.md5(":".join(str(part) for part in (
+                request.page_version, request.user.pk,
+                request.get_full_path(),
+            )).encode()).hexdigest())
+
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.setdefault("ETag", etag)
+                response.setdefault("Last-Modified", http_date(last_modified))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,133 @@
+"""
+RSS и Atom для общей ленты, групп и авторов.
+
+Посты выбираются так же, как на страницах index, group_posts и profile.
+Готовый XML хранится в кэше под версией из conditional_page, собранной
+только из scopes постов ленты: запись поста меняет версию его scope, и
+лента собирается заново, а подписки и рекомендации зрителя на нее не
+влияют.
+Неизменившуюся ленту читатель получает ответом 304.
+"""
+import hashlib
+
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+
+from yatube.settings import FEED_CACHE_TIMEOUT, SYNDICATION_ITEMS
+
+from .caching import conditional_page
+from .models import Group, Post, User
+from .views import group_posts_validators, index_posts_validators, \
+    profile_posts_validators
+
+
+class PostsFeed(Feed):
+    """Общая часть лент: посты от новых к старым."""
+
+    def posts(self, obj):
+        return Post.objects.all()
+
+    def items(self, obj):
+        return self.posts(obj).select_related("author", "group").order_by(
+            "-pub_date", "-id")[:SYNDICATION_ITEMS]
+
+    def item_title(self, item):
+        return Truncator(item.text).words(10)
+
+    def item_description(self, item):
+        return item.text
+
+    def item_link(self, item):
+        return reverse("posts:post", kwargs={
+            "username": item.author.username, "post_id": item.pk})
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_categories(self, item):
+        return [item.group.title] if item.group else []
+
+
+class IndexFeed(PostsFeed):
+    title = "Yatube: последние обновления"
+    description = "Новые записи всех авторов."
+
+    def link(self):
+        return reverse("posts:index")
+
+
+class GroupFeed(PostsFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def posts(self, group):
+        return group.posts.all()
+
+    def title(self, group):
+        return f"Yatube: {group.title}"
+
+    def description(self, group):
+        return group.description
+
+    def link(self, group):
+        return reverse("posts:group_posts", kwargs={"slug": group.slug})
+
+
+class AuthorFeed(PostsFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def posts(self, author):
+        return author.posts.all()
+
+    def title(self, author):
+        return f"Yatube: {author.get_full_name() or author.username}"
+
+    def description(self, author):
+        return f"Записи автора {author.username}."
+
+    def link(self, author):
+        return reverse("posts:profile", kwargs={"username": author.username})
+
+
+def atom(feed_class):
+    """Та же лента в формате Atom."""
+    return type(f"Atom{feed_class.__name__}", (feed_class,), {
+        "feed_type": Atom1Feed,
+        "subtitle": feed_class.description,
+    })
+
+
+def cached_feed(feed, validators):
+    """View ленты: XML из кэша по версии страницы и условный GET."""
+    @conditional_page(validators)
+    def view(request, **kwargs):
+        version = getattr(request, "page_version", None)
+        if version is None:
+            return feed(request, **kwargs)
+        key = "posts:feed:" + hashlib.md5(
+            f"{request.path}:{version}".encode()).hexdigest()
+        cached = cache.get(key)
+        if cached is None:
+            response = feed(request, **kwargs)
+            cached = (response.content, response["Content-Type"])
+            cache.set(key, cached, FEED_CACHE_TIMEOUT)
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+    return view
+
+
+index_rss = cached_feed(IndexFeed(), index_posts_validators)
+index_atom = cached_feed(atom(IndexFeed)(), index_posts_validators)
+group_rss = cached_feed(GroupFeed(), group_posts_validators)
+group_atom = cached_feed(atom(GroupFeed)(), group_posts_validators)
+author_rss = cached_feed(AuthorFeed(), profile_posts_validators)
+author_atom = cached_feed(atom(AuthorFeed)(), profile_posts_validators)
@@ -0,0 +1,104 @@
+"""
+Авторы, на которых подписан зритель.
+
+Страница со многими авторами проверяет подписку по множеству, а не
+запросом на каждого автора. id авторов читаются одним запросом и лежат
+в кэше упакованным отсортированным массивом, 8 байт на id; ключ
+удаляется после коммита подписки или отписки. Кэш может быть свой у
+каждого процесса, поэтому ключ живет недолго: другой процесс видит
+изменение не позже чем через FOLLOWING_CACHE_TIMEOUT. В пределах
+запроса множество загружается один раз и хранится на request.
+
+Кнопки подписки зависят от зрителя, поэтому страницы с ними добавляют
+к валидаторам ETag scope following_scope(зритель), который меняется
+при каждой его подписке и отписке.
+"""
+import bisect
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .caching import touch_scopes
+from .models import Follow
+
+FOLLOWING_KEY = "following:"
+# до стольких авторов проверка идет по frozenset, дальше — бинарным
+# поиском по массиву, чтобы не держать в памяти большое множество
+SET_LIMIT = 5000
+
+
+class FollowingSet:
+    """
+    Неизменяемое множество id авторов. В шаблоне:
+    {% if post.author_id in following %}; можно передать и самого автора.
+    """
+    __slots__ = ("ids", "lookup")
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.lookup = frozenset(ids) if len(ids) <= SET_LIMIT else None
+
+    def __contains__(self, author):
+        author_id = getattr(author, "pk", author)
+        if self.lookup is not None:
+            return author_id in self.lookup
+        index = bisect.bisect_left(self.ids, author_id)
+        return index < len(self.ids) and self.ids[index] == author_id
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+
+EMPTY = FollowingSet(array("q"))
+
+
+def following_scope(user_id):
+    return f"following:{user_id}"
+
+
+def viewer_scopes(request):
+    """Scopes ETag для страниц с кнопками подписки."""
+    if not request.user.is_authenticated:
+        return []
+    return [following_scope(request.user.pk)]
+
+
+def load_following(user_id):
+    """Авторы пользователя из кэша или одним запросом."""
+    key = FOLLOWING_KEY + str(user_id)
+    ids = array("q")
+    packed = cache.get(key)
+    if packed is not None:
+        ids.frombytes(packed)
+        return FollowingSet(ids)
+    ids.extend(Follow.objects.filter(user_id=user_id).order_by(
+        "author_id").values_list("author_id", flat=True))
+    cache.set(key, ids.tobytes(), settings.FOLLOWING_CACHE_TIMEOUT)
+    return FollowingSet(ids)
+
+
+def following_set(request):
+    """Авторы зрителя, один раз за запрос; у гостя — пустое множество."""
+    if not request.user.is_authenticated:
+        return EMPTY
+    if not hasattr(request, "_following"):
+        request._following = load_following(request.user.pk)
+    return request._following
+
+
+def forget_following(*user_ids):
+    """
+    Подписки пользователей изменились: после коммита удаляет множества
+    из кэша и меняет ETag страниц с кнопками подписки.
+    """
+    def forget():
+        cache.delete_many([FOLLOWING_KEY + str(user_id)
+                           for user_id in user_ids])
+        touch_scopes(*map(following_scope, user_ids))
+
+    transaction.on_commit(forget)
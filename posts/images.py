@@ -0,0 +1,112 @@
+"""
+Счетчики ссылок на файлы картинок и сборка мусора.
+
+Пост, получивший картинку, увеличивает счетчик ее файла в StoredImage,
+сменивший или удаленный — уменьшает. Файл, на который больше никто не
+ссылается, удаляется вместе с миниатюрами после коммита транзакции.
+collect_garbage() сверяет счетчики с постами и убирает файлы, о которых
+база не знает, например оставшиеся после сбоя.
+"""
+import os
+import time
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Post, StoredImage
+from .storage import image_storage
+from .thumbnails import thumbnail_targets
+
+# каталоги posts/, в которых лежат не картинки постов
+SKIP_DIRS = ("staging", "thumbs")
+
+
+def acquire(name):
+    """Пост стал ссылаться на файл name."""
+    if not name:
+        return
+    refs = StoredImage.objects.filter(name=name)
+    if not refs.update(refs=F("refs") + 1):
+        StoredImage.objects.get_or_create(name=name)
+        refs.update(refs=F("refs") + 1)
+
+
+def release(name, count=1):
+    """
+    count постов перестали ссылаться на файл name; ненужный файл
+    удаляется.
+    """
+    if not name:
+        return
+    StoredImage.objects.filter(name=name).update(
+        refs=Greatest(F("refs") - count, 0))
+    transaction.on_commit(lambda: delete_if_unused(name))
+
+
+def remove_files(name):
+    """Удаляет файл картинки и все ее миниатюры."""
+    image_storage.delete(name)
+    for path, size in thumbnail_targets(name):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def delete_if_unused(name):
+    """
+    Удаляет файл, если счетчик ссылок на него нулевой. Строка счетчика
+    удаляется и файл стирается в одной транзакции: одновременный
+    acquire() ждет ее коммита и создает строку заново. Поэтому тот, кто
+    сохраняет файл, сначала вызывает acquire(), а потом пишет файл:
+    иначе он может увидеть еще не стертый файл и не записать свой.
+    """
+    with transaction.atomic():
+        deleted, _ = StoredImage.objects.filter(name=name, refs=0).delete()
+        if deleted:
+            remove_files(name)
+    return bool(deleted)
+
+
+def _images():
+    return Post.objects.exclude(image="").exclude(image__isnull=True)
+
+
+def recount_images():
+    """Пересчитывает ссылки на все файлы одним UPDATE по таблице постов."""
+    StoredImage.objects.bulk_create(
+        [StoredImage(name=name) for name in _images().exclude(
+            image__in=StoredImage.objects.values("name")
+        ).order_by().values_list("image", flat=True).distinct()],
+        ignore_conflicts=True,
+    )
+    counts = Post.objects.filter(image=OuterRef("name")).order_by().values(
+        "image").annotate(count=Count("pk")).values("count")
+    return StoredImage.objects.update(refs=Coalesce(Subquery(counts), 0))
+
+
+def collect_garbage(min_age=3600):
+    """
+    Пересчитывает ссылки, удаляет файлы без ссылок, затем файлы в posts/,
+    которых нет в StoredImage. Файлы моложе min_age секунд не трогает:
+    их может прямо сейчас сохранять другой процесс.
+    Возвращает число удаленных файлов без ссылок и неизвестных файлов.
+    """
+    recount_images()
+    unused = sum(delete_if_unused(name) for name in list(
+        StoredImage.objects.filter(refs=0).values_list("name", flat=True)))
+
+    known = set(StoredImage.objects.values_list("name", flat=True))
+    root = image_storage.path("posts")
+    cutoff = time.time() - min_age
+    orphans = 0
+    for directory, dirs, files in os.walk(root):
+        if directory == root:
+            dirs[:] = [name for name in dirs if name not in SKIP_DIRS]
+        for filename in files:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, image_storage.location).replace(
+                os.sep, "/")
+            if name not in known and os.path.getmtime(path) < cutoff:
+                remove_files(name)
+                orphans += 1
+    return unused, orphans
@@ -0,0 +1,86 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ("Заполняет базу синтетическими данными и замеряет задержки, "
+            "запросы в секунду и число запросов к базе для основных "
+            "страниц. Отчет в JSON, чтобы сравнивать коммиты между собой.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=20000)
+        parser.add_argument("--comments", type=int, default=50000)
+        parser.add_argument("--follows-per-user", type=int, default=20)
+        parser.add_argument(
+            "--zipf", type=float, default=1.2,
+            help="Показатель степенного распределения популярности авторов.")
+        parser.add_argument(
+            "--image-ratio", type=float, default=0.3,
+            help="Доля постов с картинкой.")
+        parser.add_argument("--images", type=int, default=5,
+                            help="Сколько разных картинок создать.")
+        parser.add_argument("--requests", type=int, default=200,
+                            help="Запросов на каждую страницу.")
+        parser.add_argument("--concurrency", type=int, default=4,
+                            help="Число потоков нагрузки.")
+        parser.add_argument(
+            "--mixed", action="store_true",
+            help="Вместо замера страниц читать посты одновременно с "
+                 "записью комментариев (потоков чтения — --concurrency).")
+        parser.add_argument("--writers", type=int, default=2,
+                            help="Потоков записи для --mixed.")
+        parser.add_argument(
+            "--view", action="append", dest="views",
+            help="Замерить только эту страницу (можно несколько раз).")
+        parser.add_argument("--seed", type=int, default=0,
+                            help="Зерно генератора случайных чисел.")
+        parser.add_argument(
+            "--no-seed", action="store_true",
+            help="Не создавать данные, взять созданные прошлым запуском.")
+        parser.add_argument(
+            "--clear", action="store_true",
+            help="Удалить данные бенчмарка после замера.")
+        parser.add_argument("--output", help="Куда записать отчет JSON.")
+
+    def handle(self, *args, **options):
+        dataset = None
+        if not options["no_seed"]:
+            benchmark.clear()
+            dataset = benchmark.seed(
+                users=options["users"], groups=options["groups"],
+                posts=options["posts"], comments=options["comments"],
+                follows_per_user=options["follows_per_user"],
+                image_ratio=options["image_ratio"],
+                images=options["images"], zipf=options["zipf"],
+                seed_value=options["seed"])
+        report = {
+            "environment": benchmark.environment(),
+            "dataset": dataset,
+            "requests": options["requests"],
+            "concurrency": options["concurrency"],
+        }
+        if options["mixed"]:
+            report["writers"] = options["writers"]
+            report["mixed"] = benchmark.run_mixed(
+                requests=options["requests"],
+                readers=options["concurrency"], writers=options["writers"],
+                seed_value=options["seed"])
+        else:
+            report["views"] = benchmark.run_load(
+                requests=options["requests"],
+                concurrency=options["concurrency"], only=options["views"],
+                seed_value=options["seed"])
+        if options["clear"]:
+            benchmark.clear()
+
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                output.write(text + "\n")
+        else:
+            self.stdout.write(text)
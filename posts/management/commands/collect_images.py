@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.images import collect_garbage
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает ссылки постов на файлы картинок и удаляет "
+            "файлы, на которые никто не ссылается, вместе с миниатюрами.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age", type=int, default=3600,
+            help="Не трогать неизвестные файлы моложе стольких секунд.")
+
+    def handle(self, *args, **options):
+        unused, orphans = collect_garbage(options["min_age"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Удалено файлов без ссылок: {unused}, "
+            f"неизвестных файлов: {orphans}"))
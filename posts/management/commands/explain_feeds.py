@@ -0,0 +1,68 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from yatube.settings import COMMENTS_PAG_CONST, PAG_CONST
+
+from posts.models import Comment, Follow, Group, Post
+from posts.paginators import CursorPaginator
+from posts.timeline import Timeline
+
+# SQLite: "SCAN posts_post" без индекса; PostgreSQL: "Seq Scan on ..."
+FULL_SCAN = re.compile(r"\bSCAN (TABLE )?\w+(?! USING)\s*$|Seq Scan",
+                       re.MULTILINE)
+
+
+class Command(BaseCommand):
+    help = ("Выполняет EXPLAIN для запросов страниц со списками постов "
+            "и завершается с ошибкой, если какой-то из них читает "
+            "таблицу целиком.")
+
+    def feed_queries(self):
+        """Запросы страниц в том виде, в котором их строят views."""
+        user = User.objects.order_by("pk").first() or User(pk=0)
+        group = Group.objects.order_by("pk").first() or Group(pk=0)
+        post = Post.objects.order_by("pk").first() or Post(pk=0)
+        feeds = {
+            "index": Post.objects.all(),
+            "group_posts": group.posts.all(),
+            "profile": user.posts.all(),
+        }
+        for name, queryset in feeds.items():
+            queryset = queryset.order_by("-pub_date", "-id").for_feed()
+            yield name, queryset[:PAG_CONST]
+            paginator = CursorPaginator(queryset, PAG_CONST)
+            yield f"{name} (cursor)", paginator.older_than(
+                timezone.now(), 0)[:PAG_CONST + 1]
+        timeline = Timeline(user)
+        for queryset in timeline.key_querysets(PAG_CONST):
+            yield "follow_index", queryset
+        cursor = Timeline(user, older_than=(timezone.now(), 0))
+        for queryset in cursor.key_querysets(PAG_CONST + 1):
+            yield "follow_index (cursor)", queryset
+        comments = CursorPaginator(Comment.objects.filter(
+            post=post).select_related("author"), COMMENTS_PAG_CONST,
+            key="created")
+        yield "post_view comments", comments.object_list.order_by(
+            "-created", "-pk")[:COMMENTS_PAG_CONST + 1]
+        yield "post_view comments (cursor)", comments.older_than(
+            timezone.now(), 0)[:COMMENTS_PAG_CONST + 1]
+        yield "profile following", Follow.objects.filter(
+            user=user, author=user)
+        yield "fan-out followers", Follow.objects.filter(
+            author=user).values_list("user_id", flat=True)
+
+    def handle(self, *args, **options):
+        failed = []
+        for name, queryset in self.feed_queries():
+            plan = queryset.explain()
+            self.stdout.write(f"-- {name}\n{plan}\n")
+            if FULL_SCAN.search(plan):
+                failed.append(name)
+        if failed:
+            raise CommandError(
+                "Полное сканирование таблицы: " + ", ".join(failed))
+        self.stdout.write(self.style.SUCCESS(
+            "Все запросы лент используют индексы."))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from posts.transfer import export_posts
+
+
+class Command(BaseCommand):
+    help = ("Выгружает пользователей, группы, посты, комментарии и "
+            "подписки в NDJSON пачками, с контрольной точкой для "
+            "продолжения прерванной выгрузки.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл NDJSON.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--media-dir",
+            help="Скопировать сюда картинки постов.")
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Потоков копирования картинок.")
+        parser.add_argument(
+            "--resume", action="store_true",
+            help="Продолжить с контрольной точки <path>.checkpoint.")
+
+    def handle(self, *args, **options):
+        def progress(section, count):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{section}: {count}")
+
+        counts = export_posts(
+            options["path"], batch_size=options["batch_size"],
+            media_dir=options["media_dir"], workers=options["workers"],
+            resume=options["resume"], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            "Выгружено: " + ", ".join(
+                f"{section} {count}" for section, count in counts.items())))
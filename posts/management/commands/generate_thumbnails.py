@@ -0,0 +1,74 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.caching import bump_feed_generation
+from posts.models import Post
+from posts.thumbnails import (card_thumbnail_name, render_thumbnails,
+                              thumbnail_targets)
+
+
+class Command(BaseCommand):
+    help = ("Готовит миниатюры картинок постов в несколько процессов. "
+            "По умолчанию только для постов, у которых их еще нет.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=settings.THUMBNAIL_WORKERS or 1,
+            help="Число процессов.")
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Сколько картинок отдавать пулу за раз.")
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Пересоздать миниатюры всех постов.")
+
+    def render_batch(self, pool, batch):
+        """Режет пачку картинок в пуле и сохраняет готовые карточки."""
+        futures = {
+            pool.submit(render_thumbnails,
+                        default_storage.path(image_name),
+                        thumbnail_targets(image_name),
+                        settings.THUMBNAIL_QUALITY): (pk, image_name)
+            for pk, image_name in batch
+        }
+        done = failed = 0
+        for future in as_completed(futures):
+            pk, image_name = futures[future]
+            try:
+                future.result()
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f"{image_name}: {error}")
+                continue
+            Post.objects.filter(pk=pk, image=image_name).update(
+                thumbnail=card_thumbnail_name(image_name),
+                updated=timezone.now())
+            done += 1
+        return done, failed
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image="").exclude(image__isnull=True)
+        if not options["all"]:
+            posts = posts.filter(thumbnail="")
+        posts = posts.order_by("pk").values_list("pk", "image")
+
+        done = failed = 0
+        last_pk = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            while True:
+                batch = list(posts.filter(pk__gt=last_pk)[
+                    :options["batch_size"]])
+                if not batch:
+                    break
+                last_pk = batch[-1][0]
+                ok, errors = self.render_batch(pool, batch)
+                done, failed = done + ok, failed + errors
+
+        if done:
+            bump_feed_generation()
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово миниатюр: {done}, ошибок: {failed}"))
@@ -0,0 +1,44 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.transfer import import_posts
+
+
+class Command(BaseCommand):
+    help = ("Загружает NDJSON, выгруженный export_posts: построчно, "
+            "пачками bulk_create, каждая пачка в своей транзакции. "
+            "Потом пересобирает счетчики, ленты и поисковый индекс.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл NDJSON.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--media-dir",
+            help="Откуда скопировать картинки постов в MEDIA_ROOT.")
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Потоков копирования картинок.")
+        parser.add_argument(
+            "--no-thumbnails", action="store_true",
+            help="Не готовить миниатюры загруженных картинок.")
+
+    def handle(self, *args, **options):
+        def progress(section, count):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{section}: {count}")
+
+        try:
+            importer = import_posts(
+                options["path"], batch_size=options["batch_size"],
+                media_dir=options["media_dir"], workers=options["workers"],
+                progress=progress)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        if importer.with_images and not options["no_thumbnails"]:
+            call_command("generate_thumbnails", workers=options["workers"],
+                         stdout=self.stdout, stderr=self.stderr)
+        self.stdout.write(self.style.SUCCESS(
+            "Загружено: " + ", ".join(
+                f"{section} {count}"
+                for section, count in importer.counts.items())
+            + f"; пропущено: {importer.skipped}"
+            + f"; картинок скопировано: {importer.images}"))
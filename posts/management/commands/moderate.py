@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import moderation
+from posts.models import Group, ModerationJob, User
+
+
+class Command(BaseCommand):
+    help = ("Массовая модерация пачками: delete_posts, delete_comments, "
+            "move_posts или purge_user. Задача записывается в "
+            "ModerationJob и видна в админке. С --resume выполняет "
+            "задачи, упавшие или прерванные перезапуском сервера.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "action", nargs="?", choices=[action for action, title
+                                          in ModerationJob.ACTIONS])
+        parser.add_argument(
+            "--resume", action="store_true",
+            help="Выполнить задачи в очереди, упавшие и брошенные "
+                 "(без новых пачек дольше MODERATION_STALE_AFTER).")
+        parser.add_argument(
+            "--ids", type=int, nargs="+",
+            help="id постов или комментариев.")
+        parser.add_argument(
+            "--author",
+            help="username автора: все его посты или комментарии.")
+        parser.add_argument(
+            "--group",
+            help="slug группы, посты которой обрабатываются.")
+        parser.add_argument(
+            "--to",
+            help="slug группы для move_posts; без него посты остаются "
+                 "без группы.")
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.MODERATION_BATCH_SIZE,
+            help="Сколько объектов обрабатывать в одной транзакции.")
+
+    def _user_id(self, username):
+        user_id = User.objects.filter(username=username).values_list(
+            "pk", flat=True).first()
+        if user_id is None:
+            raise CommandError(f"Нет пользователя {username}")
+        return user_id
+
+    def _group_id(self, slug):
+        group_id = Group.objects.filter(slug=slug).values_list(
+            "pk", flat=True).first()
+        if group_id is None:
+            raise CommandError(f"Нет группы {slug}")
+        return group_id
+
+    def job_params(self, options):
+        action = options["action"]
+        if action == ModerationJob.PURGE_USER:
+            if not options["author"]:
+                raise CommandError("Для purge_user нужен --author")
+            return {"user_id": self._user_id(options["author"])}
+        params = {}
+        if action == ModerationJob.MOVE_POSTS:
+            params["group_id"] = (self._group_id(options["to"])
+                                  if options["to"] else None)
+        if options["ids"]:
+            params["ids"] = options["ids"]
+            return params
+        lookup = {}
+        if options["author"]:
+            lookup["author_id"] = self._user_id(options["author"])
+        if options["group"]:
+            if action == ModerationJob.DELETE_COMMENTS:
+                lookup["post__group_id"] = self._group_id(options["group"])
+            else:
+                lookup["group_id"] = self._group_id(options["group"])
+        if not lookup:
+            raise CommandError("Укажите --ids, --author или --group")
+        params["filter"] = lookup
+        return params
+
+    def run(self, job, batch_size):
+        def progress(done, total):
+            self.stdout.write(f"{job}: {done} / {total}")
+
+        done = moderation.run_job(job.pk, batch_size, progress)
+        if done is None:
+            self.stdout.write(f"{job}: уже выполняется")
+            return
+        self.stdout.write(self.style.SUCCESS(f"{job}: готово, {done}"))
+
+    def handle(self, *args, **options):
+        if options["resume"]:
+            for job in moderation.resumable_jobs().order_by("pk"):
+                if moderation.requeue(job.pk):
+                    self.run(job, options["batch_size"])
+            return
+        if not options["action"]:
+            raise CommandError("Укажите операцию или --resume")
+        job = moderation.create_job(options["action"],
+                                    **self.job_params(options))
+        self.run(job, options["batch_size"])
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.recommendations import rebuild
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает рекомендации авторов по графу подписок: "
+            "друзья друзей и совместные подписки. Запускается по "
+            "расписанию, страницы читают готовый результат.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Скольким пользователям заменять рекомендации в одной "
+                 "транзакции.")
+        parser.add_argument(
+            "--limit", type=int, default=settings.RECOMMENDATIONS_PER_USER,
+            help="Сколько рекомендаций хранить на пользователя.")
+
+    def handle(self, *args, **options):
+        def progress(done):
+            self.stdout.write(f"Пользователей: {done}")
+
+        done = rebuild(options["batch_size"], options["limit"], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Рекомендации пересчитаны для {done} пользователей"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts.stats import recount_stats
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает счетчики записей, подписчиков и подписок "
+            "всех пользователей, исправляя расхождения.")
+
+    def handle(self, *args, **options):
+        recounted = recount_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Пересчитана статистика пользователей: {recounted}"))
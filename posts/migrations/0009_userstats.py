@@ -0,0 +1,54 @@
+# Generated by Django 2.2.6 on 2026-10-18 06:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_stats(apps, schema_editor):
+    """Считает счетчики для уже существующих пользователей."""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    Follow = apps.get_model("posts", "Follow")
+    Post = apps.get_model("posts", "Post")
+    UserStats = apps.get_model("posts", "UserStats")
+
+    def count(model, field):
+        counts = model.objects.filter(**{field: OuterRef("user")}).order_by(
+        ).values(field).annotate(count=Count("pk")).values("count")
+        return Coalesce(Subquery(counts), 0)
+
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk)
+         for pk in User.objects.values_list("pk", flat=True)])
+    UserStats.objects.update(
+        posts_count=count(Post, "author"),
+        followers_count=count(Follow, "author"),
+        following_count=count(Follow, "user"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0008_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Записей')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписан')),
+            ],
+            options={
+                'verbose_name': 'Статистика пользователя',
+                'verbose_name_plural': 'Статистика пользователей',
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
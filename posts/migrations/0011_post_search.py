@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def create_search_table(apps, schema_editor):
+    """Таблица FTS5 для поиска; на других базах поиск идет без нее."""
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE posts_search USING fts5("
+        "text, post_id UNINDEXED, tokenize = 'unicode61')")
+    schema_editor.execute(
+        "INSERT INTO posts_search (rowid, text, post_id) "
+        "SELECT id * 2, text, id FROM posts_post")
+    schema_editor.execute(
+        "INSERT INTO posts_search (rowid, text, post_id) "
+        "SELECT id * 2 + 1, text, post_id FROM posts_comment")
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE posts_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 2.2.6 on 2026-10-18 06:43
+
+from django.db import migrations, models
+import posts.storage
+
+
+def count_refs(apps, schema_editor):
+    """Уже загруженные картинки получают счетчики ссылок."""
+    Post = apps.get_model('posts', 'Post')
+    StoredImage = apps.get_model('posts', 'StoredImage')
+    refs = Post.objects.exclude(image='').exclude(image__isnull=True).order_by(
+    ).values('image').annotate(refs=models.Count('pk')).values_list(
+        'image', 'refs')
+    StoredImage.objects.bulk_create(
+        [StoredImage(name=name, refs=count) for name, count in refs])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'Файлы картинок',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Изображение'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['image'], name='post_image'),
+        ),
+        migrations.RunPython(count_refs, migrations.RunPython.noop),
+    ]
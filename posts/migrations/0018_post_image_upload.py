@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-18 07:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_timeline_index_post'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_upload',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Загружаемое изображение'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-18 07:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_post_image_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='fanout_on_read',
+            field=models.BooleanField(default=False, verbose_name='Лента при чтении'),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models.functions import Coalesce
+
+from .storage import image_storage
 
 User = get_user_model()
 
@@ -23,6 +26,22 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для ленты: автор и группа одним JOIN, число комментариев."""
+        comments = Comment.objects.filter(
+            post=models.OuterRef("pk")
+        ).order_by().values("post").annotate(
+            count=models.Count("pk")
+        ).values("count")
+        return self.select_related("author", "group").annotate(
+            comment_count=Coalesce(
+                models.Subquery(comments, output_field=models.IntegerField()),
+                0,
+            )
+        )
+
+
 class Post(models.Model):
     text = models.TextField(
         "Текст",
@@ -54,15 +73,49 @@ class Post(models.Model):
 
     image = models.ImageField(
         upload_to="posts/",
+        storage=image_storage,
         blank=True,
         null=True,
         verbose_name="Изображение"
     )
 
+    thumbnail = models.ImageField(
+        upload_to="posts/thumbs/",
+        blank=True,
+        editable=False,
+        verbose_name="Миниатюра для ленты"
+    )
+
+    # загрузка из STAGING_DIR, которая ждет обработки; картинку записывает
+    # только она, так что поздно обработанная старая загрузка не
+    # перетирает новую
+    image_upload = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+        verbose_name="Загружаемое изображение",
+    )
+
+    updated = models.DateTimeField(
+        "Дата изменения",
+        auto_now=True,
+    )
+
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
         ordering = ("-pub_date",)
+        indexes = [
+            models.Index(fields=["pub_date"], name="post_pub_date"),
+            models.Index(fields=["author", "pub_date"],
+                         name="post_author_pub_date"),
+            models.Index(fields=["group", "pub_date"],
+                         name="post_group_pub_date"),
+            # поиск ссылок на файл картинки при пересчете счетчиков
+            models.Index(fields=["image"], name="post_image"),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -95,6 +148,12 @@ class Comment(models.Model):
         ordering = ("-created",)
         verbose_name = "Коментарий"
         verbose_name_plural = "Коментарии"
+        indexes = [
+            models.Index(fields=["post", "created"],
+                         name="comment_post_created"),
+            # date_hierarchy и сортировка списка в админке
+            models.Index(fields=["created"], name="comment_created"),
+        ]
 
 
 class Follow(models.Model):
@@ -113,3 +172,149 @@ class Follow(models.Model):
         verbose_name_plural = "Подписки"
         constraints = [models.UniqueConstraint(fields=['user', 'author'],
                                                name='unique_follow')]
+        indexes = [models.Index(fields=['author', 'user'],
+                                name='follow_author_user')]
+
+
+class TimelineEntry(models.Model):
+    """Запись в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline")
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries")
+
+    pub_date = models.DateTimeField("Дата публикации")
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи ленты"
+        constraints = [models.UniqueConstraint(fields=['user', 'post'],
+                                               name='unique_timeline_entry')]
+        indexes = [models.Index(fields=['user', '-pub_date', '-post'],
+                                name='timeline_user_pub_date_post')]
+
+
+class UserStats(models.Model):
+    """Счетчики профиля, которые обновляются вместе с постами и подписками."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats")
+
+    posts_count = models.PositiveIntegerField("Записей", default=0)
+
+    followers_count = models.PositiveIntegerField("Подписчиков", default=0)
+
+    following_count = models.PositiveIntegerField("Подписан", default=0)
+
+    # посты автора не раскладываются по лентам, а читаются на лету
+    # (posts.timeline); флаг хранится, чтобы при снятии заново
+    # собрать ленты его подписчиков
+    fanout_on_read = models.BooleanField("Лента при чтении", default=False)
+
+    class Meta:
+        verbose_name = "Статистика пользователя"
+        verbose_name_plural = "Статистика пользователей"
+
+
+class StoredImage(models.Model):
+    """Файл картинки в хранилище и число постов, которые на него ссылаются."""
+    name = models.CharField("Файл", max_length=255, unique=True)
+
+    refs = models.PositiveIntegerField("Ссылок", default=0)
+
+    class Meta:
+        verbose_name = "Файл картинки"
+        verbose_name_plural = "Файлы картинок"
+
+
+class ModerationJob(models.Model):
+    """Массовая операция модерации, которая выполняется пачками в фоне."""
+    DELETE_POSTS = "delete_posts"
+    DELETE_COMMENTS = "delete_comments"
+    MOVE_POSTS = "move_posts"
+    PURGE_USER = "purge_user"
+    ACTIONS = (
+        (DELETE_POSTS, "Удаление постов"),
+        (DELETE_COMMENTS, "Удаление комментариев"),
+        (MOVE_POSTS, "Перенос постов в группу"),
+        (PURGE_USER, "Удаление всех записей пользователя"),
+    )
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (PENDING, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (DONE, "Готово"),
+        (FAILED, "Ошибка"),
+    )
+
+    action = models.CharField("Операция", max_length=20, choices=ACTIONS)
+
+    params = models.TextField("Параметры", default="{}")
+
+    status = models.CharField("Состояние", max_length=10, choices=STATUSES,
+                              default=PENDING)
+
+    total = models.PositiveIntegerField("Всего", default=0)
+
+    done = models.PositiveIntegerField("Обработано", default=0)
+
+    error = models.TextField("Ошибка", blank=True)
+
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="moderation_jobs",
+        verbose_name="Запустил")
+
+    created = models.DateTimeField("Создана", auto_now_add=True)
+
+    finished = models.DateTimeField("Завершена", null=True, blank=True)
+
+    # обновляется после каждой пачки; по нему видно, что выполняющую
+    # задачу никто не ведет и ее можно запустить снова
+    heartbeat = models.DateTimeField("Последняя пачка", null=True,
+                                     blank=True)
+
+    class Meta:
+        verbose_name = "Задача модерации"
+        verbose_name_plural = "Задачи модерации"
+        ordering = ("-created",)
+
+    def __str__(self):
+        return f"#{self.pk} {self.get_action_display()}"
+
+
+class Recommendation(models.Model):
+    """Автор, на которого пользователю стоит подписаться. Считается заранее."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="recommendations")
+
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="recommended_to")
+
+    score = models.FloatField("Оценка")
+
+    class Meta:
+        verbose_name = "Рекомендация"
+        verbose_name_plural = "Рекомендации"
+        constraints = [models.UniqueConstraint(fields=['user', 'author'],
+                                               name='unique_recommendation')]
+        indexes = [models.Index(fields=['user', '-score'],
+                                name='recommendation_user_score')]
@@ -0,0 +1,283 @@
+"""
+Массовая модерация: удаление постов и комментариев, перенос постов в
+другую группу и удаление всех записей пользователя.
+
+Объекты не загружаются целиком и сигналы по каждому не посылаются:
+задача идет пачками по MODERATION_BATCH_SIZE id, каждая пачка — своя
+транзакция, в которой удаляются зависимые строки и поисковые документы
+и пересчитываются счетчики авторов и ссылки на картинки. После пачки
+сбрасываются кэши лент и страниц, а в ModerationJob пишется прогресс.
+Если задача упала или процесс с ней перезапустили, ее можно запустить
+снова (resume_jobs, moderate --resume): обработанные пачки уже удалены
+или перенесены. Задачу выполняет только тот, кто перевел ее из очереди
+в работу, поэтому две копии одной задачи не обрабатывают пачки вместе.
+"""
+import json
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.contrib.admin.utils import prepare_lookup_value
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import images, search
+from .caching import bump_feed_generation, post_scopes, touch_scopes
+from .models import Comment, ModerationJob, Post, TimelineEntry
+from .stats import change_stats
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _raw_delete(queryset):
+    """DELETE одним запросом, без сбора объектов и сигналов."""
+    queryset._raw_delete(queryset.db)
+
+
+def _touch(rows):
+    """rows — тройки (id поста, автор, группа), чьи страницы изменились."""
+    scopes = {scope for row in rows for scope in post_scopes(*row)}
+    bump_feed_generation()
+    touch_scopes(*scopes)
+
+
+def delete_posts(ids):
+    """Удаляет посты ids вместе с комментариями и записями лент."""
+    with transaction.atomic():
+        posts = list(Post.objects.filter(pk__in=ids).values_list(
+            "pk", "author_id", "group_id", "image"))
+        ids = [pk for pk, author_id, group_id, image in posts]
+        comment_ids = list(Comment.objects.filter(
+            post_id__in=ids).values_list("pk", flat=True))
+        search.remove_documents(
+            [search.post_rowid(pk) for pk in ids]
+            + [search.comment_rowid(pk) for pk in comment_ids])
+        _raw_delete(TimelineEntry.objects.filter(post_id__in=ids))
+        _raw_delete(Comment.objects.filter(post_id__in=ids))
+        _raw_delete(Post.objects.filter(pk__in=ids))
+        authors = Counter(author_id for pk, author_id, group_id, image
+                          in posts)
+        for author_id, count in authors.items():
+            change_stats(author_id, posts_count=-count)
+        for name, count in Counter(image for pk, author_id, group_id, image
+                                   in posts if image).items():
+            images.release(name, count)
+    _touch((pk, author_id, group_id)
+           for pk, author_id, group_id, image in posts)
+    return len(posts)
+
+
+def delete_comments(ids):
+    """Удаляет комментарии ids."""
+    with transaction.atomic():
+        comments = list(Comment.objects.filter(pk__in=ids).values_list(
+            "pk", "post_id"))
+        search.remove_documents(
+            [search.comment_rowid(pk) for pk, post_id in comments])
+        _raw_delete(Comment.objects.filter(pk__in=ids))
+    _touch(Post.objects.filter(
+        pk__in={post_id for pk, post_id in comments}).values_list(
+        "pk", "author_id", "group_id"))
+    return len(comments)
+
+
+def move_posts(ids, group_id):
+    """Переносит посты ids в группу group_id (None — без группы)."""
+    with transaction.atomic():
+        posts = list(Post.objects.filter(pk__in=ids).values_list(
+            "pk", "author_id", "group_id"))
+        Post.objects.filter(pk__in=ids).update(
+            group_id=group_id, updated=timezone.now())
+    # пост пропадает из старой группы и появляется в новой
+    _touch(posts + [(pk, author_id, group_id)
+                    for pk, author_id, previous in posts])
+    return len(posts)
+
+
+def _chunks(source, batch_size):
+    """
+    id пачками: source — список id или QuerySet, который читается по
+    первичному ключу от последней пачки, а не через OFFSET.
+    """
+    if isinstance(source, list):
+        source = sorted(source)
+        for start in range(0, len(source), batch_size):
+            yield source[start:start + batch_size]
+        return
+    last_pk = 0
+    while True:
+        ids = list(source.filter(pk__gt=last_pk).order_by("pk").values_list(
+            "pk", flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last_pk = ids[-1]
+
+
+def _selection(model, params):
+    """
+    QuerySet по условиям задачи: filter — параметры фильтров списка в
+    админке или условия команды, search — строка поиска админки.
+    """
+    queryset = model.objects.filter(**{
+        key: prepare_lookup_value(key, value)
+        for key, value in params.get("filter", {}).items()})
+    term = params.get("search")
+    if not term:
+        return queryset
+    if model is Post:
+        return search.filter_posts(queryset, term)
+    return queryset.filter(text__icontains=term)
+
+
+def _stages(job):
+    """Что обрабатывает задача: пары (id или QuerySet, обработчик пачки)."""
+    params = json.loads(job.params)
+    if job.action == ModerationJob.PURGE_USER:
+        return [
+            (Post.objects.filter(author_id=params["user_id"]), delete_posts),
+            (Comment.objects.filter(author_id=params["user_id"]),
+             delete_comments),
+        ]
+    model, handle = {
+        ModerationJob.DELETE_POSTS: (Post, delete_posts),
+        ModerationJob.DELETE_COMMENTS: (Comment, delete_comments),
+        ModerationJob.MOVE_POSTS: (
+            Post, partial(move_posts, group_id=params.get("group_id"))),
+    }[job.action]
+    if "ids" in params:
+        return [(params["ids"], handle)]
+    return [(_selection(model, params), handle)]
+
+
+def create_job(action, user=None, **params):
+    """
+    Записывает задачу. params: ids — список id, или filter — условия
+    QuerySet и search — строка поиска, или user_id для purge_user;
+    group_id для move_posts.
+    """
+    return ModerationJob.objects.create(action=action, created_by=user,
+                                        params=json.dumps(params))
+
+
+def run_job(job_id, batch_size=None, progress=None):
+    """
+    Выполняет задачу пачками. progress(done, total) вызывается после
+    каждой пачки. Ошибка записывается в задачу и пробрасывается дальше.
+
+    Задача забирается из очереди одним UPDATE; если она уже не в очереди
+    (ее выполняет кто-то другой), возвращается None. Каждая пачка
+    обновляет heartbeat; если задачу, сочтя брошенной, забрал другой
+    исполнитель, этот останавливается и тоже возвращает None.
+    """
+    batch_size = batch_size or settings.MODERATION_BATCH_SIZE
+    jobs = ModerationJob.objects.filter(pk=job_id)
+    heartbeat = timezone.now()
+    if not jobs.filter(status=ModerationJob.PENDING).update(
+            status=ModerationJob.RUNNING, heartbeat=heartbeat, total=0,
+            done=0, error=""):
+        return None
+    mine = jobs.filter(status=ModerationJob.RUNNING)
+    stages = _stages(ModerationJob.objects.get(pk=job_id))
+    total = sum(len(source) if isinstance(source, list) else source.count()
+                for source, handle in stages)
+    jobs.update(total=total)
+    done = 0
+    try:
+        for source, handle in stages:
+            for ids in _chunks(source, batch_size):
+                handle(ids)
+                done += len(ids)
+                beat = timezone.now()
+                if not mine.filter(heartbeat=heartbeat).update(
+                        done=done, heartbeat=beat):
+                    return None
+                heartbeat = beat
+                if progress:
+                    progress(done, total)
+    except Exception as error:
+        mine.filter(heartbeat=heartbeat).update(
+            status=ModerationJob.FAILED, error=str(error),
+            finished=timezone.now())
+        raise
+    mine.filter(heartbeat=heartbeat).update(
+        status=ModerationJob.DONE, finished=timezone.now())
+    return done
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.MODERATION_WORKERS)
+    return _executor
+
+
+def _run_logged(job_id):
+    try:
+        run_job(job_id)
+    except Exception:
+        logger.exception("Задача модерации #%s не выполнена", job_id)
+
+
+def _run_in_worker(job_id):
+    """Фоновый поток: свое соединение с базой, закрывается после задачи."""
+    try:
+        _run_logged(job_id)
+    finally:
+        connection.close()
+
+
+def submit(job):
+    """
+    Ставит задачу в очередь фонового потока после коммита транзакции.
+    При MODERATION_WORKERS = 0 она выполняется синхронно.
+    """
+    job_id = job.pk
+
+    def start():
+        if not settings.MODERATION_WORKERS:
+            _run_logged(job_id)
+            return
+        get_executor().submit(_run_in_worker, job_id)
+
+    transaction.on_commit(start)
+
+
+def resumable_jobs():
+    """
+    Задачи, которые можно запустить снова: в очереди, упавшие и
+    выполняющиеся, у которых MODERATION_STALE_AFTER не было новой пачки,
+    например из-за перезапуска процесса.
+    """
+    stale = timezone.now() - timedelta(
+        seconds=settings.MODERATION_STALE_AFTER)
+    return ModerationJob.objects.filter(
+        Q(status__in=(ModerationJob.PENDING, ModerationJob.FAILED))
+        | Q(status=ModerationJob.RUNNING)
+        & (Q(heartbeat__lt=stale) | Q(heartbeat__isnull=True)))
+
+
+def requeue(job_id):
+    """Возвращает задачу в очередь, если ее можно запустить снова."""
+    return bool(resumable_jobs().filter(pk=job_id).update(
+        status=ModerationJob.PENDING, error="", finished=None))
+
+
+def resume_jobs(jobs):
+    """
+    Снова ставит в очередь задачи jobs, которые можно запустить снова.
+    Выполняющиеся сейчас пропускаются.
+    """
+    resumed = 0
+    for job in jobs:
+        if requeue(job.pk):
+            submit(job)
+            resumed += 1
+    return resumed
@@ -0,0 +1,236 @@
+import base64
+import binascii
+
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+# меньше этого числа строк таблица считается точно
+ESTIMATE_THRESHOLD = 100000
+# id в курсоре должен поместиться в BIGINT базы
+MAX_PK = 2 ** 63 - 1
+
+
+def encode_cursor(obj, key="pub_date"):
+    """Курсор объекта: дата и id, упакованные в url-safe base64."""
+    raw = f"{getattr(obj, key).isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Разбор курсора. Для испорченного курсора возвращает None."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        value, pk = raw.rsplit("|", 1)
+        value = parse_datetime(value)
+        pk = int(pk)
+        if value is None:
+            return None
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, timezone.utc)
+        # база хранит время в UTC; у крайних дат перевод переполняется
+        value = value.astimezone(timezone.utc)
+    except (binascii.Error, UnicodeDecodeError, ValueError, OverflowError):
+        return None
+    if not -MAX_PK - 1 <= pk <= MAX_PK:
+        return None
+    return value, pk
+
+
+class CursorPage:
+    """Страница, полученная по курсору. Повторяет интерфейс Page."""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self.object_list)} objects>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return encode_cursor(self.object_list[-1], self.paginator.key)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return encode_cursor(self.object_list[0], self.paginator.key)
+
+
+class CursorPaginator:
+    """
+    Постраничная навигация по ключу (key, id) от новых записей к старым.
+
+    В отличие от Paginator не делает ни COUNT(*), ни OFFSET: каждая
+    страница — это выборка по индексу от курсора, поэтому время ответа
+    не зависит от того, насколько глубоко листает пользователь.
+    """
+
+    def __init__(self, object_list, per_page, key="pub_date"):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.key = key
+
+    def older_than(self, value, pk):
+        """
+        Записи старше курсора, от новых к старым.
+
+        Условие `key <= value` идет отдельно от OR, чтобы база читала
+        индекс по key диапазоном, а не сортировала все подходящие строки.
+        """
+        key = self.key
+        return self.object_list.filter(
+            Q(**{f"{key}__lte": value})
+            & (Q(**{f"{key}__lt": value}) | Q(pk__lt=pk))
+        ).order_by(f"-{key}", "-pk")
+
+    def newer_than(self, value, pk):
+        """Записи новее курсора, от старых к новым."""
+        key = self.key
+        return self.object_list.filter(
+            Q(**{f"{key}__gte": value})
+            & (Q(**{f"{key}__gt": value}) | Q(pk__gt=pk))
+        ).order_by(key, "pk")
+
+    def newest(self):
+        """Первая страница: самые новые записи."""
+        return self.object_list.order_by(f"-{self.key}", "-pk")
+
+    def get_page(self, after=None, before=None):
+        """Страница после курсора `after` или перед курсором `before`."""
+        after = decode_cursor(after)
+        before = decode_cursor(before) if after is None else None
+        return self.page(after=after, before=before)
+
+    def page(self, after=None, before=None):
+        """get_page() по уже разобранным курсорам (value, pk)."""
+        if before is not None:
+            rows = list(self.newer_than(*before)[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return CursorPage(rows, self, has_next=True,
+                              has_previous=has_previous)
+
+        if after is not None:
+            queryset = self.older_than(*after)
+        else:
+            queryset = self.newest()
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return CursorPage(rows[:self.per_page], self, has_next=has_next,
+                          has_previous=after is not None)
+
+
+def detach(paginator, page):
+    """
+    Пара (paginator, page) без ссылок на исходную выборку, чтобы ее можно
+    было положить в кэш: у страницы остаются загруженные строки, у
+    Paginator — уже посчитанное число строк.
+    """
+    if isinstance(paginator, Paginator):
+        # считается, пока выборка на месте, и остается в __dict__
+        paginator.count
+    page.object_list = list(page.object_list)
+    paginator.object_list = []
+    return paginator, page
+
+
+def page_position(request):
+    """
+    Какую страницу ленты просят параметры запроса: ("after", курсор),
+    ("before", курсор) или ("page", номер). Испорченные курсоры и номера
+    дают первую страницу.
+    """
+    after = decode_cursor(request.GET.get("after"))
+    if after is not None:
+        return "after", after
+    before = decode_cursor(request.GET.get("before"))
+    if before is not None:
+        return "before", before
+    try:
+        number = int(request.GET.get("page", 1))
+    except ValueError:
+        number = 1
+    return "page", max(number, 1)
+
+
+def add_cursors(page, key="pub_date"):
+    """Добавляет курсоры соседних страниц к обычной странице Paginator."""
+    objects = page.object_list = list(page.object_list)
+    page.next_cursor = (encode_cursor(objects[-1], key)
+                        if page.has_next() else None)
+    page.previous_cursor = (encode_cursor(objects[0], key)
+                            if page.has_previous() else None)
+    return page
+
+
+def estimate_rows(model, using="default"):
+    """
+    Примерное число строк таблицы из статистики базы (pg_class.reltuples,
+    sqlite_stat1 после ANALYZE) или None, если статистики нет.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == "postgresql":
+        sql = "SELECT reltuples FROM pg_class WHERE relname = %s"
+    elif connection.vendor == "sqlite":
+        sql = "SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1"
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None:
+        return None
+    # в sqlite_stat1 первое число — строки таблицы, дальше — по индексу
+    return int(str(row[0]).split()[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator для админки больших таблиц: без фильтров и поиска число
+    строк берется из статистики базы, а не полным COUNT(*). Номера
+    последних страниц при этом приблизительны.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is not None and not query.where:
+            estimate = estimate_rows(self.object_list.model,
+                                     self.object_list.db)
+            if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
@@ -0,0 +1,163 @@
+"""
+Рекомендации «на кого подписаться» по графу подписок.
+
+Считаются заранее командой recommend_authors, страницы только читают
+готовые строки Recommendation. Граф подписок читается пачками по
+первичному ключу в разреженные списки смежности: following[u] — на кого
+подписан u, followers[a] — кто подписан на a. Для пользователя
+складываются две оценки:
+
+- друзья друзей: доля авторов пользователя, подписанных на кандидата;
+- совместные подписки: косинусная близость кандидата к авторам
+  пользователя по общим подписчикам, |F(a) ∩ F(b)| / √(|F(a)|·|F(b)|).
+
+Близость автора считается по случайной выборке из FOLLOWER_SAMPLE его
+подписчиков (генератор с зерном id автора, результат воспроизводим),
+оставляется SIMILAR_PER_AUTHOR ближайших, и результат переиспользуется
+для всех его подписчиков. Тем, у кого подписок нет или оценок не
+набралось, предлагаются самые популярные авторы.
+"""
+import heapq
+import math
+import random
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .caching import touch_scopes
+from .models import Follow, Recommendation, User
+
+FRIENDS_WEIGHT = 1.0
+COFOLLOW_WEIGHT = 1.0
+FOLLOWER_SAMPLE = 200
+SIMILAR_PER_AUTHOR = 50
+# популярные авторы добавляются с оценкой ниже любой найденной по графу
+POPULAR_SCORE = 1e-6
+
+
+def recommendations_scope(user_id):
+    return f"recommendations:{user_id}"
+
+
+def load_graph(batch_size=10000):
+    """Списки смежности подписок: (following, followers)."""
+    following, followers = defaultdict(set), defaultdict(set)
+    last_pk = 0
+    while True:
+        rows = list(Follow.objects.filter(pk__gt=last_pk).order_by(
+            "pk").values_list("pk", "user_id", "author_id")[:batch_size])
+        if not rows:
+            return following, followers
+        for pk, user_id, author_id in rows:
+            following[user_id].add(author_id)
+            followers[author_id].add(user_id)
+        last_pk = rows[-1][0]
+
+
+class Recommender:
+    """Оценки кандидатов по загруженному графу подписок."""
+
+    def __init__(self, following, followers, limit):
+        self.following = following
+        self.followers = followers
+        self.limit = limit
+        self.similar = {}
+        self.popular = heapq.nlargest(
+            limit * 2, followers, key=lambda author: len(followers[author]))
+
+    def similar_authors(self, author_id):
+        """Ближайшие к автору по общим подписчикам: {автор: близость}."""
+        if author_id in self.similar:
+            return self.similar[author_id]
+        fans = self.followers[author_id]
+        # случайная, но воспроизводимая выборка: первые по id подписчики
+        # — самые старые аккаунты, и оценка смещалась бы к ним
+        sample = sorted(fans)
+        if len(sample) > FOLLOWER_SAMPLE:
+            sample = random.Random(author_id).sample(sample, FOLLOWER_SAMPLE)
+        common = Counter()
+        for fan in sample:
+            common.update(self.following[fan])
+        del common[author_id]
+        # доля общих в выборке переносится на всех подписчиков автора
+        scale = len(fans) / len(sample) if sample else 0
+        found = {
+            other: count * scale / math.sqrt(
+                len(fans) * len(self.followers[other]))
+            for other, count in common.items()
+        }
+        self.similar[author_id] = dict(heapq.nlargest(
+            SIMILAR_PER_AUTHOR, found.items(), key=lambda item: item[1]))
+        return self.similar[author_id]
+
+    def recommend(self, user_id):
+        """Пары (автор, оценка) для пользователя, лучшие первыми."""
+        followed = self.following.get(user_id, set())
+        scores = defaultdict(float)
+        for author_id in followed:
+            for candidate in self.following.get(author_id, ()):
+                scores[candidate] += FRIENDS_WEIGHT / len(followed)
+            for candidate, similarity in self.similar_authors(
+                    author_id).items():
+                scores[candidate] += COFOLLOW_WEIGHT * similarity
+        for rank, author_id in enumerate(self.popular):
+            if author_id not in scores:
+                scores[author_id] = POPULAR_SCORE / (rank + 1)
+        for excluded in followed | {user_id}:
+            scores.pop(excluded, None)
+        return heapq.nlargest(self.limit, scores.items(),
+                              key=lambda item: item[1])
+
+
+def _user_chunks(batch_size):
+    last_pk = 0
+    while True:
+        ids = list(User.objects.filter(pk__gt=last_pk).order_by(
+            "pk").values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last_pk = ids[-1]
+
+
+def rebuild(batch_size=1000, limit=None, progress=None):
+    """
+    Пересчитывает рекомендации всех пользователей. Строки пачки из
+    batch_size пользователей заменяются в одной транзакции, так что
+    страницы видят либо старые, либо новые рекомендации.
+    progress(done) вызывается после каждой пачки.
+    """
+    limit = limit or settings.RECOMMENDATIONS_PER_USER
+    recommender = Recommender(*load_graph(), limit)
+    done = 0
+    for user_ids in _user_chunks(batch_size):
+        rows = [
+            Recommendation(user_id=user_id, author_id=author_id,
+                           score=score)
+            for user_id in user_ids
+            for author_id, score in recommender.recommend(user_id)
+        ]
+        with transaction.atomic():
+            Recommendation.objects.filter(user_id__in=user_ids).delete()
+            Recommendation.objects.bulk_create(rows)
+        touch_scopes(*map(recommendations_scope, user_ids))
+        done += len(user_ids)
+        if progress:
+            progress(done)
+    return done
+
+
+def recommended_authors(user, limit=None):
+    """Готовые рекомендации пользователя вместе со счетчиками авторов."""
+    limit = limit or settings.RECOMMENDATIONS_SHOWN
+    return [recommendation.author for recommendation
+            in Recommendation.objects.filter(user=user).select_related(
+                "author__stats").order_by("-score")[:limit]]
+
+
+def forget_recommendation(user_id, author_id):
+    """После подписки автор пропадает из рекомендаций подписчика."""
+    Recommendation.objects.filter(user_id=user_id,
+                                  author_id=author_id).delete()
+    touch_scopes(recommendations_scope(user_id))
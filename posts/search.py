@@ -0,0 +1,156 @@
+"""
+Полнотекстовый поиск по постам и комментариям.
+
+На SQLite тексты лежат в виртуальной таблице FTS5 posts_search, которую
+сигналы Post и Comment держат в актуальном состоянии. rowid документа
+кодирует его тип: id поста * 2 для поста и id комментария * 2 + 1 для
+комментария, поэтому обновление и удаление идут по первичному ключу.
+На других базах поиск работает через icontains, без ранжирования.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+TABLE = "posts_search"
+
+
+def enabled():
+    return connection.vendor == "sqlite"
+
+
+def post_rowid(pk):
+    return pk * 2
+
+
+def comment_rowid(pk):
+    return pk * 2 + 1
+
+
+def match_expression(query):
+    """
+    Запрос пользователя как выражение MATCH: каждое слово в кавычках
+    и с поиском по префиксу, чтобы операторы FTS5 из ввода не работали.
+    """
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def index_document(rowid, post_id, text):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [rowid])
+        cursor.execute(
+            f"INSERT INTO {TABLE} (rowid, text, post_id) VALUES (%s, %s, %s)",
+            [rowid, text, post_id])
+
+
+def remove_document(rowid):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [rowid])
+
+
+def remove_documents(rowids):
+    """Удаляет из индекса сразу много документов."""
+    if not enabled() or not rowids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s",
+                           [[rowid] for rowid in rowids])
+
+
+def rebuild_index(post_ids=None, batch_size=500):
+    """
+    Заново заполняет индекс, например после bulk_create без сигналов.
+    С post_ids переиндексирует только эти посты и их комментарии.
+    """
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        if post_ids is None:
+            cursor.execute(f"DELETE FROM {TABLE}")
+            cursor.execute(
+                f"INSERT INTO {TABLE} (rowid, text, post_id) "
+                f"SELECT id * 2, text, id FROM posts_post")
+            cursor.execute(
+                f"INSERT INTO {TABLE} (rowid, text, post_id) "
+                f"SELECT id * 2 + 1, text, post_id FROM posts_comment")
+            return
+        post_ids = sorted(post_ids)
+        for start in range(0, len(post_ids), batch_size):
+            chunk = post_ids[start:start + batch_size]
+            ids = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"DELETE FROM {TABLE} WHERE rowid IN ("
+                f"SELECT id * 2 FROM posts_post WHERE id IN ({ids}) "
+                f"UNION ALL SELECT id * 2 + 1 FROM posts_comment "
+                f"WHERE post_id IN ({ids}))", chunk + chunk)
+            cursor.execute(
+                f"INSERT INTO {TABLE} (rowid, text, post_id) "
+                f"SELECT id * 2, text, id FROM posts_post "
+                f"WHERE id IN ({ids})", chunk)
+            cursor.execute(
+                f"INSERT INTO {TABLE} (rowid, text, post_id) "
+                f"SELECT id * 2 + 1, text, post_id FROM posts_comment "
+                f"WHERE post_id IN ({ids})", chunk)
+
+
+class SearchResults:
+    """
+    Посты, найденные FTS5, в порядке релевантности (bm25). Пост
+    ранжируется по лучшему совпадению среди его текста и комментариев.
+    Подходит как object_list для Paginator: есть count() и срезы.
+    """
+
+    def __init__(self, match):
+        self.match = match
+
+    def count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(DISTINCT post_id) FROM {TABLE} "
+                f"WHERE {TABLE} MATCH %s", [self.match])
+            return cursor.fetchone()[0]
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT post_id FROM {TABLE} WHERE {TABLE} MATCH %s "
+                f"GROUP BY post_id ORDER BY MIN(rank) LIMIT %s OFFSET %s",
+                [self.match, index.stop - start, start])
+            ids = [row[0] for row in cursor.fetchall()]
+        posts = Post.objects.for_feed().in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def search_posts(query):
+    """Посты, в тексте которых или в комментариях к которым есть query."""
+    match = match_expression(query)
+    if not match:
+        return Post.objects.none()
+    if enabled():
+        return SearchResults(match)
+    return Post.objects.filter(
+        Q(text__icontains=query) | Q(comments__text__icontains=query)
+    ).distinct().order_by("-pub_date", "-id").for_feed()
+
+
+def filter_posts(queryset, query):
+    """Оставляет в queryset посты, текст которых подходит под query."""
+    match = match_expression(query)
+    if not match:
+        return queryset.none()
+    if not enabled():
+        return queryset.filter(text__icontains=query)
+    return queryset.filter(pk__in=RawSQL(
+        f"SELECT post_id FROM {TABLE} WHERE {TABLE} MATCH %s "
+        f"AND rowid %% 2 = 0", [match]))
@@ -0,0 +1,195 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import images, recommendations, search, thumbnails, timeline
+from .caching import (bump_feed_generation, forget_author_cards, post_scopes,
+                      touch_scopes)
+from .following import forget_following
+from .models import Comment, Follow, Post, User, UserStats
+from .stats import change_stats
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_feed(sender, **kwargs):
+    """Новые, измененные и удаленные посты сразу видны в ленте."""
+    bump_feed_generation()
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous(sender, instance, raw=False, **kwargs):
+    """
+    Группа и картинка поста до правки: из группы пост может пропасть,
+    а на старый файл картинки больше не ссылаться.
+    """
+    instance.previous_group_id = instance.previous_image = None
+    if instance.pk and not raw:
+        instance.previous_group_id, instance.previous_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                "group_id", "image").first() or (None, None))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def touch_post_pages(sender, instance, **kwargs):
+    """Страницы с постом отдают клиентам новый ETag."""
+    scopes = post_scopes(instance.pk, instance.author_id, instance.group_id)
+    previous = getattr(instance, "previous_group_id", None)
+    if previous and previous != instance.group_id:
+        scopes.append(f"group:{previous}")
+    touch_scopes(*scopes)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def touch_comment_pages(sender, instance, **kwargs):
+    """Число комментариев видно везде, где виден пост."""
+    post = Post.objects.filter(pk=instance.post_id).values_list(
+        "author_id", "group_id").first()
+    if post is None:
+        touch_scopes(f"post:{instance.post_id}")
+    else:
+        touch_scopes(*post_scopes(instance.post_id, *post))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def touch_follow_pages(sender, instance, **kwargs):
+    """
+    Подписка меняет счетчики в профилях обоих и кнопки подписки на
+    страницах подписчика.
+    """
+    forget_following(instance.user_id)
+    touch_scopes(f"profile:{instance.author_id}",
+                 f"profile:{instance.user_id}")
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    """Новый пост попадает в ленты подписчиков автора."""
+    if created:
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    """После подписки в ленте появляются последние посты автора."""
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def forget_recommendation(sender, instance, created, **kwargs):
+    """Автор, на которого подписались, больше не рекомендуется."""
+    if created:
+        recommendations.forget_recommendation(instance.user_id,
+                                              instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clean_timeline(sender, instance, **kwargs):
+    """После отписки посты автора пропадают из ленты."""
+    timeline.remove_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=User)
+def create_stats(sender, instance, created, **kwargs):
+    """У каждого пользователя есть строка счетчиков."""
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def forget_author_card(sender, instance, created, **kwargs):
+    """Имя автора в боковой карточке меняется вместе с профилем."""
+    if not created:
+        forget_author_cards(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    """Счетчик записей автора растет вместе с постами."""
+    if created:
+        change_stats(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    """Удаленный пост уменьшает счетчик записей автора."""
+    change_stats(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    """Подписка меняет счетчики автора и подписчика."""
+    if created:
+        change_stats(instance.author_id, followers_count=1)
+        change_stats(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    """Отписка меняет счетчики автора и подписчика."""
+    change_stats(instance.author_id, followers_count=-1)
+    change_stats(instance.user_id, following_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def make_thumbnails(sender, instance, raw=False, **kwargs):
+    """Миниатюры новой картинки готовятся в фоне, старые забываются."""
+    if raw:
+        return
+    expected = (thumbnails.card_thumbnail_name(instance.image.name)
+                if instance.image else "")
+    if instance.thumbnail.name == expected:
+        return
+    if instance.thumbnail:
+        Post.objects.filter(pk=instance.pk).update(thumbnail="",
+                                                   updated=timezone.now())
+    if instance.image:
+        thumbnails.schedule(instance)
+
+
+@receiver(post_save, sender=Post)
+def count_image_refs(sender, instance, **kwargs):
+    """Пост держит ссылку на файл своей картинки."""
+    image = instance.image.name or ""
+    previous = getattr(instance, "previous_image", None) or ""
+    if image != previous:
+        images.acquire(image)
+        images.release(previous)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    """Файл картинки удаляется вместе с последним постом с ней."""
+    images.release(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    """Текст поста попадает в поисковый индекс."""
+    search.index_document(search.post_rowid(instance.pk), instance.pk,
+                          instance.text)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_document(search.post_rowid(instance.pk))
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, **kwargs):
+    """Текст комментария ищется вместе с постом."""
+    search.index_document(search.comment_rowid(instance.pk),
+                          instance.post_id, instance.text)
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    search.remove_document(search.comment_rowid(instance.pk))
@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .caching import forget_author_cards
+from .models import Follow, Post, User, UserStats
+
+
+def change_stats(user_id, **deltas):
+    """
+    Атомарно меняет счетчики пользователя: UPDATE ... SET n = n + delta.
+    Строка статистики создается, если ее еще нет и счетчик растет:
+    при удалении пользователя его строка уже может быть удалена каскадом.
+    Закэшированная карточка автора со счетчиками забывается после
+    коммита: раньше другой запрос успел бы положить в кэш старые числа.
+    """
+    transaction.on_commit(lambda: forget_author_cards(user_id))
+    values = {field: Greatest(F(field) + delta, 0)
+              for field, delta in deltas.items()}
+    if UserStats.objects.filter(user_id=user_id).update(**values):
+        return
+    if all(delta > 0 for delta in deltas.values()):
+        UserStats.objects.get_or_create(user_id=user_id)
+        UserStats.objects.filter(user_id=user_id).update(**values)
+
+
+def _count(queryset, field):
+    counts = queryset.filter(**{field: OuterRef("user")}).order_by().values(
+        field).annotate(count=Count("pk")).values("count")
+    return Coalesce(Subquery(counts), 0)
+
+
+def _recount(users, stats):
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id)
+         for user_id in users.filter(
+             stats__isnull=True).values_list("pk", flat=True)],
+        ignore_conflicts=True,
+    )
+    return stats.update(
+        posts_count=_count(Post.objects, "author"),
+        followers_count=_count(Follow.objects, "author"),
+        following_count=_count(Follow.objects, "user"),
+    )
+
+
+def recount_stats(user_ids=None, batch_size=500):
+    """
+    Пересчитывает счетчики всех пользователей одним UPDATE или только
+    пользователей user_ids — UPDATE на каждые batch_size из них.
+    """
+    if user_ids is None:
+        return _recount(User.objects.all(), UserStats.objects.all())
+    user_ids = sorted(user_ids)
+    recounted = 0
+    for start in range(0, len(user_ids), batch_size):
+        chunk = user_ids[start:start + batch_size]
+        recounted += _recount(User.objects.filter(pk__in=chunk),
+                              UserStats.objects.filter(user_id__in=chunk))
+    return recounted
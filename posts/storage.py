@@ -0,0 +1,58 @@
+"""
+Хранилище картинок постов с адресацией по содержимому.
+
+Имя файла — sha256 его содержимого, разложенный по подкаталогам по
+первым байтам хэша: posts/3f/a9/3fa9...e1.jpg. Одинаковые картинки
+попадают в один файл, второе сохранение ничего не пишет. Сколько постов
+ссылается на файл, считает posts.images.
+"""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, который именует файлы по хэшу содержимого."""
+
+    def content_name(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        digest = content_hash(content)
+        return os.path.join(directory, digest[:2], digest[2:4],
+                            digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        return self.save_content(self.content_name(name, content), content,
+                                 max_length)
+
+    def save_content(self, name, content, max_length=None):
+        """Сохраняет content под уже посчитанным content_name()."""
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        if self.exists(name):
+            return name
+        saved = super().save(name, content, max_length)
+        if saved != name:
+            # тот же файл успел записать другой процесс
+            self.delete(saved)
+        return name
+
+
+image_storage = ContentAddressedStorage()
@@ -0,0 +1,86 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+from posts.paginators import EstimatedCountPaginator, estimate_rows
+
+
+class ScalableAdminTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="admin")
+        cls.group = Group.objects.create(title="Тестовая группа",
+                                         slug="testslug")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def create_posts(self, count, prefix="author"):
+        for i in range(count):
+            author = User.objects.create_user(username=f"{prefix}{i}")
+            post = Post.objects.create(text=f"Тестовый пост{i}",
+                                       author=author, group=self.group)
+            Comment.objects.create(post=post, author=author,
+                                   text=f"Комментарий{i}")
+            Follow.objects.create(user=self.admin, author=author)
+
+    def changelist_queries(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse(f"admin:posts_{name}_changelist"))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """Авторы, группы и посты в списках выбираются одним JOIN."""
+        self.create_posts(2)
+        # сессия и пользователь попадают в кэш на первом запросе
+        self.changelist_queries("post")
+        few = {name: self.changelist_queries(name)
+               for name in ("post", "comment", "follow")}
+        self.create_posts(6, prefix="more")
+        for name, queries in few.items():
+            with self.subTest(name=name):
+                self.assertEqual(self.changelist_queries(name), queries)
+
+    def test_estimated_count_for_unfiltered_list(self):
+        """Без фильтров число строк берется из статистики базы."""
+        self.create_posts(3)
+        with mock.patch("posts.paginators.estimate_rows",
+                        return_value=10 ** 6):
+            self.assertEqual(
+                EstimatedCountPaginator(Post.objects.all(), 10).count,
+                10 ** 6)
+            self.assertEqual(EstimatedCountPaginator(
+                Post.objects.filter(text="Тестовый пост1"), 10).count, 1)
+
+    def test_small_table_counted_exactly(self):
+        """Небольшая таблица считается точным COUNT(*)."""
+        self.create_posts(3)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.assertEqual(estimate_rows(Post), 3)
+        self.assertEqual(
+            EstimatedCountPaginator(Post.objects.all(), 10).count, 3)
+
+    def test_date_hierarchy_and_exact_search(self):
+        """Комментарии листаются по датам, подписки ищутся по username."""
+        self.create_posts(2)
+        comment = Comment.objects.latest("created")
+        response = self.client.get(
+            reverse("admin:posts_comment_changelist"), {
+                "created__year": comment.created.year,
+                "created__month": comment.created.month,
+            })
+        self.assertContains(response, "Комментарий1")
+        response = self.client.get(reverse("admin:posts_follow_changelist"),
+                                   {"q": "author1"})
+        self.assertEqual(response.context["cl"].result_count, 1)
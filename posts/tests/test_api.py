@@ -0,0 +1,96 @@
+from django.contrib.auth.models import User
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username="sergey")
+        cls.reader = User.objects.create_user(username="reader")
+        cls.group = Group.objects.create(
+            title="Тестовая группа",
+            slug="testslug",
+            description="testdescription",
+        )
+        for i in range(15):
+            post = Post.objects.create(text=f"Пост {i}", author=cls.user,
+                                       group=cls.group if i % 2 == 0 else None)
+            Comment.objects.create(post=post, author=cls.reader,
+                                   text=f"Комментарий {i}")
+        cls.post = post
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_posts_cursor_pagination(self):
+        """Посты листаются курсором, страницы не пересекаются."""
+        url = reverse("api:posts")
+        with self.assertNumQueries(1):
+            first = self.guest_client.get(url, {"limit": 10}).json()
+        self.assertEqual(len(first["results"]), 10)
+        self.assertEqual(first["results"][0]["text"], "Пост 14")
+        self.assertEqual(first["results"][0]["comment_count"], 1)
+        self.assertIsNone(first["previous"])
+
+        second = self.guest_client.get(first["next"]).json()
+        self.assertEqual([post["text"] for post in second["results"]],
+                         [f"Пост {i}" for i in range(4, -1, -1)])
+        self.assertIsNone(second["next"])
+        back = self.guest_client.get(second["previous"]).json()
+        self.assertEqual(back["results"], first["results"])
+
+    def test_posts_filters_and_fields(self):
+        """?group= фильтрует посты, ?fields= оставляет нужные поля."""
+        response = self.guest_client.get(
+            reverse("api:posts"), {"group": "testslug", "fields": "id,group"})
+        results = response.json()["results"]
+        self.assertEqual(len(results), 8)
+        self.assertEqual(results[0], {"id": self.post.pk, "group": "testslug"})
+
+        response = self.guest_client.get(reverse("api:posts"),
+                                         {"fields": "id,secret"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_post_detail_and_comments(self):
+        """Пост и его комментарии отдаются JSON, нет поста — JSON 404."""
+        response = self.guest_client.get(
+            reverse("api:post", kwargs={"post_id": self.post.pk}))
+        self.assertEqual(response.json()["author"], "sergey")
+        with self.assertNumQueries(2):
+            response = self.guest_client.get(reverse(
+                "api:post_comments", kwargs={"post_id": self.post.pk}))
+        self.assertEqual(response.json()["results"][0]["text"],
+                         "Комментарий 14")
+        response = self.guest_client.get(
+            reverse("api:post", kwargs={"post_id": 0}))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("detail", response.json())
+
+    def test_groups_and_profile(self):
+        """Группы и профиль со счетчиками."""
+        response = self.guest_client.get(reverse("api:groups"))
+        self.assertEqual(response.json()["results"][0]["slug"], "testslug")
+        response = self.guest_client.get(
+            reverse("api:profile", kwargs={"username": "sergey"}))
+        self.assertEqual(response.json()["posts_count"], 15)
+        self.assertEqual(response.json()["followers_count"], 1)
+
+    def test_follow_feed(self):
+        """Лента подписок только для вошедшего пользователя."""
+        response = self.guest_client.get(reverse("api:follow"))
+        self.assertEqual(response.status_code, 401)
+        response = self.authorized_client.get(reverse("api:follow"))
+        self.assertEqual(len(response.json()["results"]), 10)
+
+    def test_read_only(self):
+        """Писать через API нельзя."""
+        response = self.authorized_client.post(reverse("api:posts"))
+        self.assertEqual(response.status_code, 405)
@@ -0,0 +1,259 @@
+import json
+import shutil
+import os
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts import benchmark
+from posts.models import Comment, Follow, Group, Post, TimelineEntry
+from posts.thumbnails import card_thumbnail_name, generate
+from posts.search import search_posts
+from posts.transfer import export_posts, reserve_pks
+
+
+class ExplainFeedsCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username="sergey")
+        cls.user2 = User.objects.create_user(username="sergey2")
+        cls.group = Group.objects.create(
+            title="Тестовая группа",
+            slug="testslug",
+            description="testdescription",
+        )
+        Post.objects.create(text="Тестовый пост", author=cls.user,
+                            group=cls.group)
+        Follow.objects.create(user=cls.user2, author=cls.user)
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент не читают таблицы целиком."""
+        out = StringIO()
+        call_command("explain_feeds", stdout=out)
+        self.assertIn("-- index", out.getvalue())
+        self.assertIn("-- follow_index (cursor)", out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=settings.MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        settings.MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+        image = BytesIO()
+        Image.new("RGB", (40, 20), "red").save(image, "PNG")
+        cls.user = User.objects.create_user(username="sergey")
+        cls.post = Post.objects.create(
+            text="Тестовый пост",
+            author=cls.user,
+            image=SimpleUploadedFile("small.png", image.getvalue(),
+                                     content_type="image/png"),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_generate_card_thumbnail(self):
+        """Миниатюра карточки нужного размера сохраняется в пост."""
+        generate(self.post.pk, self.post.image.name)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.thumbnail.name,
+                         card_thumbnail_name(self.post.image.name))
+        with Image.open(self.post.thumbnail.path) as thumb:
+            self.assertEqual(thumb.size, (960, 339))
+
+    def test_thumbnail_names_do_not_collide(self):
+        """Миниатюры одноименных картинок не перезаписывают друг друга."""
+        names = {card_thumbnail_name(name) for name in (
+            "posts/cat.png", "posts/cat.jpg", "posts/aa/bb/cat.jpg")}
+        self.assertEqual(len(names), 3)
+
+    def test_generate_thumbnails_command(self):
+        """generate_thumbnails готовит миниатюры уже загруженных картинок."""
+        out = StringIO()
+        call_command("generate_thumbnails", workers=1, stdout=out)
+        self.assertIn("Готово миниатюр: 1", out.getvalue())
+        self.post.refresh_from_db()
+        self.assertTrue(self.post.thumbnail)
+
+    def test_template_uses_stored_thumbnail(self):
+        """Лента показывает готовую миниатюру поста."""
+        generate(self.post.pk, self.post.image.name)
+        cache.clear()
+        response = self.client.get(reverse("posts:index"))
+        self.assertContains(response,
+                            card_thumbnail_name(self.post.image.name))
+
+
+class BenchmarkCommandTest(TransactionTestCase):
+    def tearDown(self):
+        benchmark.clear()
+        cache.clear()
+
+    def test_benchmark_report(self):
+        """benchmark создает данные и пишет отчет по каждой странице."""
+        out = StringIO()
+        call_command("benchmark", users=10, groups=2, posts=30, comments=20,
+                     follows_per_user=3, images=0, requests=2,
+                     concurrency=1, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["dataset"]["posts"], 30)
+        self.assertEqual(set(report["views"]), {
+            "index", "group_posts", "profile", "post_view", "follow_index",
+            "add_comment"})
+        for view in report["views"].values():
+            self.assertEqual(view["errors"], 0)
+            self.assertGreater(view["queries_per_request"], 0)
+        self.assertTrue(TimelineEntry.objects.exists())
+
+
+class MixedBenchmarkCommandTest(TransactionTestCase):
+    """
+    Замер чтения вместе с записью на базе в файле с бэкендом yatube.sqlite,
+    как при настоящей нагрузке. Общая тестовая база в памяти блокирует
+    таблицы целиком и не ждет busy_timeout, на ней запись падала бы сразу.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db_dir = tempfile.mkdtemp()
+        cls.memory_connection = connections["default"]
+        connections.databases["default"] = {
+            **cls.memory_connection.settings_dict,
+            "ENGINE": "yatube.sqlite",
+            "NAME": os.path.join(cls.db_dir, "bench.sqlite3"),
+        }
+        # соединения потоков нагрузки создаются уже из новых настроек
+        del connections["default"]
+        call_command("migrate", verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connection.close()
+        connections.databases["default"] = (
+            cls.memory_connection.settings_dict)
+        connections["default"] = cls.memory_connection
+        shutil.rmtree(cls.db_dir, ignore_errors=True)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_benchmark_mixed_report(self):
+        """benchmark --mixed замеряет чтение без записи и вместе с ней."""
+        self.assertFalse(connection.is_in_memory_db())
+        out = StringIO()
+        call_command("benchmark", users=10, groups=2, posts=30, comments=20,
+                     follows_per_user=3, images=0, requests=2,
+                     concurrency=1, writers=1, mixed=True, stdout=out)
+        report = json.loads(out.getvalue())["mixed"]
+        self.assertIsNone(report["reads_only"]["writes"])
+        self.assertEqual(report["reads_with_writes"]["writes"]["requests"], 2)
+        self.assertEqual(report["reads_with_writes"]["writes"]["errors"], 0)
+        self.assertEqual(report["reads_with_writes"]["reads"]["requests"], 2)
+
+
+class TransferCommandsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username="sergey")
+        cls.user2 = User.objects.create_user(username="sergey2")
+        cls.group = Group.objects.create(
+            title="Тестовая группа",
+            slug="testslug",
+            description="testdescription",
+        )
+        for i in range(3):
+            post = Post.objects.create(text=f"Пост {i}", author=cls.user,
+                                       group=cls.group)
+            Comment.objects.create(post=post, author=cls.user2,
+                                   text=f"Комментарий {i}")
+        Follow.objects.create(user=cls.user2, author=cls.user)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f"{directory.name}/posts.ndjson"
+
+    def test_export_import_round_trip(self):
+        """Выгруженные данные загружаются обратно со всеми связями."""
+        call_command("export_posts", self.path, batch_size=2,
+                     stdout=StringIO())
+        dates = sorted(Post.objects.values_list("pub_date", flat=True))
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+
+        out = StringIO()
+        call_command("import_posts", self.path, batch_size=2, stdout=out)
+        self.assertIn("пропущено: 0", out.getvalue())
+        self.assertEqual(
+            sorted(Post.objects.values_list("pub_date", flat=True)), dates)
+        for post in Post.objects.all():
+            self.assertEqual(post.group, self.group)
+            self.assertEqual(post.comments.get().text,
+                             "Комментарий " + post.text.split()[-1])
+        self.assertTrue(Follow.objects.filter(
+            user=self.user2, author=self.user).exists())
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.user2).count(), 3)
+
+    def test_import_rebuilds_only_touched_users(self):
+        """После загрузки пересобираются ленты только затронутых."""
+        call_command("export_posts", self.path, stdout=StringIO())
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        outsider = User.objects.create_user(username="outsider")
+        kept = Post.objects.create(text="Чужой пост", author=self.user2)
+        TimelineEntry.objects.create(user=outsider, post=kept,
+                                     pub_date=kept.pub_date)
+
+        call_command("import_posts", self.path, stdout=StringIO())
+        self.assertTrue(TimelineEntry.objects.filter(user=outsider).exists())
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.user2).count(), 3)
+        self.assertEqual(User.objects.get(pk=self.user.pk).stats
+                         .posts_count, 3)
+        self.assertEqual(search_posts("Комментарий").count(), 3)
+
+    def test_reserved_pks_not_reused(self):
+        """Id, зарезервированные загрузкой, не достаются обычной вставке."""
+        with transaction.atomic():
+            reserved = reserve_pks(Post, 5)
+        self.assertEqual(len(set(reserved)), 5)
+        post = Post.objects.create(text="Одновременно", author=self.user)
+        self.assertGreater(post.pk, max(reserved))
+
+    def test_export_resumes_from_checkpoint(self):
+        """Прерванная выгрузка продолжается с контрольной точки."""
+        call_command("export_posts", self.path, stdout=StringIO())
+        with open(self.path, encoding="utf-8") as file:
+            expected = file.read()
+
+        def interrupt(section, count):
+            if section == "post" and count == 2:
+                raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            export_posts(self.path, batch_size=1, progress=interrupt)
+        call_command("export_posts", self.path, batch_size=1, resume=True,
+                     stdout=StringIO())
+        with open(self.path, encoding="utf-8") as file:
+            self.assertEqual(file.read(), expected)
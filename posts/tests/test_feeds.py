@@ -0,0 +1,85 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Group, Post
+
+
+class FeedsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username="sergey")
+        cls.group = Group.objects.create(
+            title="Тестовая группа",
+            slug="testslug",
+            description="testdescription",
+        )
+        cls.post = Post.objects.create(text="Пост в группе", author=cls.user,
+                                       group=cls.group)
+        Post.objects.create(text="Пост без группы", author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_feeds_list_posts_of_scope(self):
+        """В ленте группы только ее посты, в ленте автора — все его."""
+        feeds = (
+            (reverse("posts:index_rss"), 2),
+            (reverse("posts:index_atom"), 2),
+            (reverse("posts:group_rss", kwargs={"slug": "testslug"}), 1),
+            (reverse("posts:group_atom", kwargs={"slug": "testslug"}), 1),
+            (reverse("posts:author_rss", kwargs={"username": "sergey"}), 2),
+            (reverse("posts:author_atom", kwargs={"username": "sergey"}), 2),
+        )
+        for url, items in feeds:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                content = response.content.decode()
+                tag = "<entry>" if "atom" in url else "<item>"
+                self.assertEqual(content.count(tag), items)
+                self.assertIn("Пост в группе", content)
+
+    def test_unknown_group_feed(self):
+        response = self.guest_client.get(
+            reverse("posts:group_rss", kwargs={"slug": "nope"}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_feed_cached_until_post_saved(self):
+        """XML берется из кэша, пока в группе не изменится пост."""
+        url = reverse("posts:group_rss", kwargs={"slug": "testslug"})
+        self.guest_client.get(url)
+        # только запрос валидаторов, сами посты не выбираются
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(url)
+        self.assertContains(response, "Пост в группе")
+
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = "Исправленный пост"
+        post.save()
+        self.assertContains(self.guest_client.get(url), "Исправленный пост")
+
+    def test_feed_cache_shared_between_readers(self):
+        """Подписки читателя не входят в версию XML ленты."""
+        url = reverse("posts:author_rss", kwargs={"username": "sergey"})
+        reader = User.objects.create_user(username="reader")
+        authorized_client = Client()
+        authorized_client.force_login(reader)
+        authorized_client.get(reverse("posts:profile_follow",
+                                      kwargs={"username": "sergey"}))
+        authorized_client.get(url)
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(url)
+        self.assertContains(response, "Пост в группе")
+
+    def test_feed_conditional_get(self):
+        """Неизменившаяся лента отдается ответом 304."""
+        url = reverse("posts:author_atom", kwargs={"username": "sergey"})
+        response = self.guest_client.get(url)
+        response = self.guest_client.get(
+            url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
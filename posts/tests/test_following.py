@@ -0,0 +1,96 @@
+from array import array
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.caching import bump_feed_generation
+from posts.following import FollowingSet
+from posts.models import Follow, Post
+
+
+class FollowingSetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.reader = User.objects.create_user(username="reader")
+        cls.authors = [User.objects.create_user(username=f"author{i}")
+                       for i in range(6)]
+        for author in cls.authors:
+            Post.objects.create(text=f"Пост {author.username}",
+                                author=author)
+        for author in cls.authors[:3]:
+            Follow.objects.create(user=cls.reader, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+        # множество забывается после коммита, которого в TestCase нет
+        patcher = mock.patch("django.db.transaction.on_commit",
+                             lambda func: func())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def follow_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, sum('FROM "posts_follow"' in query["sql"]
+                             for query in queries)
+
+    def test_one_query_for_all_authors(self):
+        """Подписка на всех авторов страницы проверяется одним запросом."""
+        response, queries = self.follow_queries(reverse("posts:index"))
+        self.assertEqual(queries, 1)
+        # кнопка только у авторов, на которых зритель не подписан
+        self.assertContains(response, "Подписаться", count=3)
+        # лента рендерится заново, множество берется из кэша
+        bump_feed_generation()
+        response, queries = self.follow_queries(reverse("posts:index"))
+        self.assertContains(response, "Подписаться", count=3)
+        self.assertEqual(queries, 0)
+
+    def test_follow_and_unfollow_forget_set(self):
+        """Подписка и отписка сбрасывают множество в кэше."""
+        author = self.authors[4]
+        url = reverse("posts:profile", kwargs={"username": author.username})
+        self.assertContains(self.client.get(url), "Подписаться")
+        self.client.get(reverse("posts:profile_follow",
+                                kwargs={"username": author.username}))
+        self.assertContains(self.client.get(url), "Отписаться")
+        self.client.get(reverse("posts:profile_unfollow",
+                                kwargs={"username": author.username}))
+        self.assertNotContains(self.client.get(url), "Отписаться")
+
+    def test_follow_changes_etag_of_pages_with_buttons(self):
+        """После подписки лента не отвечает 304 со старой кнопкой."""
+        author = self.authors[4]
+        pages = (
+            reverse("posts:index"),
+            reverse("posts:profile", kwargs={"username": author.username}),
+        )
+        etags = {url: self.client.get(url)["ETag"] for url in pages}
+        self.client.get(reverse("posts:profile_follow",
+                                kwargs={"username": author.username}))
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse("posts:index"))
+        self.assertContains(response, "Подписаться", count=2)
+
+    def test_large_set_uses_binary_search(self):
+        """Большое множество хранится только отсортированным массивом."""
+        ids = array("q", range(0, 20000, 2))
+        with mock.patch("posts.following.SET_LIMIT", 100):
+            following = FollowingSet(ids)
+        self.assertIsNone(following.lookup)
+        self.assertIn(19998, following)
+        self.assertIn(User(pk=4), following)
+        self.assertNotIn(3, following)
+        self.assertNotIn(20000, following)
@@ -1,10 +1,11 @@
 import shutil
 import tempfile
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
 from posts.models import Group, Post
@@ -57,6 +58,7 @@ class PostFormsTests(TestCase):
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
+    @override_settings(THUMBNAIL_WORKERS=0)
     def test_new_post_create_by_form(self):
         """Новый пост создается с помощъю формы, редирект"""
         posts_count = Post.objects.count()
@@ -67,11 +69,14 @@ class PostFormsTests(TestCase):
             "image": self.uploaded,
         }
 
-        response = self.authorized_client.post(
-            reverse("posts:new_post"),
-            data=form_data,
-            follow=True,
-        )
+        # картинка обрабатывается после коммита, которого в TestCase нет
+        with mock.patch("django.db.transaction.on_commit",
+                        lambda func: func()):
+            response = self.authorized_client.post(
+                reverse("posts:new_post"),
+                data=form_data,
+                follow=True,
+            )
 
         self.assertEqual(Post.objects.count(), posts_count + 1)
         self.assertRedirects(response, reverse("posts:index"))
@@ -79,7 +84,7 @@ class PostFormsTests(TestCase):
             text="Тестовый пост1",
             author=self.user,
             group=self.group.id,
-            image="posts/small.gif"
+            image__endswith=".jpg"
         ).exists())
 
     def test_post_edit_save_to_database(self):
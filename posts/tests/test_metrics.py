@@ -0,0 +1,71 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+from yatube.metrics import registry
+
+
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username="sergey")
+        Post.objects.create(text="Тестовый пост", author=cls.user)
+
+    def setUp(self):
+        registry.reset()
+        self.guest_client = Client()
+
+    def test_request_metrics_by_url_name(self):
+        """Время ответа, запросы к базе и рендеринг считаются по имени URL."""
+        self.guest_client.get(reverse("posts:index"))
+        self.guest_client.get(reverse("posts:index"))
+        self.assertEqual(registry.requests["posts:index"], 2)
+        self.assertGreater(registry.db_queries["posts:index"], 0)
+        self.assertGreater(registry.render_seconds["posts:index"], 0)
+
+    def test_cache_hits_and_misses(self):
+        """Считаются попадания и промахи настроенного бэкенда кэша."""
+        self.guest_client.get(reverse("posts:index"))
+        cache.set("metrics-test", 1)
+        registry.reset()
+        cache.get("metrics-test")
+        cache.get("metrics-test-missing")
+        self.assertEqual(dict(registry.cache), {"hit": 1, "miss": 1})
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_endpoint(self):
+        """/metrics/ отдает метрики в текстовом формате Prometheus."""
+        self.guest_client.get(reverse("posts:index"))
+        response = self.guest_client.get(reverse("metrics"),
+                                         HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            response,
+            'yatube_request_duration_seconds_count{view="posts:index"} 1')
+        self.assertContains(response, 'yatube_db_queries_total')
+        self.assertContains(response, 'yatube_cache_requests_total')
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_endpoint_needs_token(self):
+        """
+        Без токена /metrics/ закрыты и для локального адреса: за прокси
+        на той же машине он у всех запросов.
+        """
+        for headers in ({}, {"HTTP_AUTHORIZATION": "Bearer wrong"}):
+            with self.subTest(headers=headers):
+                response = self.guest_client.get(
+                    reverse("metrics"), REMOTE_ADDR="127.0.0.1", **headers)
+                self.assertEqual(response.status_code, 404)
+
+    @override_settings(METRICS_TOKEN="", METRICS_ALLOWED_IPS=["10.0.0.2"])
+    def test_metrics_endpoint_for_allowed_ips(self):
+        """Адресам из METRICS_ALLOWED_IPS токен не нужен."""
+        for address, status in (("10.0.0.2", 200), ("10.0.0.1", 404)):
+            with self.subTest(address=address):
+                response = self.guest_client.get(reverse("metrics"),
+                                                 REMOTE_ADDR=address)
+                self.assertEqual(response.status_code, status)
@@ -1,7 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
 
-from posts.models import Group, Post
+from posts.models import Follow, Group, Post, UserStats
 
 
 class PostModelTest(TestCase):
@@ -52,3 +55,40 @@ class PostModelTest(TestCase):
     def test_object_name_is_text_field(self):
         """В поле __str__  объекта post записано значение поля post.text."""
         self.assertEquals(self.post.text[:15], str(self.post))
+
+
+class UserStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username="sergey")
+        cls.user2 = User.objects.create_user(username="sergey2")
+
+    def test_stats_follow_posts(self):
+        """Счетчики меняются вместе с постами и подписками."""
+        post = Post.objects.create(text="Тестовый пост", author=self.user)
+        follow = Follow.objects.create(user=self.user2, author=self.user)
+        self.user.stats.refresh_from_db()
+        self.user2.stats.refresh_from_db()
+        self.assertEqual(self.user.stats.posts_count, 1)
+        self.assertEqual(self.user.stats.followers_count, 1)
+        self.assertEqual(self.user2.stats.following_count, 1)
+
+        post.delete()
+        follow.delete()
+        self.user.stats.refresh_from_db()
+        self.user2.stats.refresh_from_db()
+        self.assertEqual(self.user.stats.posts_count, 0)
+        self.assertEqual(self.user.stats.followers_count, 0)
+        self.assertEqual(self.user2.stats.following_count, 0)
+
+    def test_recount_stats_repairs_drift(self):
+        """recount_stats исправляет разошедшиеся счетчики."""
+        Post.objects.create(text="Тестовый пост", author=self.user)
+        UserStats.objects.filter(user=self.user).update(posts_count=42)
+        UserStats.objects.filter(user=self.user2).delete()
+        call_command("recount_stats", stdout=StringIO())
+        self.assertEqual(UserStats.objects.get(user=self.user).posts_count, 1)
+        self.assertEqual(UserStats.objects.get(user=self.user2).posts_count,
+                         0)
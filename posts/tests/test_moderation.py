@@ -0,0 +1,230 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.admin import helpers
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import moderation
+from posts.models import (Comment, Follow, Group, ModerationJob, Post,
+                          TimelineEntry)
+from posts.search import search_posts
+
+
+class ModerationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.spammer = User.objects.create_user(username="spammer")
+        cls.reader = User.objects.create_user(username="reader")
+        cls.group = Group.objects.create(title="Спам", slug="spam")
+        cls.other_group = Group.objects.create(title="Другое", slug="other")
+        Follow.objects.create(user=cls.reader, author=cls.spammer)
+        cls.reader_post = Post.objects.create(text="Обычный пост",
+                                              author=cls.reader)
+        for i in range(5):
+            post = Post.objects.create(text=f"Реклама{i}",
+                                       author=cls.spammer, group=cls.group)
+            Comment.objects.create(post=post, author=cls.reader,
+                                   text=f"Ответ{i}")
+            Comment.objects.create(post=cls.reader_post, author=cls.spammer,
+                                   text=f"Спам{i}")
+
+    def setUp(self):
+        cache.clear()
+
+    def moderate(self, *args, **options):
+        out = StringIO()
+        call_command("moderate", *args, stdout=out, **options)
+        return out.getvalue()
+
+    def test_delete_posts_in_batches(self):
+        """Посты удаляются пачками вместе с комментариями и лентами."""
+        self.client.get(reverse("posts:index"))
+        out = self.moderate("delete_posts", author="spammer", batch_size=2)
+        self.assertIn("2 / 5", out)
+        self.assertIn("готово, 5", out)
+
+        self.assertFalse(Post.objects.filter(author=self.spammer).exists())
+        self.assertEqual(Comment.objects.filter(author=self.reader).count(),
+                         0)
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.reader).exists())
+        self.assertEqual(User.objects.get(pk=self.spammer.pk).stats
+                         .posts_count, 0)
+        self.assertEqual(search_posts("Ответ0").count(), 0)
+        self.assertNotContains(self.client.get(reverse("posts:index")),
+                               "Реклама")
+        job = ModerationJob.objects.get()
+        self.assertEqual((job.status, job.done, job.total),
+                         (ModerationJob.DONE, 5, 5))
+
+    def test_delete_comments_by_ids(self):
+        """Комментарии удаляются по id, посты остаются."""
+        ids = list(Comment.objects.filter(author=self.spammer).values_list(
+            "pk", flat=True)[:3])
+        self.moderate("delete_comments", ids=ids)
+        self.assertEqual(Comment.objects.filter(author=self.spammer).count(),
+                         2)
+        self.assertEqual(Post.objects.count(), 6)
+
+    def test_move_posts_to_group(self):
+        """Посты группы переносятся в другую группу."""
+        self.moderate("move_posts", group="spam", to="other")
+        self.assertEqual(self.other_group.posts.count(), 5)
+        response = self.client.get(reverse(
+            "posts:group_posts", kwargs={"slug": "other"}))
+        self.assertContains(response, "Реклама0")
+
+    def test_resume_interrupted_job(self):
+        """--resume доводит до конца задачи, прерванные перезапуском."""
+        job = moderation.create_job(ModerationJob.DELETE_POSTS,
+                                    filter={"author_id": self.spammer.pk})
+        ModerationJob.objects.filter(pk=job.pk).update(
+            status=ModerationJob.RUNNING)
+        out = self.moderate(resume=True)
+        self.assertIn("готово, 5", out)
+        self.assertEqual(ModerationJob.objects.get().status,
+                         ModerationJob.DONE)
+        self.assertFalse(Post.objects.filter(author=self.spammer).exists())
+
+    def test_running_job_not_started_twice(self):
+        """
+        Выполняющуюся задачу не запускает ни --resume, ни второй
+        исполнитель, пока у нее идут пачки; брошенную — запускают.
+        """
+        job = moderation.create_job(ModerationJob.DELETE_POSTS,
+                                    filter={"author_id": self.spammer.pk})
+        jobs = ModerationJob.objects.filter(pk=job.pk)
+        jobs.update(status=ModerationJob.RUNNING, heartbeat=timezone.now())
+        self.assertIsNone(moderation.run_job(job.pk))
+        self.assertNotIn("готово", self.moderate(resume=True))
+        self.assertEqual(Post.objects.filter(author=self.spammer).count(), 5)
+
+        jobs.update(heartbeat=timezone.now() - timedelta(
+            seconds=settings.MODERATION_STALE_AFTER + 1))
+        self.assertIn("готово, 5", self.moderate(resume=True))
+
+    def test_job_taken_over_stops(self):
+        """Исполнитель, у которого забрали задачу, бросает ее."""
+        job = moderation.create_job(ModerationJob.DELETE_POSTS,
+                                    filter={"author_id": self.spammer.pk})
+        delete_posts = moderation.delete_posts
+
+        def taken_over(ids):
+            # задачу сочли брошенной и отдали другому исполнителю
+            ModerationJob.objects.filter(pk=job.pk).update(
+                heartbeat=timezone.now() - timedelta(days=1))
+            return delete_posts(ids)
+
+        with mock.patch.object(moderation, "delete_posts", taken_over):
+            self.assertIsNone(moderation.run_job(job.pk, batch_size=2))
+        self.assertEqual(Post.objects.filter(author=self.spammer).count(), 3)
+
+    def test_purge_user(self):
+        """Удаляются все посты и комментарии пользователя, и только они."""
+        self.moderate("purge_user", author="spammer")
+        self.assertFalse(Post.objects.filter(author=self.spammer).exists())
+        self.assertFalse(Comment.objects.filter(
+            author=self.spammer).exists())
+        self.assertTrue(Post.objects.filter(pk=self.reader_post.pk).exists())
+        self.assertEqual(User.objects.get(pk=self.reader.pk).stats
+                         .posts_count, 1)
+
+
+@override_settings(MODERATION_WORKERS=0)
+class ModerationAdminTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="admin")
+        cls.group = Group.objects.create(title="Новая группа", slug="new")
+        cls.posts = [Post.objects.create(text=f"Пост{i}", author=cls.admin)
+                     for i in range(3)]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        # задача запускается после коммита, которого в TestCase нет
+        patcher = mock.patch("django.db.transaction.on_commit",
+                             lambda func: func())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_action(self, action, query="", **data):
+        return self.client.post(
+            reverse("admin:posts_post_changelist") + query, {
+                "action": action,
+                helpers.ACTION_CHECKBOX_NAME: [post.pk
+                                               for post in self.posts[:2]],
+                **data,
+            }, follow=True)
+
+    def test_default_delete_replaced(self):
+        """Стандартное удаление по одному заменено фоновой задачей."""
+        response = self.client.get(reverse("admin:posts_post_changelist"))
+        actions = dict(response.context["action_form"].fields[
+            "action"].choices)
+        self.assertNotIn("delete_selected", actions)
+        self.assertIn("delete_in_background", actions)
+
+    def test_delete_in_background(self):
+        """Удаление из админки ставит задачу и сообщает о ней."""
+        response = self.run_action("delete_in_background")
+        self.assertContains(response, "поставлена в очередь")
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertEqual(ModerationJob.objects.get().status,
+                         ModerationJob.DONE)
+
+    def test_move_to_group_asks_for_group(self):
+        """Перенос сначала спрашивает группу, потом ставит задачу."""
+        response = self.run_action("move_to_group")
+        self.assertContains(response, "Новая группа")
+        self.run_action("move_to_group", apply="1", group=self.group.pk)
+        self.assertEqual(self.group.posts.count(), 2)
+
+    def test_select_all_stores_filter_not_ids(self):
+        """«Выбрать все» передает задаче фильтры списка, а не все id."""
+        Post.objects.create(text="Другой текст", author=self.admin)
+        self.run_action("delete_in_background", query="?q=Пост",
+                        select_across="1")
+        params = json.loads(ModerationJob.objects.get().params)
+        self.assertNotIn("ids", params)
+        self.assertEqual(params["search"], "Пост")
+        self.assertEqual(list(Post.objects.values_list("text", flat=True)),
+                         ["Другой текст"])
+
+    def test_resume_action(self):
+        """Невыполненную задачу можно снова поставить в очередь из админки."""
+        job = moderation.create_job(ModerationJob.DELETE_POSTS,
+                                    ids=[self.posts[0].pk])
+        self.client.post(reverse("admin:posts_moderationjob_changelist"), {
+            "action": "resume",
+            helpers.ACTION_CHECKBOX_NAME: [job.pk],
+        })
+        self.assertEqual(ModerationJob.objects.get().status,
+                         ModerationJob.DONE)
+        self.assertEqual(Post.objects.count(), 2)
+
+    def test_resume_action_skips_running_job(self):
+        """Задача, которая сейчас выполняется, в очередь не ставится."""
+        job = moderation.create_job(ModerationJob.DELETE_POSTS,
+                                    ids=[self.posts[0].pk])
+        ModerationJob.objects.filter(pk=job.pk).update(
+            status=ModerationJob.RUNNING, heartbeat=timezone.now())
+        self.client.post(reverse("admin:posts_moderationjob_changelist"), {
+            "action": "resume",
+            helpers.ACTION_CHECKBOX_NAME: [job.pk],
+        })
+        self.assertEqual(ModerationJob.objects.get().status,
+                         ModerationJob.RUNNING)
+        self.assertEqual(Post.objects.count(), 3)
@@ -1,10 +1,15 @@
+import base64
 import time
 
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
 from posts.models import Post
+from posts.paginators import decode_cursor
 
 
 class PaginatorViewsTest(TestCase):
@@ -49,3 +54,60 @@ class PaginatorViewsTest(TestCase):
         context_get = response.context.get("page")[0]
         self.assertEqual(context_get.text, "Тестовый пост1")
         self.assertEqual(context_get.author.username, "sergey")
+
+    def test_cursor_next_page_continues_first_page(self):
+        """Курсор ?after= отдает записи, следующие за первой страницей."""
+        response = self.guest_client.get(reverse("posts:index"))
+        next_cursor = response.context.get("page").next_cursor
+        response = self.guest_client.get(
+            reverse("posts:index") + f"?after={next_cursor}")
+        page = response.context.get("page")
+        self.assertEqual([post.text for post in page],
+                         ["Тестовый пост1", "Тестовый пост0"])
+        self.assertFalse(page.has_next())
+        self.assertTrue(page.has_previous())
+
+    def test_cursor_previous_page_returns_first_page(self):
+        """Курсор ?before= возвращает к предыдущей странице."""
+        response = self.guest_client.get(reverse("posts:index") + "?page=2")
+        previous_cursor = response.context.get("page").previous_cursor
+        response = self.guest_client.get(
+            reverse("posts:index") + f"?before={previous_cursor}")
+        page = response.context.get("page")
+        self.assertEqual(len(page), 10)
+        self.assertEqual(page[0].text, "Тестовый пост11")
+        self.assertFalse(page.has_previous())
+
+    def test_cursor_pages_do_not_count_rows(self):
+        """Страница по курсору не выполняет COUNT(*) и OFFSET."""
+        response = self.guest_client.get(reverse("posts:index"))
+        next_cursor = response.context.get("page").next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(
+                reverse("posts:index") + f"?after={next_cursor}")
+        for query in queries.captured_queries:
+            self.assertNotIn("COUNT(*)", query["sql"])
+            self.assertNotIn("OFFSET", query["sql"])
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный курсор отдает первую страницу."""
+        response = self.guest_client.get(reverse("posts:index") + "?after=xx")
+        page = response.context.get("page")
+        self.assertEqual(page[0].text, "Тестовый пост11")
+
+    def test_overflowing_cursor_returns_first_page(self):
+        """
+        Курсор с id больше BIGINT или с датой, которая не переводится в
+        UTC, считается испорченным.
+        """
+        for raw in (f"{timezone.now().isoformat()}|{2 ** 63}",
+                    "9999-12-31T23:59:59-14:00|1",
+                    "0001-01-01T00:00:00+14:00|1"):
+            token = base64.urlsafe_b64encode(raw.encode()).decode()
+            with self.subTest(raw=raw):
+                self.assertIsNone(decode_cursor(token))
+                for url, param in ((reverse("posts:index"), "after"),
+                                   (reverse("api:posts"), "after"),
+                                   (reverse("api:posts"), "before")):
+                    response = self.guest_client.get(url, {param: token})
+                    self.assertEqual(response.status_code, 200)
@@ -0,0 +1,133 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+
+class ListViewsQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username="sergey")
+        cls.reader = User.objects.create_user(username="reader")
+
+        cls.group = Group.objects.create(
+            title="Тестовая группа",
+            slug="testslug",
+            description="testdescription",
+        )
+
+        for i in range(10):
+            post = Post.objects.create(
+                text=f"Тестовый пост{i}",
+                author=cls.user,
+                group=cls.group,
+            )
+            Comment.objects.create(post=post, author=cls.reader,
+                                   text=f"Комментарий{i}")
+
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_list_views_query_count(self):
+        """Число запросов списков постов не зависит от числа постов."""
+        # сессия и пользователь авторизованного клиента читаются из базы
+        # (общего кэша нет) — 2 запроса; index, group_posts и profile —
+        # еще запрос валидаторов ETag
+        views_queries = (
+            (self.guest_client, reverse("posts:index"), 3),
+            (self.guest_client,
+             reverse("posts:group_posts", kwargs={"slug": self.group.slug}),
+             4),
+            (self.guest_client,
+             reverse("posts:profile", kwargs={"username": self.user}), 4),
+            # плюс список авторов без раскладки по лентам (кэш пуст:
+            # отмеченные авторы и подсчет подписчиков), ключи ленты
+            # отдельно от постов, готовые рекомендации и авторы зрителя
+            # для кнопок подписки
+            (self.authorized_client, reverse("posts:follow_index"), 9),
+        )
+        for client, url, queries in views_queries:
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    response = client.get(url)
+                self.assertEqual(len(response.context["page"]), 10)
+
+    def test_feed_page_shared_between_viewers(self):
+        """
+        Страница ленты из кэша не выбирает посты заново, даже для другого
+        зрителя, а кнопки зрителя рисуются по нему.
+        """
+        guest = self.guest_client.get(reverse("posts:index"))
+        self.assertNotContains(guest, "Добавить комментарий")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(reverse("posts:index"))
+        self.assertEqual(len(response.context["page"]), 10)
+        self.assertContains(response, "Добавить комментарий")
+        # ни COUNT(*) страницы, ни выборки постов
+        self.assertFalse([query["sql"] for query in queries.captured_queries
+                          if "COUNT(*)" in query["sql"]
+                          or query["sql"].startswith('SELECT "posts_post"')])
+
+    def test_follow_page_cached_before_queries(self):
+        """Повторный запрос ленты подписок не читает ее из базы."""
+        url = reverse("posts:follow_index")
+        self.authorized_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(url)
+        self.assertEqual(len(response.context["page"]), 10)
+        self.assertFalse([query["sql"] for query in queries.captured_queries
+                          if "posts_timelineentry" in query["sql"]])
+
+    def test_count_query_without_annotations(self):
+        """COUNT(*) страницы не считает комментарии каждого поста."""
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(reverse("posts:index"))
+        count_sql = [query["sql"] for query in queries.captured_queries
+                     if "COUNT(*)" in query["sql"]]
+        self.assertEqual(len(count_sql), 1)
+        self.assertNotIn("posts_comment", count_sql[0])
+
+    def test_comment_count_annotated(self):
+        """Число комментариев приходит в ленту аннотацией."""
+        response = self.guest_client.get(reverse("posts:index"))
+        self.assertEqual(response.context["page"][0].comment_count, 1)
+        self.assertContains(response, "Комментариев: 1")
+
+    def test_post_view_query_count(self):
+        """Страница поста не делает запросов на каждый комментарий."""
+        post = Post.objects.latest("pub_date")
+        Comment.objects.bulk_create(
+            Comment(post=post, author=self.user, text=f"Ответ{i}")
+            for i in range(50))
+        url = reverse("posts:post", kwargs={"username": self.user,
+                                            "post_id": post.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(url)
+        self.assertEqual(len(response.context["comments_page"]), 20)
+        comment_queries = [query["sql"] for query in queries.captured_queries
+                           if query["sql"].startswith(
+                               'SELECT "posts_comment"')]
+        self.assertEqual(len(comment_queries), 1)
+        self.assertIn('JOIN "auth_user"', comment_queries[0])
+
+    def test_post_view_loads_post_and_sidebar_in_one_query(self):
+        """Пост, автор, счетчики и группа — один запрос, комментарии — еще."""
+        post = Post.objects.latest("pub_date")
+        url = reverse("posts:post", kwargs={"username": self.user,
+                                            "post_id": post.pk})
+        # третий запрос — валидаторы ETag
+        with self.assertNumQueries(3):
+            response = self.guest_client.get(url)
+        self.assertContains(response, "Записей: 10")
+        self.assertContains(response, "Подписчиков: 1")
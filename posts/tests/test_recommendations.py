@@ -0,0 +1,114 @@
+from collections import defaultdict
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Follow, Recommendation
+from posts.recommendations import (FOLLOWER_SAMPLE, Recommender,
+                                   recommended_authors)
+
+
+class RecommendationsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        names = ("reader", "friend", "star", "fan1", "fan2", "rising",
+                 "lonely")
+        cls.users = {name: User.objects.create_user(username=name)
+                     for name in names}
+        follows = (
+            # reader -> friend -> star: друг друга
+            ("reader", "friend"), ("friend", "star"),
+            # на friend и rising подписываются вместе
+            ("fan1", "friend"), ("fan1", "rising"),
+            ("fan2", "friend"), ("fan2", "rising"),
+        )
+        for user, author in follows:
+            Follow.objects.create(user=cls.users[user],
+                                  author=cls.users[author])
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.users["reader"])
+
+    def rebuild(self):
+        call_command("recommend_authors", stdout=StringIO())
+
+    def recommended(self, name):
+        return [author.username
+                for author in recommended_authors(self.users[name], 20)]
+
+    def test_friends_and_cofollowed_authors(self):
+        """Рекомендуются авторы друзей и авторы с общими подписчиками."""
+        self.rebuild()
+        recommended = self.recommended("reader")
+        self.assertIn("star", recommended)
+        self.assertIn("rising", recommended)
+        self.assertNotIn("reader", recommended)
+        self.assertNotIn("friend", recommended)
+        # популярные авторы без связи с графом идут после найденных
+        self.assertEqual(set(recommended[:2]), {"star", "rising"})
+
+    def test_follower_sample_is_random_and_repeatable(self):
+        """
+        Выборка подписчиков случайна, а не первые по id, и одинакова при
+        каждом пересчете.
+        """
+        following, followers = defaultdict(set), defaultdict(set)
+        fans = range(1000, 1000 + FOLLOWER_SAMPLE * 2)
+        for fan in fans:
+            following[fan].add(1)
+            followers[1].add(fan)
+        # автора 2 читают только подписчики автора 1 с большими id
+        for fan in fans[FOLLOWER_SAMPLE:]:
+            following[fan].add(2)
+            followers[2].add(fan)
+        similar = Recommender(following, followers, 10).similar_authors(1)
+        self.assertIn(2, similar)
+        self.assertEqual(
+            Recommender(following, followers, 10).similar_authors(1),
+            similar)
+
+    def test_popular_authors_without_follows(self):
+        """Без подписок предлагаются популярные авторы."""
+        self.rebuild()
+        self.assertEqual(self.recommended("lonely")[:2],
+                         ["friend", "rising"])
+
+    def test_rebuild_replaces_rows(self):
+        """Повторный пересчет не дублирует рекомендации."""
+        self.rebuild()
+        count = Recommendation.objects.count()
+        self.rebuild()
+        self.assertEqual(Recommendation.objects.count(), count)
+
+    def test_shown_on_follow_index_and_profile(self):
+        """Рекомендации показываются в ленте подписок и в профиле."""
+        self.rebuild()
+        response = self.client.get(reverse("posts:follow_index"))
+        self.assertContains(response, "Вам могут понравиться")
+        self.assertContains(response, "@rising")
+        response = self.client.get(reverse(
+            "posts:profile", kwargs={"username": "friend"}))
+        self.assertContains(response, "@rising")
+        response = Client().get(reverse(
+            "posts:profile", kwargs={"username": "friend"}))
+        self.assertNotContains(response, "Вам могут понравиться")
+
+    def test_follow_removes_recommendation(self):
+        """После подписки автор пропадает из рекомендаций и профиля."""
+        self.rebuild()
+        url = reverse("posts:profile", kwargs={"username": "friend"})
+        etag = self.client.get(url)["ETag"]
+        self.client.get(reverse("posts:profile_follow",
+                                kwargs={"username": "rising"}))
+        self.assertNotIn("rising", self.recommended("reader"))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "@rising")
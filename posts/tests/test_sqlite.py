@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from yatube.sqlite.base import DatabaseWrapper
+
+
+class TunedSQLiteTest(SimpleTestCase):
+    def test_pragmas_applied_on_connect(self):
+        """Каждое новое соединение включает WAL и остальные PRAGMA."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper = DatabaseWrapper({
+            "ENGINE": "yatube.sqlite",
+            "NAME": os.path.join(directory.name, "db.sqlite3"),
+            "USER": "", "PASSWORD": "", "HOST": "", "PORT": "",
+            "OPTIONS": {}, "TIME_ZONE": None, "CONN_MAX_AGE": 0,
+            "AUTOCOMMIT": True, "ATOMIC_REQUESTS": False,
+        })
+        # сырое соединение sqlite3 без cursor(): SimpleTestCase запрещает
+        # запросы через обертки Django
+        conn = wrapper.get_new_connection(wrapper.get_connection_params())
+        self.addCleanup(conn.close)
+        for pragma, expected in (("journal_mode", "wal"),
+                                 ("synchronous", 1),
+                                 ("busy_timeout", 5000)):
+            with self.subTest(pragma=pragma):
+                value = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+                self.assertEqual(value, expected)
@@ -0,0 +1,288 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts import images, uploads
+from posts.models import Post, StoredImage
+from posts.storage import image_storage
+
+
+def jpeg(size, orientation=None):
+    image = Image.new("RGB", size, "red")
+    exif = Image.Exif()
+    exif[0x010F] = "Камера"
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=settings.MEDIA_ROOT, THUMBNAIL_WORKERS=0,
+                   UPLOAD_MAX_SIZE="200x200")
+class UploadsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        settings.MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        cls.user = User.objects.create_user(username="sergey")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        shutil.rmtree(default_storage.path(uploads.STAGING_DIR),
+                      ignore_errors=True)
+
+    def staging_files(self):
+        path = default_storage.path(uploads.STAGING_DIR)
+        return os.listdir(path) if os.path.isdir(path) else []
+
+    def test_process_image_strips_exif_and_downscales(self):
+        """Картинка повернута по EXIF, уменьшена и сохранена без EXIF."""
+        source = os.path.join(settings.MEDIA_ROOT, "photo.jpg")
+        target = os.path.join(settings.MEDIA_ROOT, "photo.out")
+        with open(source, "wb") as file:
+            file.write(jpeg((600, 300), orientation=6))
+        extension = uploads.process_image(source, target, "200x200")
+        self.assertEqual(extension, ".jpg")
+        with Image.open(target) as image:
+            self.assertEqual(image.format, "JPEG")
+            self.assertEqual(image.size, (100, 200))
+            self.assertNotIn("exif", image.info)
+
+    def test_process_image_keeps_transparency(self):
+        """Картинка с прозрачностью остается PNG."""
+        source = os.path.join(settings.MEDIA_ROOT, "logo.png")
+        target = os.path.join(settings.MEDIA_ROOT, "logo.out")
+        Image.new("RGBA", (10, 10), (0, 0, 0, 0)).save(source, "PNG")
+        self.assertEqual(uploads.process_image(source, target, "200x200"),
+                         ".png")
+        with Image.open(target) as image:
+            self.assertEqual(image.mode, "RGBA")
+
+    def test_new_post_image_set_after_processing(self):
+        """Пост сохраняется сразу, картинка появляется после обработки."""
+        self.client.post(reverse("posts:new_post"), {
+            "text": "С фото",
+            "image": SimpleUploadedFile("photo.jpg", jpeg((600, 300)),
+                                        content_type="image/jpeg"),
+        })
+        post = Post.objects.get(text="С фото")
+        self.assertFalse(post.image)
+        staged = self.staging_files()
+        self.assertEqual(len(staged), 1)
+
+        name = uploads.process(post.pk, f"{uploads.STAGING_DIR}/{staged[0]}",
+                               "photo.jpg")
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, name)
+        self.assertTrue(name.startswith("posts/"))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (200, 100))
+        self.assertEqual(self.staging_files(), [])
+
+    def test_edit_keeps_old_image_until_processed(self):
+        """При правке старая картинка видна, пока новая обрабатывается."""
+        post = Post.objects.create(
+            text="Старое фото", author=self.user,
+            image=ContentFile(jpeg((50, 50)), name="old.jpg"))
+        old_name = post.image.name
+        self.client.post(reverse("posts:post_edit", kwargs={
+            "username": self.user.username, "post_id": post.pk}), {
+            "text": "Новое фото",
+            "image": SimpleUploadedFile("new.jpg", jpeg((60, 60)),
+                                        content_type="image/jpeg"),
+        })
+        post.refresh_from_db()
+        self.assertEqual(post.text, "Новое фото")
+        self.assertEqual(post.image.name, old_name)
+
+    def test_earlier_upload_does_not_overwrite_later_edit(self):
+        """Загрузка, обработанная позже следующей правки, отбрасывается."""
+        post = Post.objects.create(text="Без фото", author=self.user)
+        url = reverse("posts:post_edit", kwargs={
+            "username": self.user.username, "post_id": post.pk})
+        with mock.patch.object(uploads, "schedule"):
+            for name, size in (("first.jpg", (60, 60)),
+                               ("second.jpg", (70, 70))):
+                self.client.post(url, {
+                    "text": name,
+                    "image": SimpleUploadedFile(name, jpeg(size),
+                                                content_type="image/jpeg"),
+                })
+                post.refresh_from_db()
+                staged = post.image_upload
+                if name == "first.jpg":
+                    first = staged
+        second = uploads.process(post.pk, staged, "second.jpg")
+        self.assertIsNone(uploads.process(post.pk, first, "first.jpg"))
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, second)
+        self.assertEqual(post.image_upload, "")
+        self.assertEqual(StoredImage.objects.get(name=second).refs, 1)
+        self.assertFalse(StoredImage.objects.exclude(name=second).filter(
+            refs__gt=0).exists())
+        self.assertEqual(self.staging_files(), [])
+
+    def test_cleared_image_drops_pending_upload(self):
+        """Загрузка, обработанная после удаления картинки, отбрасывается."""
+        post = Post.objects.create(
+            text="Старое фото", author=self.user,
+            image=ContentFile(jpeg((50, 50)), name="old.jpg"))
+        url = reverse("posts:post_edit", kwargs={
+            "username": self.user.username, "post_id": post.pk})
+        with mock.patch.object(uploads, "schedule"):
+            self.client.post(url, {
+                "text": "Новое фото",
+                "image": SimpleUploadedFile("new.jpg", jpeg((60, 60)),
+                                            content_type="image/jpeg"),
+            })
+        post.refresh_from_db()
+        staged = post.image_upload
+        self.assertTrue(staged)
+
+        self.client.post(url, {"text": "Без фото", "image-clear": "on"})
+        post.refresh_from_db()
+        self.assertFalse(post.image)
+        self.assertEqual(post.image_upload, "")
+        self.assertIsNone(uploads.process(post.pk, staged, "new.jpg"))
+        post.refresh_from_db()
+        self.assertFalse(post.image)
+        self.assertEqual(self.staging_files(), [])
+
+    def test_broken_upload_leaves_post_unchanged(self):
+        """Битый файл не попадает в пост и удаляется из staging."""
+        post = Post.objects.create(text="Без фото", author=self.user)
+        staged = default_storage.save(f"{uploads.STAGING_DIR}/broken.jpg",
+                                      ContentFile(jpeg((60, 60))[:100]))
+        with self.assertRaises(OSError):
+            uploads.process(post.pk, staged, "broken.jpg")
+        post.refresh_from_db()
+        self.assertFalse(post.image)
+        self.assertEqual(self.staging_files(), [])
+
+
+@override_settings(MEDIA_ROOT=settings.MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ImageStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        settings.MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        cls.user = User.objects.create_user(username="sergey")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        # файлы удаляются после коммита, которого в TestCase нет
+        patcher = mock.patch("django.db.transaction.on_commit",
+                             lambda func: func())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_post(self, content, name="photo.jpg"):
+        return Post.objects.create(text="Фото", author=self.user,
+                                   image=ContentFile(content, name=name))
+
+    def test_file_named_by_content_hash(self):
+        """Файл лежит в подкаталогах по первым байтам хэша содержимого."""
+        post = self.create_post(jpeg((20, 20)))
+        directory, first, second, filename = post.image.name.split("/")
+        self.assertEqual(directory, "posts")
+        self.assertEqual(filename[:2] + filename[2:4], first + second)
+        self.assertTrue(filename.endswith(".jpg"))
+
+    def test_identical_uploads_share_file(self):
+        """Одинаковые картинки хранятся одним файлом со счетчиком ссылок."""
+        content = jpeg((20, 20))
+        first = self.create_post(content, "one.jpg")
+        second = self.create_post(content, "two.JPG")
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(StoredImage.objects.get(
+            name=first.image.name).refs, 2)
+
+    def test_file_deleted_with_last_reference(self):
+        """Файл и миниатюры удаляются вместе с последней ссылкой на них."""
+        content = jpeg((20, 20))
+        first = self.create_post(content)
+        second = self.create_post(content)
+        path = first.image.path
+        thumbnail_path = Post.objects.get(pk=first.pk).thumbnail.path
+        self.assertTrue(os.path.exists(thumbnail_path))
+
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(thumbnail_path))
+        self.assertFalse(StoredImage.objects.exists())
+
+    def test_edit_releases_old_file(self):
+        """Смена картинки освобождает старый файл."""
+        post = self.create_post(jpeg((20, 20)))
+        old_path = post.image.path
+        post.image = ContentFile(jpeg((30, 30)), name="new.jpg")
+        post.save()
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(
+            list(StoredImage.objects.values_list("name", "refs")),
+            [(post.image.name, 1)])
+
+    def test_reference_taken_before_file_written(self):
+        """
+        Файл без ссылок, удаляемый одновременно с новой загрузкой той же
+        картинки, остается: ссылка берется до записи файла.
+        """
+        content = jpeg((20, 20))
+        old = self.create_post(content)
+        name = old.image.name
+        post = Post.objects.create(text="Без фото", author=self.user,
+                                   image_upload="posts/staging/race")
+        StoredImage.objects.filter(name=name).update(refs=0)
+        Post.objects.filter(pk=old.pk).update(image="")
+        save_content = image_storage.save_content
+
+        def delete_then_save(*args):
+            # сборщик успевает между проверкой ссылок и записью файла
+            images.delete_if_unused(name)
+            return save_content(*args)
+
+        default_storage.save("posts/staging/race.out", ContentFile(content))
+        with mock.patch.object(image_storage, "save_content",
+                               delete_then_save):
+            stored = uploads.store_image(post.pk, "posts/staging/race",
+                                         "photo.jpg", ".jpg")
+        self.assertEqual(stored, name)
+        self.assertTrue(image_storage.exists(name))
+        self.assertEqual(StoredImage.objects.get(name=name).refs, 1)
+
+    def test_collect_images_removes_orphans(self):
+        """collect_images пересчитывает ссылки и удаляет лишние файлы."""
+        post = self.create_post(jpeg((20, 20)))
+        orphan = image_storage.save("posts/orphan.jpg",
+                                    ContentFile(jpeg((40, 40))))
+        StoredImage.objects.all().delete()
+        out = StringIO()
+        call_command("collect_images", min_age=0, stdout=out)
+        self.assertIn("неизвестных файлов: 1", out.getvalue())
+        self.assertFalse(image_storage.exists(orphan))
+        self.assertTrue(image_storage.exists(post.image.name))
+        self.assertEqual(StoredImage.objects.get().refs, 1)
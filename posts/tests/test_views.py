@@ -1,15 +1,24 @@
 import shutil
 import tempfile
+import time
+import warnings
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
-from posts.models import Follow, Group, Post
+from yatube.settings import COMMENTS_PAG_CONST
+
+from posts.models import Comment, Follow, Group, Post, TimelineEntry, UserStats
+from posts.stats import change_stats
+from posts.timeline import Timeline
 
 
 @override_settings(MEDIA_ROOT=settings.MEDIA_ROOT)
@@ -73,6 +82,7 @@ class PostsViewsTests(TestCase):
         super().tearDownClass()
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client2 = Client()
@@ -135,14 +145,49 @@ class PostsViewsTests(TestCase):
         """Проверка работы кеша главной страницы"""
         response = self.authorized_client.get(reverse('posts:index'))
         cached_response_content = response.content
-        post = Post.objects.all().last()
-        post.delete()
+        # update() не посылает сигналов, поэтому кэш не сбрасывается
+        Post.objects.filter(id=self.post.id).update(text="Текст изменен")
         response = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(cached_response_content, response.content)
         cache.clear()
         response = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(cached_response_content, response.content)
 
+    def test_cache_index_page_invalidated_on_delete(self):
+        """Удаленный пост сразу пропадает из кеша главной страницы"""
+        response = self.authorized_client.get(reverse('posts:index'))
+        cached_response_content = response.content
+        Post.objects.all().last().delete()
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotEqual(cached_response_content, response.content)
+
+    def test_cache_index_page_per_page(self):
+        """Каждая страница главной кешируется отдельно"""
+        for i in range(10):
+            Post.objects.create(text=f"Пост {i}", author=self.user2)
+        first_page = self.guest_client.get(reverse('posts:index'))
+        second_page = self.guest_client.get(reverse('posts:index') + '?page=2')
+        self.assertNotEqual(first_page.content, second_page.content)
+        self.assertContains(second_page, self.post.text)
+
+    def test_cache_index_page_key_from_position(self):
+        """Одна страница главной хранится в кеше одной копией"""
+        response = self.guest_client.get(reverse('posts:index'))
+        cached_response_content = response.content
+        Post.objects.filter(id=self.post.id).update(text="Текст изменен")
+        for query in ('?page=1', '?page=abc%20def', '?page=-3',
+                      '?after=broken'):
+            with self.subTest(query=query):
+                with warnings.catch_warnings():
+                    warnings.simplefilter('error', CacheKeyWarning)
+                    response = self.guest_client.get(
+                        reverse('posts:index') + query)
+                self.assertEqual(cached_response_content, response.content)
+        # номер за последней страницей не кешируется
+        self.guest_client.get(reverse('posts:index') + '?page=100')
+        self.assertEqual(
+            len([key for key in cache._cache if 'feed_page' in key]), 1)
+
     def test_views_uses_correct_templates(self):
         """URL-адреса используют соответствующие шаблоны."""
         templates_path_names = {
@@ -280,3 +325,297 @@ class PostsViewsTests(TestCase):
                                        "post_id": self.post.id}))
         field = response.context["post"].text
         self.assertEqual(field, self.post.text)
+
+    def test_timeline_follow_unfollow(self):
+        """Лента подписок заполняется при подписке и чистится при отписке."""
+        Post.objects.create(text="Пост второго автора", author=self.user2)
+        self.authorized_client.get(reverse('posts:profile_follow',
+                                   kwargs={'username': self.user2}))
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post__author=self.user2).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context["page"][0].text,
+                         "Пост второго автора")
+
+        self.authorized_client.get(reverse('posts:profile_unfollow',
+                                   kwargs={'username': self.user2}))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context["page"]), 0)
+
+    def test_timeline_fan_out_on_write(self):
+        """Новый пост сразу раскладывается в ленты подписчиков."""
+        post = Post.objects.create(text="Новый пост", author=self.user)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user2, post=post).exists())
+
+    def test_timeline_fan_out_on_read(self):
+        """Посты популярных авторов читаются на лету, без раскладки."""
+        self.addCleanup(cache.clear)
+        with mock.patch("posts.timeline.TIMELINE_FANOUT_LIMIT", 0):
+            cache.clear()
+            post = Post.objects.create(text="Пост звезды", author=self.user)
+            self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+            response = self.authorized_client2.get(
+                reverse('posts:follow_index'))
+        self.assertEqual(response.context["page"][0].text, "Пост звезды")
+
+    def test_timeline_refilled_when_author_leaves_fan_out_on_read(self):
+        """
+        Автор, которого снова раскладывают по лентам, не теряет посты,
+        вышедшие, пока его читали на лету.
+        """
+        self.addCleanup(cache.clear)
+        fans = [User.objects.create_user(username=f"fan{i}")
+                for i in range(2)]
+        for fan in fans:
+            Follow.objects.create(user=fan, author=self.user)
+        with mock.patch("posts.timeline.TIMELINE_FANOUT_LIMIT", 2):
+            cache.clear()
+            Post.objects.create(text="Пост звезды", author=self.user)
+            self.assertTrue(UserStats.objects.get(
+                user=self.user).fanout_on_read)
+            Follow.objects.filter(author=self.user, user__in=fans).delete()
+            cache.clear()
+            response = self.authorized_client2.get(
+                reverse('posts:follow_index'))
+        self.assertFalse(UserStats.objects.get(user=self.user).fanout_on_read)
+        self.assertEqual(response.context["page"][0].text, "Пост звезды")
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user2, post__text="Пост звезды").exists())
+
+    def test_timeline_fan_out_on_read_keeps_author_near_limit(self):
+        """Автор чуть ниже порога остается с fan-out on read."""
+        self.addCleanup(cache.clear)
+        fan = User.objects.create_user(username="fan")
+        Follow.objects.create(user=fan, author=self.user)
+        with mock.patch("posts.timeline.TIMELINE_FANOUT_LIMIT", 1):
+            cache.clear()
+            Post.objects.create(text="Пост звезды", author=self.user)
+            Follow.objects.filter(user=fan).delete()
+            cache.clear()
+            response = self.authorized_client2.get(
+                reverse('posts:follow_index'))
+        self.assertTrue(UserStats.objects.get(user=self.user).fanout_on_read)
+        self.assertEqual(response.context["page"][0].text, "Пост звезды")
+
+    def test_timeline_count_capped_for_fan_out_on_read(self):
+        """Посты авторов с fan-out on read считаются до TIMELINE_LENGTH."""
+        self.addCleanup(cache.clear)
+        with mock.patch("posts.timeline.TIMELINE_FANOUT_LIMIT", 0), \
+                mock.patch("posts.timeline.TIMELINE_LENGTH", 2):
+            cache.clear()
+            for i in range(3):
+                Post.objects.create(text=f"Пост {i}", author=self.user)
+            entries = TimelineEntry.objects.filter(user=self.user2).count()
+            self.assertEqual(Timeline(self.user2).count(), entries + 2)
+
+    def test_timeline_trimmed_on_fan_out(self):
+        """Раскладка нового поста обрезает ленту до TIMELINE_LENGTH."""
+        with mock.patch("posts.timeline.TIMELINE_LENGTH", 2):
+            for i in range(3):
+                Post.objects.create(text=f"Пост {i}", author=self.user)
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(user=self.user2).order_by(
+                "-pub_date").values_list("post__text", flat=True)),
+            ["Пост 2", "Пост 1"])
+
+    def test_timeline_cursor_pages(self):
+        """Лента подписок листается курсором без пропусков и повторов."""
+        for i in range(12):
+            Post.objects.create(text=f"Пост {i}", author=self.user)
+        url = reverse("posts:follow_index")
+        first = self.authorized_client2.get(url).context["page"]
+        second = self.authorized_client2.get(
+            url, {"after": first.next_cursor}).context["page"]
+        back = self.authorized_client2.get(
+            url, {"before": second.previous_cursor}).context["page"]
+        self.assertEqual(len(first) + len(second), 13)
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(list(back), list(first))
+
+    def test_search_posts_and_comments(self):
+        """Поиск находит посты по тексту поста и его комментариев."""
+        other = Post.objects.create(text="Про котиков", author=self.user2)
+        Comment.objects.create(post=self.post, author=self.user2,
+                               text="Котики лучше собак")
+        response = self.guest_client.get(reverse("posts:search"),
+                                         {"q": "котик"})
+        found = list(response.context["page"])
+        self.assertEqual(set(found), {self.post, other})
+        response = self.guest_client.get(reverse("posts:search"),
+                                         {"q": "собак"})
+        self.assertEqual(list(response.context["page"]), [self.post])
+
+    def test_search_index_follows_edit_and_delete(self):
+        """Индекс поиска обновляется при правке и удалении поста."""
+        post = Post.objects.create(text="Старый текст", author=self.user2)
+        post.text = "Новый текст"
+        post.save()
+        response = self.guest_client.get(reverse("posts:search"),
+                                         {"q": "старый"})
+        self.assertEqual(len(response.context["page"]), 0)
+        post.delete()
+        response = self.guest_client.get(reverse("posts:search"),
+                                         {"q": "новый"})
+        self.assertEqual(len(response.context["page"]), 0)
+
+    def test_comments_paginated_by_cursor(self):
+        """Комментарии выводятся пачками, остальные — по фрагменту."""
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.user2, text=f"Коммент {i}")
+            for i in range(COMMENTS_PAG_CONST + 5))
+        kwargs = {"username": self.user.username, "post_id": self.post.id}
+        response = self.guest_client.get(reverse("posts:post", kwargs=kwargs))
+        first = response.context["comments_page"]
+        self.assertEqual(len(first), COMMENTS_PAG_CONST)
+        self.assertEqual(first[0].text, f"Коммент {COMMENTS_PAG_CONST + 4}")
+
+        url = reverse("posts:post_comments", kwargs=kwargs)
+        response = self.guest_client.get(url, {"after": first.next_cursor})
+        self.assertTemplateUsed(response, "comment_list.html")
+        self.assertEqual(
+            [item.text for item in response.context["comments_page"]],
+            [f"Коммент {i}" for i in range(4, -1, -1)])
+        self.assertNotContains(response, "js-more-comments")
+
+        response = self.guest_client.get(
+            url, {"after": first.next_cursor, "format": "json"})
+        data = response.json()
+        self.assertEqual(len(data["comments"]), 5)
+        self.assertEqual(data["comments"][0]["author"], self.user2.username)
+        self.assertIsNone(data["next_cursor"])
+
+    def test_comments_fragment_unknown_post(self):
+        """Фрагмент комментариев чужого или несуществующего поста — 404."""
+        response = self.guest_client.get(reverse(
+            "posts:post_comments",
+            kwargs={"username": self.user2.username, "post_id": self.post.id}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_conditional_get(self):
+        """Неизменившиеся страницы отдаются ответом 304 без рендеринга."""
+        urls = (
+            reverse("posts:index"),
+            reverse("posts:group_posts", kwargs={"slug": self.group.slug}),
+            reverse("posts:profile", kwargs={"username": self.user}),
+            reverse("posts:post", kwargs={"username": self.user,
+                                          "post_id": self.post.id}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                etag = response["ETag"]
+                response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(response.content)
+                response = self.guest_client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+                self.assertEqual(response.status_code, 304)
+
+                Comment.objects.create(post=self.post, author=self.user2,
+                                       text="Новый комментарий")
+                response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get_per_viewer(self):
+        """ETag зависит от зрителя: у гостя и автора разные страницы."""
+        url = reverse("posts:profile", kwargs={"username": self.user})
+        etag = self.guest_client.get(url)["ETag"]
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get_scope_expires(self):
+        """
+        Метка изменения страницы живет SCOPE_CACHE_TIMEOUT: правка, о
+        которой этот процесс не узнал, меняет ETag не позже.
+        """
+        url = reverse("posts:post", kwargs={"username": self.user,
+                                            "post_id": self.post.id})
+        etag = self.guest_client.get(url)["ETag"]
+        # правка в другом процессе: сигналы здесь не срабатывают
+        Post.objects.filter(pk=self.post.pk).update(
+            text="Текст изменен", updated=timezone.now())
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        later = time.time() + settings.SCOPE_CACHE_TIMEOUT + 1
+        with mock.patch("django.core.cache.backends.locmem.time.time",
+                        return_value=later):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Текст изменен")
+
+    def test_conditional_get_group_change(self):
+        """Пост, перенесенный в другую группу, меняет ETag старой группы."""
+        url = reverse("posts:group_posts", kwargs={"slug": self.group.slug})
+        etag = self.guest_client.get(url)["ETag"]
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = self.group2
+        post.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_card_cached_until_edit(self):
+        """Карточка поста берется из кэша, правка поста сбрасывает ее."""
+        self.guest_client.get(reverse("posts:profile",
+                                      kwargs={"username": self.user}))
+        # update() не меняет время изменения: в ленте старая карточка
+        Post.objects.filter(pk=self.post.pk).update(text="Тихая правка")
+        response = self.guest_client.get(reverse(
+            "posts:group_posts", kwargs={"slug": self.group.slug}))
+        self.assertNotContains(response, "Тихая правка")
+
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = "Новый текст"
+        post.save()
+        response = self.guest_client.get(reverse(
+            "posts:group_posts", kwargs={"slug": self.group.slug}))
+        self.assertContains(response, "Новый текст")
+
+    def test_post_card_viewer_parts_not_cached(self):
+        """Кнопка правки видна только автору, хотя карточка общая."""
+        url = reverse("posts:group_posts", kwargs={"slug": self.group.slug})
+        edit_url = reverse("posts:post_edit", kwargs={
+            "username": self.user.username, "post_id": self.post.pk})
+        self.assertContains(self.authorized_client.get(url), edit_url)
+        self.assertNotContains(self.authorized_client2.get(url), edit_url)
+        self.assertNotContains(self.guest_client.get(url), edit_url)
+
+    def test_author_card_shared_and_invalidated(self):
+        """Карточка автора общая для профиля и поста, подписка ее сбросит."""
+        profile_url = reverse("posts:profile", kwargs={"username": self.user})
+        post_url = reverse("posts:post", kwargs={
+            "username": self.user.username, "post_id": self.post.pk})
+        self.assertContains(self.guest_client.get(profile_url),
+                            "Подписчиков: 1")
+        # счетчик изменен мимо сигналов: страница поста берет карточку из кэша
+        UserStats.objects.filter(user=self.user).update(followers_count=5)
+        self.assertContains(self.guest_client.get(post_url),
+                            "Подписчиков: 1")
+
+        # карточка забывается после коммита, которого в TestCase нет
+        with mock.patch("django.db.transaction.on_commit",
+                        lambda func: func()):
+            self.authorized_client2.get(reverse(
+                "posts:profile_unfollow", kwargs={"username": self.user}))
+        self.assertContains(self.guest_client.get(post_url),
+                            "Подписчиков: 4")
+
+    def test_author_card_forgotten_after_commit(self):
+        """Карточка забывается после коммита, а не до UPDATE счетчиков."""
+        with mock.patch("django.db.transaction.on_commit") as on_commit:
+            change_stats(self.user.pk, posts_count=1)
+        on_commit.assert_called_once()
+        with mock.patch("posts.stats.forget_author_cards") as forget:
+            on_commit.call_args[0][0]()
+        forget.assert_called_once_with(self.user.pk)
+
+    def test_author_card_follow_button_only_in_profile(self):
+        """Кнопка подписки не попадает в общую карточку автора."""
+        follow_url = reverse("posts:profile_unfollow",
+                             kwargs={"username": self.user})
+        self.assertContains(self.authorized_client2.get(reverse(
+            "posts:profile", kwargs={"username": self.user})), follow_url)
+        self.assertNotContains(self.authorized_client2.get(reverse(
+            "posts:post", kwargs={"username": self.user.username,
+                                  "post_id": self.post.pk})), follow_url)
@@ -0,0 +1,136 @@
+"""
+Миниатюры картинок постов готовятся заранее, в пуле процессов.
+
+После сохранения поста с новой картинкой ее уменьшенные копии всех
+размеров из POST_THUMBNAIL_SIZES считаются вне запроса, а путь к
+карточке ленты записывается в Post.thumbnail. Шаблоны берут готовый
+адрес и не ресайзят картинку во время рендеринга.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def parse_size(size):
+    width, height = size.split("x")
+    return int(width), int(height)
+
+
+def thumbnail_name(image_name, size):
+    """
+    Имя миниатюры в хранилище: posts/thumbs/<размер>/<путь картинки>.jpg.
+    Путь берется целиком, с каталогами и расширением, чтобы у
+    posts/cat.png и posts/cat.jpg или одноименных файлов в разных
+    каталогах миниатюры не совпали.
+    """
+    path = image_name[len("posts/"):] if image_name.startswith(
+        "posts/") else image_name
+    return f"posts/thumbs/{size}/{path}.jpg"
+
+
+def render_thumbnails(source_path, targets, quality=85):
+    """
+    Пишет миниатюры картинки source_path: targets — пары (путь, размер).
+    Картинка обрезается по центру и при необходимости увеличивается,
+    как {% thumbnail ... crop="center" upscale=True %}.
+    Выполняется в дочернем процессе, поэтому работает только с файлами.
+    """
+    with Image.open(source_path) as image:
+        image = image.convert("RGB")
+        for path, size in targets:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            thumb = ImageOps.fit(image, parse_size(size),
+                                 method=Image.LANCZOS)
+            thumb.save(path, "JPEG", quality=quality)
+    return [path for path, size in targets]
+
+
+def thumbnail_targets(image_name):
+    return [(default_storage.path(thumbnail_name(image_name, size)), size)
+            for size in settings.POST_THUMBNAIL_SIZES.values()]
+
+
+def card_thumbnail_name(image_name):
+    return thumbnail_name(image_name, settings.POST_THUMBNAIL_SIZES["card"])
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS)
+    return _executor
+
+
+def store_thumbnail(post_id, image_name):
+    """Записывает готовую карточку посту, если картинка не сменилась."""
+    from .caching import bump_feed_generation, post_scopes, touch_scopes
+    from .models import Post
+
+    posts = Post.objects.filter(pk=post_id, image=image_name)
+    posts.update(thumbnail=card_thumbnail_name(image_name),
+                 updated=timezone.now())
+    bump_feed_generation()
+    for author_id, group_id in posts.values_list("author_id", "group_id"):
+        touch_scopes(*post_scopes(post_id, author_id, group_id))
+
+
+def _on_done(post_id, image_name):
+    def callback(future):
+        try:
+            future.result()
+            store_thumbnail(post_id, image_name)
+        except Exception:
+            logger.exception("Не удалось сделать миниатюры для %s",
+                             image_name)
+        finally:
+            connection.close()
+    return callback
+
+
+def generate(post_id, image_name):
+    """Готовит миниатюры сразу, в текущем процессе."""
+    render_thumbnails(default_storage.path(image_name),
+                      thumbnail_targets(image_name),
+                      settings.THUMBNAIL_QUALITY)
+    store_thumbnail(post_id, image_name)
+
+
+def schedule(post):
+    """
+    Ставит миниатюры поста в очередь пула после коммита транзакции.
+    При THUMBNAIL_WORKERS = 0 они готовятся синхронно. Картинки хранятся
+    по хэшу содержимого, поэтому готовые миниатюры файла не пересчитываются.
+    """
+    post_id, image_name = post.pk, post.image.name
+
+    def submit():
+        try:
+            if all(os.path.exists(path)
+                   for path, size in thumbnail_targets(image_name)):
+                # та же картинка уже есть у другого поста
+                store_thumbnail(post_id, image_name)
+                return
+            if not settings.THUMBNAIL_WORKERS:
+                generate(post_id, image_name)
+                return
+            future = get_executor().submit(
+                render_thumbnails, default_storage.path(image_name),
+                thumbnail_targets(image_name), settings.THUMBNAIL_QUALITY)
+        except Exception:
+            logger.exception("Не удалось сделать миниатюры для %s",
+                             image_name)
+            return
+        future.add_done_callback(_on_done(post_id, image_name))
+
+    transaction.on_commit(submit)
@@ -0,0 +1,336 @@
+"""
+Материализованная лента подписок (fan-out on write).
+
+Новый пост сразу раскладывается по лентам подписчиков автора, поэтому
+/follow/ читает только свои записи TimelineEntry диапазоном по индексу
+(user, -pub_date, -post) вместо JOIN подписок и постов. Авторы с очень
+большим числом подписчиков не раскладываются: их посты подмешиваются в
+ленту при чтении (fan-out on read). Такие авторы отмечены в UserStats;
+автор, у которого подписчиков стало заметно меньше, отметку теряет, и
+ленты его подписчиков собираются заново.
+"""
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+from yatube.settings import (TIMELINE_FANOUT_LIMIT,
+                             TIMELINE_FANOUT_ON_READ_TIMEOUT, TIMELINE_LENGTH)
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .paginators import CursorPaginator
+
+FANOUT_ON_READ_KEY = "posts:timeline:fanout_on_read"
+# столько пользователей пересобирается одним запросом; id идут
+# параметрами, а SQLite ограничивает их число
+REBUILD_BATCH_SIZE = 500
+# отмеченный автор остается с fan-out on read, пока подписчиков больше
+# этой доли TIMELINE_FANOUT_LIMIT: у границы он не переключается туда
+# и обратно с пересборкой лент подписчиков каждый раз
+FANOUT_ON_READ_KEEP = 0.8
+
+
+def _set_fanout_on_read(author_ids, value):
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=author_id) for author_id in author_ids],
+        ignore_conflicts=True,
+    )
+    UserStats.objects.filter(user_id__in=author_ids).update(
+        fanout_on_read=value)
+
+
+def refresh_fanout_on_read(refill=True):
+    """
+    Пересчитывает авторов с fan-out on read. Снятым с отметки авторам
+    ленты подписчиков собираются заново (если refill): иначе их посты,
+    вышедшие за время отметки, пропали бы из лент.
+    """
+    keep = int(TIMELINE_FANOUT_LIMIT * FANOUT_ON_READ_KEEP)
+    marked = set(UserStats.objects.filter(
+        fanout_on_read=True).values_list("user_id", flat=True))
+    authors = {
+        author_id for author_id, followers in Follow.objects.values(
+            "author").annotate(followers=Count("id")).filter(
+            followers__gt=keep).values_list("author", "followers")
+        if followers > TIMELINE_FANOUT_LIMIT or author_id in marked
+    }
+    added, dropped = authors - marked, marked - authors
+    if added or dropped:
+        with transaction.atomic():
+            _set_fanout_on_read(added, True)
+            _set_fanout_on_read(dropped, False)
+    cache.set(FANOUT_ON_READ_KEY, authors, TIMELINE_FANOUT_ON_READ_TIMEOUT)
+    if dropped and refill:
+        _rebuild(sorted(followers_of(dropped)), authors)
+    return authors
+
+
+def fanout_on_read_authors():
+    """Авторы, чьи посты не раскладываются по лентам подписчиков."""
+    authors = cache.get(FANOUT_ON_READ_KEY)
+    if authors is None:
+        authors = refresh_fanout_on_read()
+    return authors
+
+
+def _mark_fanout_on_read(author_id):
+    authors = fanout_on_read_authors()
+    authors.add(author_id)
+    _set_fanout_on_read([author_id], True)
+    cache.set(FANOUT_ON_READ_KEY, authors, TIMELINE_FANOUT_ON_READ_TIMEOUT)
+
+
+def fan_out_post(post):
+    """Кладет новый пост в ленты всех подписчиков автора."""
+    if post.author_id in fanout_on_read_authors():
+        return
+    followers = list(
+        Follow.objects.filter(author_id=post.author_id).values_list(
+            "user_id", flat=True)[:TIMELINE_FANOUT_LIMIT + 1]
+    )
+    if len(followers) > TIMELINE_FANOUT_LIMIT:
+        _mark_fanout_on_read(post.author_id)
+        return
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers],
+        ignore_conflicts=True,
+    )
+    trim_many(followers)
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты нового автора и обрезает ее."""
+    if author_id in fanout_on_read_authors():
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        "-pub_date").values_list("id", "pub_date")[:TIMELINE_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts],
+        ignore_conflicts=True,
+    )
+    trim(user_id)
+
+
+def trim(user_id):
+    """Оставляет в ленте только TIMELINE_LENGTH самых свежих записей."""
+    oldest_kept = TimelineEntry.objects.filter(user_id=user_id).order_by(
+        "-pub_date", "-post_id").values_list("pub_date", "post_id")[
+        TIMELINE_LENGTH - 1:TIMELINE_LENGTH]
+    oldest_kept = list(oldest_kept)
+    if not oldest_kept:
+        return
+    pub_date, post_id = oldest_kept[0]
+    TimelineEntry.objects.filter(user_id=user_id).filter(
+        Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, post_id__lt=post_id)
+    ).delete()
+
+
+def _chunks(ids, size=REBUILD_BATCH_SIZE):
+    chunk = []
+    for pk in ids:
+        chunk.append(pk)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def followers_of(author_ids):
+    """Подписчики авторов author_ids."""
+    followers = set()
+    for chunk in _chunks(author_ids):
+        followers.update(Follow.objects.filter(
+            author_id__in=chunk).values_list("user_id", flat=True))
+    return followers
+
+
+def _fill(user_ids, on_read):
+    """
+    Одним INSERT ... SELECT кладет в ленты user_ids по TIMELINE_LENGTH
+    свежих постов их авторов, кроме авторов on_read.
+    """
+    skip = ""
+    params = list(user_ids)
+    if on_read:
+        skip = f"AND f.author_id NOT IN ({', '.join(['%s'] * len(on_read))})"
+        params += list(on_read)
+    sql = f"""
+        INSERT INTO {TimelineEntry._meta.db_table} (user_id, post_id, pub_date)
+        SELECT user_id, post_id, pub_date FROM (
+            SELECT f.user_id AS user_id, p.id AS post_id,
+                   p.pub_date AS pub_date,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY f.user_id
+                       ORDER BY p.pub_date DESC, p.id DESC
+                   ) AS position
+            FROM {Follow._meta.db_table} f
+            JOIN {Post._meta.db_table} p ON p.author_id = f.author_id
+            WHERE f.user_id IN ({', '.join(['%s'] * len(user_ids))}) {skip}
+        ) ranked
+        WHERE position <= %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [TIMELINE_LENGTH])
+
+
+def trim_many(user_ids):
+    """
+    trim() для многих пользователей: на каждую пачку один DELETE
+    записей, которые не входят в TIMELINE_LENGTH самых свежих.
+    """
+    table = TimelineEntry._meta.db_table
+    for chunk in _chunks(user_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                DELETE FROM {table} WHERE id IN (
+                    SELECT id FROM (
+                        SELECT id, ROW_NUMBER() OVER (
+                            PARTITION BY user_id
+                            ORDER BY pub_date DESC, post_id DESC
+                        ) AS position
+                        FROM {table}
+                        WHERE user_id IN ({', '.join(['%s'] * len(chunk))})
+                    ) ranked
+                    WHERE position > %s
+                )
+            """, chunk + [TIMELINE_LENGTH])
+
+
+def rebuild(user_ids=None):
+    """
+    Заново собирает ленты пользователей user_ids, а без них — все ленты,
+    например после bulk_create без сигналов. Пачка пользователей — это
+    DELETE их записей и один INSERT ... SELECT в одной транзакции.
+    """
+    on_read = refresh_fanout_on_read(refill=user_ids is not None)
+    if user_ids is None:
+        TimelineEntry.objects.all().delete()
+        user_ids = Follow.objects.order_by("user_id").values_list(
+            "user_id", flat=True).distinct().iterator()
+    else:
+        user_ids = sorted(user_ids)
+    return _rebuild(user_ids, on_read)
+
+
+def _rebuild(user_ids, on_read):
+    rebuilt = 0
+    for chunk in _chunks(user_ids):
+        with transaction.atomic():
+            TimelineEntry.objects.filter(user_id__in=chunk).delete()
+            _fill(chunk, on_read)
+        rebuilt += len(chunk)
+    return rebuilt
+
+
+def remove_author(user_id, author_id):
+    """Убирает из ленты посты автора, от которого отписались."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+class Timeline:
+    """
+    Посты ленты подписок пользователя от новых к старым по (pub_date, id).
+
+    Ключи (pub_date, id) читаются ограниченными выборками: записи
+    TimelineEntry — диапазоном по индексу, посты авторов с fan-out on
+    read — по индексу автора. Выборки сливаются по ключу, затем посты
+    загружаются одним запросом по id. Подходит как object_list для
+    Paginator: есть count() и срезы; старше или новее курсора — через
+    TimelinePaginator.
+    """
+
+    def __init__(self, user, older_than=None, newer_than=None):
+        self.user = user
+        self.older_than = older_than
+        self.newer_than = newer_than
+        self._authors = None
+
+    def _bounded(self, older_than=None, newer_than=None):
+        timeline = Timeline(self.user, older_than, newer_than)
+        timeline._authors = self._authors
+        return timeline
+
+    def on_read_authors(self):
+        """Авторы с fan-out on read, на которых подписан пользователь."""
+        if self._authors is None:
+            on_read = fanout_on_read_authors()
+            self._authors = list(Follow.objects.filter(
+                user=self.user, author__in=on_read).values_list(
+                "author_id", flat=True)) if on_read else []
+        return self._authors
+
+    def sources(self):
+        """Выборки ключей: записи ленты и посты авторов fan-out on read."""
+        sources = [(TimelineEntry.objects.filter(user=self.user), "post_id")]
+        if self.on_read_authors():
+            sources.append(
+                (Post.objects.filter(author__in=self._authors), "pk"))
+        return sources
+
+    def key_querysets(self, limit):
+        """Запросы ключей (pub_date, id) — по одному на источник."""
+        querysets = []
+        for queryset, pk in self.sources():
+            if self.older_than is not None:
+                value, last = self.older_than
+                queryset = queryset.filter(
+                    Q(pub_date__lte=value)
+                    & (Q(pub_date__lt=value) | Q(**{f"{pk}__lt": last})))
+                order = ("-pub_date", f"-{pk}")
+            elif self.newer_than is not None:
+                value, last = self.newer_than
+                queryset = queryset.filter(
+                    Q(pub_date__gte=value)
+                    & (Q(pub_date__gt=value) | Q(**{f"{pk}__gt": last})))
+                order = ("pub_date", pk)
+            else:
+                order = ("-pub_date", f"-{pk}")
+            querysets.append(queryset.order_by(*order).values_list(
+                "pub_date", pk)[:limit])
+        return querysets
+
+    def keys(self, limit):
+        """До limit ключей: от новых к старым, после newer_than — наоборот."""
+        keys = {}
+        for queryset in self.key_querysets(limit):
+            keys.update((pk, pub_date) for pub_date, pk in queryset)
+        ordered = sorted(((pub_date, pk) for pk, pub_date in keys.items()),
+                         reverse=self.newer_than is None)
+        return ordered[:limit]
+
+    def load(self, keys):
+        posts = Post.objects.for_feed().in_bulk([pk for _, pk in keys])
+        return [posts[pk] for _, pk in keys if pk in posts]
+
+    def count(self):
+        """
+        Записей ленты не больше TIMELINE_LENGTH, столько же берется и
+        постов авторов с fan-out on read: дальше лента не листается.
+        """
+        count = TimelineEntry.objects.filter(user=self.user).count()
+        if self.on_read_authors():
+            count += Post.objects.filter(author__in=self._authors).order_by(
+            )[:TIMELINE_LENGTH].count()
+        return count
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        return self.load(self.keys(stop)[start:stop])
+
+
+class TimelinePaginator(CursorPaginator):
+    """CursorPaginator для Timeline: курсоры по (pub_date, id) поста."""
+
+    def newest(self):
+        return self.object_list
+
+    def older_than(self, value, pk):
+        return self.object_list._bounded(older_than=(value, pk))
+
+    def newer_than(self, value, pk):
+        return self.object_list._bounded(newer_than=(value, pk))
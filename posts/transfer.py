@@ -0,0 +1,393 @@
+"""
+Потоковый перенос данных постов в NDJSON и обратно.
+
+Каждая строка файла — одна запись {"type": ..., ...}. Связи записаны
+естественными ключами: автор — username, группа — slug, пост комментария —
+id поста в исходной базе. Разделы идут в порядке SECTIONS, поэтому при
+загрузке все, на что ссылается запись, уже загружено раньше.
+
+Выгрузка читает таблицы пачками по первичному ключу и после каждой
+пачки сохраняет контрольную точку, с которой ее можно продолжить.
+Загрузка читает файл построчно и пишет пачками bulk_create, каждая пачка
+в своей транзакции; память занимают только пачка и словари id.
+"""
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from . import search, timeline
+from .caching import bump_feed_generation
+from .following import forget_following
+from .images import recount_images
+from .models import Comment, Follow, Group, Post, User
+from .stats import recount_stats
+
+SECTIONS = ("user", "group", "post", "comment", "follow")
+
+
+@contextmanager
+def explicit_dates(*models):
+    """Временно отключает auto_now_add, чтобы задать даты самим."""
+    fields = [field for model in models for field in model._meta.fields
+              if getattr(field, "auto_now_add", False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def rebuild_derived(user_ids=None, post_ids=None):
+    """
+    bulk_create не посылает сигналов: пересобирает счетчики, ссылки на
+    файлы картинок, ленты подписок и поисковый индекс и сбрасывает кэш лент.
+    Если заданы user_ids и post_ids, пересобирается только то, что от них
+    зависит: счетчики user_ids, ленты user_ids и подписчиков этих
+    пользователей, поисковые документы постов post_ids и их комментариев.
+    """
+    timeline_users = None
+    if user_ids is not None:
+        timeline_users = set(user_ids) | timeline.followers_of(user_ids)
+    recount_stats(user_ids)
+    recount_images()
+    timeline.rebuild(timeline_users)
+    search.rebuild_index(post_ids)
+    bump_feed_generation()
+
+
+def reserve_pks(model, count):
+    """
+    Выдает count первичных ключей model, которые не достанутся
+    одновременной вставке: в PostgreSQL — из последовательности таблицы,
+    в SQLite — сдвигом счетчика AUTOINCREMENT в sqlite_sequence (UPDATE
+    сразу берет блокировку записи). В остальных базах последняя строка
+    таблицы блокируется до конца транзакции. Вызывается в транзакции.
+    """
+    if not count:
+        return []
+    table = model._meta.db_table
+    column = model._meta.pk.column
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, %s)) "
+                "FROM generate_series(1, %s)", [table, column, count])
+            return [row[0] for row in cursor.fetchall()]
+        if connection.vendor == "sqlite":
+            cursor.execute(
+                "UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s",
+                [count, table])
+            if not cursor.rowcount:
+                cursor.execute(
+                    f"INSERT INTO sqlite_sequence (name, seq) "
+                    f"SELECT %s, COALESCE(MAX({column}), 0) + %s "
+                    f"FROM {table}", [table, count])
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s",
+                           [table])
+            last = cursor.fetchone()[0]
+            return list(range(last - count + 1, last + 1))
+    last = model.objects.select_for_update().order_by("-pk").values_list(
+        "pk", flat=True).first() or 0
+    return list(range(last + 1, last + count + 1))
+
+
+def copy_files(names, source_dir, target_dir, workers=4):
+    """Копирует файлы names из source_dir в target_dir в несколько потоков."""
+    def copy(name):
+        target = os.path.join(target_dir, name)
+        if os.path.exists(target):
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(os.path.join(source_dir, name), target)
+        return True
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(copy, names))
+
+
+# Выгрузка
+
+def _user(user):
+    return {"username": user.username, "first_name": user.first_name,
+            "last_name": user.last_name, "email": user.email,
+            "password": user.password, "is_active": user.is_active,
+            "date_joined": user.date_joined.isoformat()}
+
+
+def _group(group):
+    return {"slug": group.slug, "title": group.title,
+            "description": group.description}
+
+
+def _post(post):
+    return {"id": post.pk, "text": post.text,
+            "pub_date": post.pub_date.isoformat(),
+            "author": post.author.username,
+            "group": post.group.slug if post.group else None,
+            "image": post.image.name or None}
+
+
+def _comment(comment):
+    return {"id": comment.pk, "post": comment.post_id,
+            "author": comment.author.username, "text": comment.text,
+            "created": comment.created.isoformat()}
+
+
+def _follow(follow):
+    return {"user": follow.user.username, "author": follow.author.username}
+
+
+EXPORTS = {
+    "user": (User.objects.all(), _user),
+    "group": (Group.objects.all(), _group),
+    "post": (Post.objects.select_related("author", "group"), _post),
+    "comment": (Comment.objects.select_related("author"), _comment),
+    "follow": (Follow.objects.select_related("user", "author"), _follow),
+}
+
+
+class Checkpoint:
+    """
+    Место, до которого выгрузка точно записана: раздел, последний
+    выгруженный pk и длина файла. Пишется атомарно через os.replace.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def save(self, section, last_pk, offset):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump({"section": section, "last_pk": last_pk,
+                       "offset": offset}, file)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def export_posts(path, batch_size=1000, media_dir=None, workers=4,
+                 resume=False, progress=None):
+    """
+    Пишет данные в NDJSON-файл path. При resume=True продолжает с
+    контрольной точки path.checkpoint: файл обрезается до последней
+    сохраненной пачки, раздел дочитывается с последнего pk.
+    Если задан media_dir, картинки постов копируются туда же пачками.
+    """
+    checkpoint = Checkpoint(f"{path}.checkpoint")
+    state = checkpoint.load() if resume else None
+    mode = "r+" if state else "w"
+    counts = dict.fromkeys(SECTIONS, 0)
+
+    with open(path, mode, encoding="utf-8") as output:
+        if state:
+            output.seek(state["offset"])
+            output.truncate()
+        sections = SECTIONS[SECTIONS.index(state["section"]):] \
+            if state else SECTIONS
+        for section in sections:
+            queryset, serialize = EXPORTS[section]
+            last_pk = state["last_pk"] \
+                if state and section == state["section"] else 0
+            while True:
+                batch = list(queryset.filter(pk__gt=last_pk).order_by(
+                    "pk")[:batch_size])
+                if not batch:
+                    break
+                for obj in batch:
+                    record = {"type": section, **serialize(obj)}
+                    output.write(json.dumps(record, ensure_ascii=False))
+                    output.write("\n")
+                if media_dir and section == "post":
+                    copy_files([post.image.name for post in batch
+                                if post.image], default_storage.location,
+                               media_dir, workers)
+                output.flush()
+                os.fsync(output.fileno())
+                last_pk = batch[-1].pk
+                counts[section] += len(batch)
+                checkpoint.save(section, last_pk, output.tell())
+                if progress:
+                    progress(section, counts[section])
+    checkpoint.clear()
+    return counts
+
+
+# Загрузка
+
+class Importer:
+    """
+    Загружает записи пачками. Словари id переводят естественные ключи
+    файла в первичные ключи этой базы: username и slug — для авторов и
+    групп, id поста в исходной базе — для комментариев.
+    """
+
+    def __init__(self, batch_size=1000, media_dir=None, workers=4):
+        self.batch_size = batch_size
+        self.media_dir = media_dir
+        self.workers = workers
+        self.users = {}
+        self.groups = {}
+        self.posts = {}
+        # чьи счетчики и ленты пересобрать после загрузки
+        self.touched_users = set()
+        self.counts = dict.fromkeys(SECTIONS, 0)
+        self.skipped = 0
+        self.images = 0
+        self.with_images = 0
+
+    def _resolve(self, model, field, mapping, keys):
+        """Дозагружает в mapping id объектов, которых там еще нет."""
+        missing = list({key for key in keys if key and key not in mapping})
+        # кусками: SQLite ограничивает число параметров запроса
+        for start in range(0, len(missing), 500):
+            mapping.update(model.objects.filter(
+                **{f"{field}__in": missing[start:start + 500]}
+            ).values_list(field, "pk"))
+
+    def load_users(self, records):
+        User.objects.bulk_create([User(
+            username=r["username"], first_name=r.get("first_name", ""),
+            last_name=r.get("last_name", ""), email=r.get("email", ""),
+            password=r.get("password", ""),
+            is_active=r.get("is_active", True),
+            date_joined=parse_datetime(r["date_joined"]),
+        ) for r in records], ignore_conflicts=True)
+        self._resolve(User, "username", self.users,
+                      [r["username"] for r in records])
+        return len(records)
+
+    def load_groups(self, records):
+        Group.objects.bulk_create([Group(
+            slug=r["slug"], title=r["title"],
+            description=r.get("description", ""),
+        ) for r in records], ignore_conflicts=True)
+        self._resolve(Group, "slug", self.groups,
+                      [r["slug"] for r in records])
+        return len(records)
+
+    def load_posts(self, records):
+        """
+        Первичные ключи новых постов резервируются заранее (reserve_pks),
+        а не выдаются базой при вставке: bulk_create на SQLite их не
+        возвращает, а они нужны для комментариев.
+        """
+        self._resolve(User, "username", self.users,
+                      [r["author"] for r in records])
+        self._resolve(Group, "slug", self.groups,
+                      [r["group"] for r in records])
+        new = []
+        for r in records:
+            author_id = self.users.get(r["author"])
+            if author_id is None or r["id"] in self.posts:
+                self.skipped += 1
+                continue
+            # повтор id внутри пачки тоже пропускается
+            self.posts[r["id"]] = None
+            new.append((r, author_id))
+        posts = []
+        for (r, author_id), pk in zip(new, reserve_pks(Post, len(new))):
+            self.posts[r["id"]] = pk
+            self.touched_users.add(author_id)
+            posts.append(Post(
+                pk=pk, text=r["text"],
+                pub_date=parse_datetime(r["pub_date"]), author_id=author_id,
+                group_id=self.groups.get(r.get("group")),
+                image=r.get("image") or "",
+            ))
+        Post.objects.bulk_create(posts)
+        images = [post.image.name for post in posts if post.image]
+        self.with_images += len(images)
+        if self.media_dir and images:
+            self.images += copy_files(images, self.media_dir,
+                                      default_storage.location, self.workers)
+        return len(posts)
+
+    def load_comments(self, records):
+        self._resolve(User, "username", self.users,
+                      [r["author"] for r in records])
+        comments = []
+        for r in records:
+            post_id = self.posts.get(r["post"])
+            author_id = self.users.get(r["author"])
+            if post_id is None or author_id is None:
+                self.skipped += 1
+                continue
+            comments.append(Comment(
+                post_id=post_id, author_id=author_id, text=r["text"],
+                created=parse_datetime(r["created"]),
+            ))
+        Comment.objects.bulk_create(comments)
+        return len(comments)
+
+    def load_follows(self, records):
+        self._resolve(User, "username", self.users,
+                      [r["user"] for r in records]
+                      + [r["author"] for r in records])
+        follows = []
+        for r in records:
+            user_id = self.users.get(r["user"])
+            author_id = self.users.get(r["author"])
+            if user_id is None or author_id is None or user_id == author_id:
+                self.skipped += 1
+                continue
+            follows.append(Follow(user_id=user_id, author_id=author_id))
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        forget_following(*{follow.user_id for follow in follows})
+        self.touched_users.update(
+            user_id for follow in follows
+            for user_id in (follow.user_id, follow.author_id))
+        return len(follows)
+
+    def flush(self, section, records):
+        if not records:
+            return
+        with transaction.atomic():
+            loaded = getattr(self, f"load_{section}s")(records)
+        self.counts[section] += loaded
+
+    def run(self, lines, progress=None):
+        section, records = None, []
+        with explicit_dates(Post, Comment):
+            for number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                kind = record.pop("type", None)
+                if kind not in SECTIONS:
+                    raise ValueError(
+                        f"Строка {number}: неизвестный тип записи {kind!r}")
+                if kind != section or len(records) >= self.batch_size:
+                    self.flush(section, records)
+                    if progress and section:
+                        progress(section, self.counts[section])
+                    section, records = kind, []
+                records.append(record)
+            self.flush(section, records)
+        rebuild_derived(self.touched_users, self.posts.values())
+        return self.counts
+
+
+def import_posts(path, batch_size=1000, media_dir=None, workers=4,
+                 progress=None):
+    """Загружает NDJSON-файл path. Возвращает импортер с итогами."""
+    importer = Importer(batch_size, media_dir, workers)
+    with open(path, encoding="utf-8") as lines:
+        importer.run(lines, progress)
+    return importer
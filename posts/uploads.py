@@ -0,0 +1,170 @@
+"""
+Загруженные картинки постов обрабатываются вне запроса.
+
+View только перекладывает файл во временный каталог STAGING_DIR и
+сохраняет пост со старой картинкой. После коммита пул процессов
+проверяет файл, поворачивает картинку по EXIF и выбрасывает метаданные,
+уменьшает до UPLOAD_MAX_SIZE и пересохраняет. Post.image меняется только
+на готовый файл в image_storage, после чего готовятся миниатюры, и
+только если за это время к посту не загрузили другую картинку.
+"""
+import logging
+import os
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import images, thumbnails
+from .storage import image_storage
+
+logger = logging.getLogger(__name__)
+
+STAGING_DIR = "posts/staging"
+
+
+def stage_upload(form):
+    """
+    Забирает из формы новую картинку: кладет ее в STAGING_DIR и
+    возвращает экземпляру формы прежнее значение. Возвращает пару
+    (имя в хранилище, исходное имя файла) или None. Если картинку в форме
+    убрали, загрузка, которая еще обрабатывается, посту больше не нужна.
+    """
+    upload = form.cleaned_data.get("image")
+    if not isinstance(upload, UploadedFile):
+        if "image" in form.changed_data:
+            form.instance.image_upload = ""
+        return None
+    extension = os.path.splitext(upload.name)[1].lower()
+    staged = default_storage.save(
+        f"{STAGING_DIR}/{uuid4().hex}{extension}", upload)
+    form.instance.image = form.initial.get("image") or ""
+    form.instance.image_upload = staged
+    return staged, upload.name
+
+
+def _has_alpha(image):
+    return image.mode in ("RGBA", "LA") or (
+        image.mode == "P" and "transparency" in image.info)
+
+
+def process_image(source_path, target_path, max_size, quality=85):
+    """
+    Пересохраняет картинку source_path в target_path без метаданных.
+    Картинки с прозрачностью остаются PNG, остальные становятся JPEG.
+    Выполняется в дочернем процессе, поэтому работает только с файлами.
+    Возвращает расширение готового файла.
+    """
+    with Image.open(source_path) as image:
+        # полное декодирование: обрезанный или подмененный файл падает здесь
+        image.load()
+        image = ImageOps.exif_transpose(image)
+        alpha = _has_alpha(image)
+        image = image.convert("RGBA" if alpha else "RGB")
+        image.thumbnail(thumbnails.parse_size(max_size), Image.LANCZOS)
+        image.info = {}
+        if alpha:
+            image.save(target_path, "PNG", optimize=True)
+            return ".png"
+        image.save(target_path, "JPEG", quality=quality, optimize=True,
+                   progressive=True)
+        return ".jpg"
+
+
+def _output_path(staged):
+    return default_storage.path(f"{staged}.out")
+
+
+def store_image(post_id, staged, original_name, extension):
+    """Переносит готовый файл в posts/ и записывает его посту."""
+    from .caching import bump_feed_generation, post_scopes, touch_scopes
+    from .models import Post
+
+    base = os.path.splitext(os.path.basename(original_name))[0]
+    with open(_output_path(staged), "rb") as output:
+        content = File(output)
+        name = image_storage.content_name(f"posts/{base}{extension}",
+                                          content)
+        # ссылка берется до записи: файл без ссылок, который сейчас
+        # удаляется, будет записан заново, а не потерян
+        images.acquire(name)
+        image_storage.save_content(name, content)
+    posts = Post.objects.filter(pk=post_id)
+    with transaction.atomic():
+        previous = posts.filter(image_upload=staged).select_for_update(
+        ).values_list("image", flat=True).first()
+        updated = posts.filter(image_upload=staged).update(
+            image=name, image_upload="", thumbnail="",
+            updated=timezone.now())
+    if not updated:
+        # пост удалили или к нему уже загрузили другую картинку
+        images.release(name)
+        return None
+    images.release(previous)
+    bump_feed_generation()
+    for author_id, group_id in posts.values_list("author_id", "group_id"):
+        touch_scopes(*post_scopes(post_id, author_id, group_id))
+    thumbnails.schedule(Post(pk=post_id, image=name))
+    return name
+
+
+def _clean_staging(staged):
+    for path in (default_storage.path(staged), _output_path(staged)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _on_done(post_id, staged, original_name):
+    def callback(future):
+        try:
+            store_image(post_id, staged, original_name, future.result())
+        except Exception:
+            logger.exception("Не удалось обработать картинку %s",
+                             original_name)
+        finally:
+            _clean_staging(staged)
+            connection.close()
+    return callback
+
+
+def process(post_id, staged, original_name):
+    """Обрабатывает загрузку сразу, в текущем процессе."""
+    try:
+        extension = process_image(
+            default_storage.path(staged), _output_path(staged),
+            settings.UPLOAD_MAX_SIZE, settings.UPLOAD_QUALITY)
+        return store_image(post_id, staged, original_name, extension)
+    finally:
+        _clean_staging(staged)
+
+
+def schedule(post, upload):
+    """
+    Ставит загрузку upload из stage_upload() в очередь пула миниатюр
+    после коммита транзакции. При THUMBNAIL_WORKERS = 0 она
+    обрабатывается синхронно.
+    """
+    post_id = post.pk
+    staged, original_name = upload
+
+    def submit():
+        try:
+            if not settings.THUMBNAIL_WORKERS:
+                process(post_id, staged, original_name)
+                return
+            future = thumbnails.get_executor().submit(
+                process_image, default_storage.path(staged),
+                _output_path(staged), settings.UPLOAD_MAX_SIZE,
+                settings.UPLOAD_QUALITY)
+        except Exception:
+            logger.exception("Не удалось обработать картинку %s",
+                             original_name)
+            return
+        future.add_done_callback(_on_done(post_id, staged, original_name))
+
+    transaction.on_commit(submit)
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import feeds, views
 
 app_name = "posts"
 
@@ -13,9 +13,20 @@ urlpatterns = [
     path("404/", views.page_not_found, name="404"),
     path("500/", views.server_error, name="500"),
     path("group/<slug:slug>/", views.group_posts, name="group_posts"),
+    path("search/", views.search, name="search"),
+    path("feeds/rss/", feeds.index_rss, name="index_rss"),
+    path("feeds/atom/", feeds.index_atom, name="index_atom"),
+    path("feeds/group/<slug:slug>/rss/", feeds.group_rss, name="group_rss"),
+    path("feeds/group/<slug:slug>/atom/", feeds.group_atom,
+         name="group_atom"),
+    path("feeds/<str:username>/rss/", feeds.author_rss, name="author_rss"),
+    path("feeds/<str:username>/atom/", feeds.author_atom,
+         name="author_atom"),
     path("new/", views.new_post, name="new_post"),
     path("<str:username>/", views.profile, name="profile"),
     path("<str:username>/<int:post_id>/", views.post_view, name="post"),
+    path("<str:username>/<int:post_id>/comments/", views.post_comments,
+         name="post_comments"),
     path("<str:username>/<int:post_id>/edit/", views.post_edit,
          name="post_edit"),
     path("<username>/<int:post_id>/comment/", views.add_comment,
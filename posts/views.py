@@ -1,42 +1,188 @@
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.paginator import Paginator
+from django.db.models import Max, OuterRef, Subquery
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
-from yatube.settings import PAG_CONST
+from yatube.settings import COMMENTS_PAG_CONST, FEED_CACHE_TIMEOUT, PAG_CONST
 
+from . import recommendations, uploads
+from .caching import conditional_page, feed_cache_key
+from .following import viewer_scopes
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post
+from .models import Comment, Follow, Group, Post
+from .paginators import CursorPaginator, add_cursors, detach, page_position
+from .search import search_posts
+from .timeline import Timeline, TimelinePaginator
 
 
+def paginate(request, queryset):
+    """
+    Постраничная разбивка ленты.
+
+    С параметрами ?after=/?before= страница выбирается по курсору
+    (pub_date, id), иначе — по номеру ?page=. Ссылки на соседние страницы
+    в обоих случаях строятся из курсоров.
+    """
+    queryset = queryset.order_by("-pub_date", "-id")
+    kind, value = page_position(request)
+    if kind != "page":
+        paginator = CursorPaginator(queryset.for_feed(), PAG_CONST)
+        return paginator, paginator.page(**{kind: value})
+    paginator = Paginator(queryset, PAG_CONST)
+    page = paginator.get_page(value)
+    # COUNT(*) считается без аннотаций, страница выбирается уже с ними
+    if paginator.count:
+        page.object_list = queryset.for_feed()[
+            page.start_index() - 1:page.end_index()]
+    return paginator, add_cursors(page)
+
+
+def paginate_timeline(request, timeline):
+    """paginate() для ленты подписок: посты читаются через Timeline."""
+    kind, value = page_position(request)
+    if kind != "page":
+        paginator = TimelinePaginator(timeline, PAG_CONST)
+        return paginator, paginator.page(**{kind: value})
+    paginator = Paginator(timeline, PAG_CONST)
+    return paginator, add_cursors(paginator.get_page(value))
+
+
+def cached_feed(request, feed, paginate_feed, *parts):
+    """
+    Пара (paginator, page) ленты feed из кэша. Только при промахе
+    paginate_feed() выбирает посты, и страница кладется в кэш до
+    следующей записи в ленту. Номер за последней страницей дает
+    последнюю страницу; такие адреса не кэшируются, чтобы не хранить
+    копию на каждый номер.
+    """
+    position = page_position(request)
+    key = feed_cache_key(feed, position, *parts)
+    cached = cache.get(key)
+    if cached is None:
+        paginator, page = cached = detach(*paginate_feed())
+        kind, value = position
+        if kind != "page" or page.number == value:
+            cache.set(key, cached, FEED_CACHE_TIMEOUT)
+    return cached
+
+
+def _last_post_date(**lookup):
+    return Subquery(Post.objects.filter(**lookup).order_by(
+        "-pub_date").values("pub_date")[:1])
+
+
+def index_posts_validators(request):
+    """Только посты общей ленты, без частей страницы для зрителя."""
+    last = Post.objects.aggregate(last=Max("pub_date"))["last"]
+    return ["index"], last
+
+
+def group_posts_validators(request, slug):
+    group = Group.objects.filter(slug=slug).annotate(
+        last=_last_post_date(group=OuterRef("pk"))).values_list(
+        "pk", "last").first()
+    if group is None:
+        return None
+    return [f"group:{group[0]}"], group[1]
+
+
+def profile_posts_validators(request, username):
+    author = User.objects.filter(username=username).annotate(
+        last=_last_post_date(author=OuterRef("pk"))).values_list(
+        "pk", "last").first()
+    if author is None:
+        return None
+    return [f"profile:{author[0]}"], author[1]
+
+
+def _with_viewer(found, request, *scopes):
+    """Добавляет к валидаторам постов кнопки подписки зрителя и scopes."""
+    if found is None:
+        return None
+    posts_scopes, last = found
+    return [*posts_scopes, *viewer_scopes(request), *scopes], last
+
+
+def index_validators(request):
+    return _with_viewer(index_posts_validators(request), request)
+
+
+def group_validators(request, slug):
+    return _with_viewer(group_posts_validators(request, slug), request)
+
+
+def profile_validators(request, username):
+    scopes = []
+    if request.user.is_authenticated:
+        scopes.append(recommendations.recommendations_scope(request.user.pk))
+    return _with_viewer(profile_posts_validators(request, username),
+                        request, *scopes)
+
+
+def post_validators(request, username, post_id):
+    """Страница поста зависит и от счетчиков автора в боковой колонке."""
+    last_comment = Comment.objects.filter(post=OuterRef("pk")).order_by(
+        "-created").values("created")[:1]
+    post = Post.objects.filter(
+        id=post_id, author__username=username).annotate(
+        last_comment=Subquery(last_comment)).values_list(
+        "author_id", "pub_date", "last_comment").first()
+    if post is None:
+        return None
+    author_id, pub_date, last_comment = post
+    return ([f"post:{post_id}", f"profile:{author_id}"],
+            max(pub_date, last_comment or pub_date))
+
+
+@conditional_page(index_validators)
 def index(request):
-    post_objects = Post.objects.all()
-    paginator = Paginator(post_objects, PAG_CONST)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
-    return render(request, "index.html", {"page": page,
-                                          "paginator": paginator})
+    paginator, page = cached_feed(
+        request, "index", lambda: paginate(request, Post.objects.all()))
+    return render(request, "index.html", {
+        "page": page,
+        "paginator": paginator,
+    })
 
 
+@conditional_page(group_validators)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     post_objects = group.posts.all()
-    paginator = Paginator(post_objects, PAG_CONST)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    paginator, page = paginate(request, post_objects)
     context = {"group": group,
                "page": page,
                "paginator": paginator}
     return render(request, "group.html", context)
 
 
+def search(request):
+    """Поиск по постам и комментариям, результаты по релевантности."""
+    query = request.GET.get("q", "").strip()
+    paginator = page = None
+    if query:
+        paginator = Paginator(search_posts(query), PAG_CONST)
+        page = paginator.get_page(request.GET.get("page"))
+    context = {
+        "query": query,
+        "page": page,
+        "paginator": paginator,
+    }
+    return render(request, "search.html", context)
+
+
 @login_required
 def new_post(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if request.method == "POST" and form.is_valid():
         new_form = form.save(commit=False)
         new_form.author = request.user
+        upload = uploads.stage_upload(form)
         form.save()
+        if upload:
+            uploads.schedule(new_form, upload)
         return redirect("posts:index")
     return render(request, "new_post.html", {"form": form})
 
@@ -54,38 +200,84 @@ def add_comment(request, username, post_id):
     return redirect("posts:post", username=username, post_id=post_id)
 
 
+@conditional_page(profile_validators)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(User.objects.select_related("stats"),
+                               username=username)
     author_posts = author.posts.all()
-    paginator = Paginator(author_posts, PAG_CONST)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
-    following = request.user.is_authenticated and Follow.objects.filter(
-        user=request.user, author=author).exists()
+    paginator, page = paginate(request, author_posts)
 
     context = {
         "author": author,
         "page": page,
         "paginator": paginator,
-        "following": following,
     }
+    if request.user.is_authenticated:
+        context["recommendations"] = recommendations.recommended_authors(
+            request.user)
     return render(request, "profile.html", context)
 
 
+def comments_page(request, post_id):
+    """
+    Пачка комментариев поста от новых к старым после курсора ?after=
+    (created, id). Авторы выбираются тем же запросом.
+    """
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        "author")
+    paginator = CursorPaginator(comments, COMMENTS_PAG_CONST, key="created")
+    return paginator, paginator.get_page(after=request.GET.get("after"))
+
+
+@conditional_page(post_validators)
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, id=post_id,
-                             author__username=username)
+    """
+    Пост с автором, его счетчиками и группой — один запрос,
+    первая пачка комментариев — второй.
+    """
+    post = get_object_or_404(
+        Post.objects.for_feed().select_related("author__stats"),
+        id=post_id, author__username=username)
     form = CommentForm()
-    comments = post.comments.all()
+    paginator, comments = comments_page(request, post.pk)
     context = {
         "form": form,
         "post": post,
-        "comments": comments,
+        # все комментарии поста, не вычисляются; выводится comments_page
+        "comments": paginator.object_list,
+        "comments_page": comments,
         "author": post.author,
     }
     return render(request, "post.html", context)
 
 
+def post_comments(request, username, post_id):
+    """
+    Следующая пачка комментариев для подгрузки на странице поста:
+    HTML-фрагмент или JSON при ?format=json.
+    """
+    if not Post.objects.filter(id=post_id,
+                               author__username=username).exists():
+        raise Http404
+    _, comments = comments_page(request, post_id)
+    if request.GET.get("format") == "json":
+        return JsonResponse({
+            "comments": [{
+                "id": comment.pk,
+                "author": comment.author.username,
+                "text": comment.text,
+                "created": comment.created.isoformat(),
+            } for comment in comments],
+            "next_cursor": comments.next_cursor,
+        })
+    context = {
+        "comments_page": comments,
+        "username": username,
+        "post_id": post_id,
+    }
+    return render(request, "comment_list.html", context)
+
+
 @login_required
 def post_edit(request, username, post_id):
     post = get_object_or_404(Post, id=post_id,
@@ -96,7 +288,10 @@ def post_edit(request, username, post_id):
     form = PostForm(request.POST or None, files=request.FILES or None,
                     instance=post)
     if request.method == "POST" and form.is_valid():
+        upload = uploads.stage_upload(form)
         form.save()
+        if upload:
+            uploads.schedule(post, upload)
         return redirect("posts:post", username=username, post_id=post_id)
 
     context = {
@@ -119,13 +314,14 @@ def server_error(request):
 @login_required
 def follow_index(request):
     """страница с постами авторов , на которых подписан текущий юзер."""
-    post_objects = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_objects, PAG_CONST)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    paginator, page = cached_feed(
+        request, "follow",
+        lambda: paginate_timeline(request, Timeline(request.user)),
+        request.user.pk)
     context = {
         "page": page,
         "paginator": paginator,
+        "recommendations": recommendations.recommended_authors(request.user),
     }
     return render(request, "follow.html", context)
 
@@ -115,7 +115,7 @@ class TestPost:
             'Добавьте `text` для поиска модели административного сайта'
         )
 
-        assert 'pub_date' in admin_model.list_filter, (
+        assert admin_model.date_hierarchy == 'pub_date', (
             'Добавьте `pub_date` для фильтрации модели административного сайта'
         )
 
@@ -0,0 +1,44 @@
+"""
+Пользователь сессии из кэша.
+
+AuthenticationMiddleware на каждый запрос вошедшего пользователя
+загружает его из auth_user. CachedModelBackend берет готовый объект
+из кэша USER_CACHE_ALIAS; сигналы users.signals удаляют его при
+сохранении пользователя. Кэш должен быть общим для всех процессов, без
+него (USER_CACHE_ALIAS = None) пользователь читается из базы.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+USER_KEY = "users:user:{}"
+
+
+def user_cache_key(user_id):
+    return USER_KEY.format(user_id)
+
+
+def user_cache():
+    alias = settings.USER_CACHE_ALIAS
+    return caches[alias] if alias else None
+
+
+def forget_user(user_id):
+    cache = user_cache()
+    if cache is not None:
+        cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        cache = user_cache()
+        if cache is None:
+            return super().get_user(user_id)
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
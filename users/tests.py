@@ -0,0 +1,94 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+
+LOCMEM = "django.core.cache.backends.locmem.LocMemCache"
+
+
+class SessionTestMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username="sergey")
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def auth_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("about:author"))
+        return [query["sql"] for query in queries.captured_queries
+                if "django_session" in query["sql"]
+                or 'FROM "auth_user"' in query["sql"]]
+
+
+class DatabaseSessionTest(SessionTestMixin, TestCase):
+    def test_session_and_user_from_database(self):
+        """
+        Без общего кэша сессия и пользователь читаются из базы: кэш
+        процесса не знал бы о выходе или смене пароля в другом процессе.
+        """
+        self.auth_queries()
+        self.assertEqual(len(self.auth_queries()), 2)
+
+
+# общий кэш в тестах подменяется еще одним LocMem
+@override_settings(
+    CACHES={"default": {"BACKEND": LOCMEM},
+            "shared": {"BACKEND": LOCMEM, "LOCATION": "shared"}},
+    SESSION_ENGINE="django.contrib.sessions.backends.cached_db",
+    SESSION_CACHE_ALIAS="shared", USER_CACHE_ALIAS="shared")
+class CachedSessionTest(SessionTestMixin, TestCase):
+    def test_session_and_user_from_cache(self):
+        """Повторный запрос не читает ни сессию, ни пользователя из базы."""
+        self.auth_queries()
+        self.assertEqual(self.auth_queries(), [])
+
+    def test_user_save_invalidates_cache(self):
+        """Сохраненный пользователь читается из базы заново."""
+        self.auth_queries()
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = "Сергей"
+        user.save()
+        self.assertEqual(len(self.auth_queries()), 1)
+        response = self.client.get(reverse("about:author"))
+        self.assertEqual(response.wsgi_request.user.first_name, "Сергей")
+
+    def test_deactivated_user_logged_out(self):
+        """Выключенный пользователь сразу перестает быть вошедшим."""
+        self.auth_queries()
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save()
+        response = self.client.get(reverse("about:author"))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+
+class PurgeSessionsCommandTest(TestCase):
+    def test_purge_expired_sessions(self):
+        """purge_sessions удаляет пачками только истекшие сессии."""
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key=f"old{i}", session_data="",
+                                   expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key="fresh", session_data="",
+                               expire_date=now + timedelta(days=1))
+        out = StringIO()
+        call_command("purge_sessions", batch_size=2, stdout=out)
+        self.assertIn("Удалено истекших сессий: 5", out.getvalue())
+        self.assertEqual(list(Session.objects.values_list(
+            "session_key", flat=True)), ["fresh"])
@@ -1,8 +1,31 @@
 import datetime as dt
 
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from posts.following import following_set
+
 
 def year(request):
     """
     Добавляет переменную с текущим годом.
     """
     return {"year": dt.datetime.now().year}
+
+
+def cache_timeouts(request):
+    """
+    Время жизни кэшированных фрагментов шаблонов.
+    """
+    return {
+        "post_card_cache_timeout": settings.POST_CARD_CACHE_TIMEOUT,
+        "author_card_cache_timeout": settings.AUTHOR_CARD_CACHE_TIMEOUT,
+    }
+
+
+def following(request):
+    """
+    Авторы, на которых подписан зритель: {% if author.pk in following %}.
+    Загружаются, только если шаблон к ним обратился.
+    """
+    return {"following": SimpleLazyObject(lambda: following_set(request))}
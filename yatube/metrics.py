@@ -0,0 +1,185 @@
+"""
+Метрики запросов в формате Prometheus.
+
+MetricsMiddleware по имени URL считает время ответа (гистограмма),
+число и время запросов к базе и время рендеринга шаблонов, а у
+настроенных в CACHES бэкендов — попадания и промахи get(). Все значения
+живут в памяти процесса и отдаются на /metrics/ по METRICS_TOKEN.
+"""
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import Http404, HttpResponse
+from django.template.backends import django as django_backend
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+
+
+class Registry:
+    """Счетчики и гистограммы процесса. Обновляются под одной блокировкой."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.buckets = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+        self.latency_sum = defaultdict(float)
+        self.requests = defaultdict(int)
+        self.db_queries = defaultdict(int)
+        self.db_seconds = defaultdict(float)
+        self.render_seconds = defaultdict(float)
+        self.cache = defaultdict(int)
+
+    def observe_request(self, view, seconds, queries, db_seconds,
+                        render_seconds):
+        with self.lock:
+            self.buckets[view][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.latency_sum[view] += seconds
+            self.requests[view] += 1
+            self.db_queries[view] += queries
+            self.db_seconds[view] += db_seconds
+            self.render_seconds[view] += render_seconds
+
+    def observe_cache(self, result, count=1):
+        with self.lock:
+            self.cache[result] += count
+
+    def render(self):
+        """Текстовый формат Prometheus (exposition format 0.0.4)."""
+        lines = []
+        with self.lock:
+            lines += [
+                "# HELP yatube_request_duration_seconds Время ответа.",
+                "# TYPE yatube_request_duration_seconds histogram",
+            ]
+            for view, counts in sorted(self.buckets.items()):
+                total = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                    total += count
+                    lines.append(
+                        f'yatube_request_duration_seconds_bucket'
+                        f'{{view="{view}",le="{bound}"}} {total}')
+                lines.append(f'yatube_request_duration_seconds_sum'
+                             f'{{view="{view}"}} {self.latency_sum[view]}')
+                lines.append(f'yatube_request_duration_seconds_count'
+                             f'{{view="{view}"}} {self.requests[view]}')
+            for name, help_text, values in (
+                ("yatube_db_queries_total", "Запросы к базе.",
+                 self.db_queries),
+                ("yatube_db_query_seconds_total", "Время запросов к базе.",
+                 self.db_seconds),
+                ("yatube_template_render_seconds_total",
+                 "Время рендеринга шаблонов.", self.render_seconds),
+            ):
+                lines += [f"# HELP {name} {help_text}",
+                          f"# TYPE {name} counter"]
+                lines += [f'{name}{{view="{view}"}} {value}'
+                          for view, value in sorted(values.items())]
+            lines += [
+                "# HELP yatube_cache_requests_total Обращения к кэшу.",
+                "# TYPE yatube_cache_requests_total counter",
+            ]
+            lines += [f'yatube_cache_requests_total{{result="{result}"}} '
+                      f'{value}' for result, value in sorted(
+                          self.cache.items())]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+_state = threading.local()
+
+
+def _render_timer(render):
+    def timed_render(self, context=None, request=None):
+        if getattr(_state, "render_seconds", None) is None:
+            return render(self, context, request)
+        start = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            _state.render_seconds += time.perf_counter() - start
+    return timed_render
+
+
+def _cache_counter(get):
+    def counted_get(self, key, default=None, version=None, **kwargs):
+        sentinel = object()
+        value = get(self, key, sentinel, version, **kwargs)
+        if value is sentinel:
+            registry.observe_cache("miss")
+            return default
+        registry.observe_cache("hit")
+        return value
+    return counted_get
+
+
+class MetricsMiddleware:
+    """Снимает метрики запроса; при METRICS_ENABLED = False выключен."""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        template = django_backend.Template
+        if not getattr(template.render, "metrics_timed", False):
+            template.render = _render_timer(template.render)
+            template.render.metrics_timed = True
+        # бэкенд кэша любой: считается get() его класса
+        for alias in settings.CACHES:
+            backend = type(caches[alias])
+            if not getattr(backend.get, "metrics_counted", False):
+                backend.get = _cache_counter(backend.get)
+                backend.get.metrics_counted = True
+
+    def count_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            _state.queries += 1
+            _state.db_seconds += time.perf_counter() - start
+
+    def __call__(self, request):
+        _state.queries = 0
+        _state.db_seconds = 0.0
+        _state.render_seconds = 0.0
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(self.count_query):
+                response = self.get_response(request)
+        finally:
+            match = request.resolver_match
+            view = match.view_name if match else "<unresolved>"
+            registry.observe_request(
+                view, time.perf_counter() - start, _state.queries,
+                _state.db_seconds, _state.render_seconds)
+            _state.render_seconds = None
+        return response
+
+
+def _allowed(request):
+    token = settings.METRICS_TOKEN
+    if token and hmac.compare_digest(
+            request.META.get("HTTP_AUTHORIZATION", ""), f"Bearer {token}"):
+        return True
+    return request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS
+
+
+def metrics(request):
+    """
+    Метрики процесса для Prometheus. Доступны с заголовком
+    "Authorization: Bearer <METRICS_TOKEN>" или с METRICS_ALLOWED_IPS.
+    """
+    if not _allowed(request):
+        raise Http404
+    return HttpResponse(registry.render(),
+                        content_type="text/plain; version=0.0.4")
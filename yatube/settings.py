@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "yatube.metrics.MetricsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,6 +66,15 @@ INTERNAL_IPS = [
     "127.0.0.1",
 ]
 
+# Метрики запросов в формате Prometheus на /metrics/
+METRICS_ENABLED = True
+# Prometheus передает токен в "Authorization: Bearer ..."; без токена
+# /metrics/ закрыты. METRICS_ALLOWED_IPS — адреса, которым токен не нужен;
+# за прокси на той же машине REMOTE_ADDR у всех 127.0.0.1, так что
+# адреса туда добавляются, только если прокси нет
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = []
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
@@ -79,7 +89,9 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
-                'yatube.context_processors.year'
+                'yatube.context_processors.year',
+                'yatube.context_processors.cache_timeouts',
+                'yatube.context_processors.following',
             ],
         },
     },
@@ -98,6 +110,26 @@ DATABASES = {
     }
 }
 
+# Профиль для нагрузки: YATUBE_SQLITE_TUNED=1 включает WAL и остальные
+# PRAGMA из yatube/sqlite/base.py и держит соединения открытыми между
+# запросами вместо подключения к базе на каждый запрос
+if os.environ.get('YATUBE_SQLITE_TUNED') == '1':
+    DATABASES['default'].update({
+        'ENGINE': 'yatube.sqlite',
+        'CONN_MAX_AGE': 600,
+    })
+
+
+# Пользователь сессии берется из кэша USER_CACHE_ALIAS (users.backends),
+# если он задан ниже вместе с общим кэшем. ModelBackend оставлен для
+# сессий, созданных до включения кэша
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+USER_CACHE_TIMEOUT = 60 * 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -154,4 +186,81 @@ CACHES = {
     }
 }
 
+# Кэш, общий для всех процессов: адрес memcached в YATUBE_SHARED_CACHE.
+# Только с ним сессии читаются из кэша (и пишутся сразу в кэш и в базу),
+# а пользователь сессии — из кэша USER_CACHE_ALIAS: в LocMem у каждого
+# процесса свой кэш, и выход, смена пароля или выключение пользователя
+# в одном процессе не были бы видны в других. Без общего кэша сессии и
+# пользователи читаются из базы
+SHARED_CACHE_LOCATION = os.environ.get('YATUBE_SHARED_CACHE', '')
+USER_CACHE_ALIAS = None
+# Время изменения страниц для ETag (posts.caching). Правку в другом
+# процессе кэш процесса не видит, поэтому там метка живет недолго: другой
+# процесс отдает 304 со старой страницей не дольше SCOPE_CACHE_TIMEOUT
+SCOPE_CACHE_ALIAS = 'default'
+SCOPE_CACHE_TIMEOUT = 60
+if SHARED_CACHE_LOCATION:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': SHARED_CACHE_LOCATION,
+    }
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    SESSION_CACHE_ALIAS = USER_CACHE_ALIAS = SCOPE_CACHE_ALIAS = 'shared'
+    SCOPE_CACHE_TIMEOUT = 60 * 60 * 24
+
 PAG_CONST = 10
+
+# Комментарии на странице поста подгружаются пачками по курсору
+COMMENTS_PAG_CONST = 20
+
+# Страницы ленты сбрасываются при записи, поэтому их можно хранить долго
+FEED_CACHE_TIMEOUT = 60 * 15
+
+# Карточка поста в кэше; ключ меняется при правке поста, поэтому
+# хранить ее можно долго
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Боковая карточка автора с числом записей и подписчиков; сбрасывается
+# при подписке, отписке и новом посте, а после массового пересчета
+# счетчиков отстает не дольше этого времени
+AUTHOR_CARD_CACHE_TIMEOUT = 60 * 60
+
+# Число записей в RSS/Atom
+SYNDICATION_ITEMS = 20
+
+# Длина материализованной ленты подписок и число подписчиков автора,
+# после которого его посты не раскладываются по лентам, а читаются на лету
+TIMELINE_LENGTH = 1000
+TIMELINE_FANOUT_LIMIT = 10000
+# список таких авторов пересчитывается не реже, чем раз в столько секунд
+TIMELINE_FANOUT_ON_READ_TIMEOUT = 10 * 60
+
+# Миниатюры картинок постов готовятся заранее в пуле процессов;
+# 0 процессов — синхронно. Карточка ленты — размер "card"
+POST_THUMBNAIL_SIZES = {
+    "card": "960x339",
+}
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_QUALITY = 85
+
+# Загруженные картинки пересохраняются в том же пуле: без EXIF,
+# не больше UPLOAD_MAX_SIZE по каждой стороне
+UPLOAD_MAX_SIZE = "2048x2048"
+UPLOAD_QUALITY = 85
+
+# Массовая модерация идет пачками по MODERATION_BATCH_SIZE id (каждая —
+# своя транзакция) в фоновых потоках; 0 потоков — синхронно
+MODERATION_BATCH_SIZE = 500
+MODERATION_WORKERS = 1
+# выполняющаяся задача, у которой столько секунд не было новой пачки,
+# считается брошенной (процесс перезапустили) и может быть запущена снова
+MODERATION_STALE_AFTER = 10 * 60
+
+# Рекомендации авторов пересчитываются командой recommend_authors;
+# хранится RECOMMENDATIONS_PER_USER на пользователя, показывается меньше
+RECOMMENDATIONS_PER_USER = 20
+RECOMMENDATIONS_SHOWN = 5
+
+# Множество авторов зрителя в кэше. Ключ удаляется при подписке и
+# отписке только в кэше своего процесса, поэтому живет недолго
+FOLLOWING_CACHE_TIMEOUT = 60
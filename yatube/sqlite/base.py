@@ -0,0 +1,28 @@
+"""
+SQLite с настройками для одновременной работы многих запросов.
+
+Тот же бэкенд django.db.backends.sqlite3, только каждое новое соединение
+сразу выполняет PRAGMA из DATABASES[...]["PRAGMAS"]: журнал WAL, чтобы
+запись не блокировала чтение, synchronous=NORMAL, mmap, увеличенный кэш
+страниц и ожидание занятой базы вместо немедленной ошибки.
+"""
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    # отрицательное значение — размер в КиБ, а не в страницах
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = self.settings_dict.get("PRAGMAS", DEFAULT_PRAGMAS)
+        for name, value in pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
@@ -19,14 +19,18 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from yatube.metrics import metrics
+
 handler404 = "posts.views.page_not_found"  # noqa
 handler500 = "posts.views.server_error"  # noqa
 
 urlpatterns = [
     path("about/", include("about.urls", namespace="about")),
     path("admin/", admin.site.urls),
+    path("api/v1/", include("posts.api_urls", namespace="api")),
     path("auth/", include("users.urls")),
     path("auth/", include("django.contrib.auth.urls")),
+    path("metrics/", metrics, name="metrics"),
     path("", include("posts.urls")),
 ]
 